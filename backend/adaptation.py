@@ -0,0 +1,65 @@
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+import re
+
+# Drill description adaptation
+#
+# Wording changes for an age group are a rule table of phrase rewrites.
+# Every age band is compiled at import into one Adaptation that applies
+# all of its rewrites in a single regex pass, so results can be
+# precomputed per (drill, adaptation) and looked up at request time.
+
+AGE_BAND_YOUNG = "young"
+AGE_BAND_OLDER = "older"
+
+AGE_RULES: Dict[Optional[str], Dict[str, str]] = {
+    None: {},
+    AGE_BAND_YOUNG: {"Focus on": "Simple focus on", "Practice": "Fun practice with"},
+    AGE_BAND_OLDER: {"Practice": "Advanced practice with", "Focus on": "Intensive focus on"},
+}
+
+
+def age_band(age_group: Optional[str]) -> Optional[str]:
+    """Map a free-form age group (e.g. "U10", "u16 girls") to an age band
+
+    The younger band wins when an age group matches both.
+    """
+    if not age_group:
+        return None
+    age = age_group.lower()
+    if "u8" in age or "u10" in age:
+        return AGE_BAND_YOUNG
+    if "u16" in age or "u18" in age:
+        return AGE_BAND_OLDER
+    return None
+
+
+class Adaptation:
+    """Phrase rewrites compiled into a single alternation"""
+
+    def __init__(self, rules: Dict[str, str]):
+        self.rules = dict(rules)
+        # Longest phrases first so overlapping phrases match the longer one
+        phrases = sorted(self.rules, key=len, reverse=True)
+        self._pattern = re.compile("|".join(map(re.escape, phrases))) if phrases else None
+
+    def apply(self, text: str) -> str:
+        if self._pattern is None:
+            return text
+        rules = self.rules
+        return self._pattern.sub(lambda match: rules[match.group(0)], text)
+
+    def __repr__(self) -> str:
+        return f"Adaptation({self.rules!r})"
+
+
+_ADAPTATIONS: Dict[Optional[str], Adaptation] = {band: Adaptation(rules) for band, rules in AGE_RULES.items()}
+
+# Every Adaptation, for precomputing adapted descriptions
+ADAPTATIONS: Tuple[Adaptation, ...] = tuple(_ADAPTATIONS.values())
+NO_ADAPTATION = _ADAPTATIONS[None]
+
+
+@lru_cache(maxsize=1024)
+def adaptation_for(age_group: Optional[str]) -> Adaptation:
+    return _ADAPTATIONS[age_band(age_group)]
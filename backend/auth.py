@@ -0,0 +1,350 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from upstream import UpstreamClient, UpstreamError
+
+# Access token verification
+#
+# Bearer tokens are JWTs signed by the auth provider (Supabase). Signing
+# keys come from a shared secret (HS256) or a JWKS, read from a local file
+# or fetched from the provider and refreshed periodically, or right away
+# when a token names a key we have not seen. Verified tokens are kept in a
+# bounded LRU until they expire, so a client sending the same token on
+# every request pays for the signature check once and afterwards only for
+# a dictionary lookup.
+#
+# For local testing, point AUTH_JWKS_PATH at a JWKS file with your own
+# keys, or set SUPABASE_JWT_SECRET and sign tokens with issue_token().
+
+HMAC_ALGORITHMS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+RSA_ALGORITHMS = {"RS256", "RS384", "RS512"}
+EC_ALGORITHMS = {"ES256": "P-256", "ES384": "P-384", "ES512": "P-521"}
+
+# Shortest wait between JWKS refreshes triggered by unknown key ids
+MIN_REFRESH_INTERVAL = 30.0
+
+
+class AuthError(Exception):
+    """The token is missing, malformed, badly signed or not valid now"""
+
+
+def _b64decode(segment: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+    except ValueError as e:
+        raise AuthError("Malformed token") from e
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _b64int(segment: str) -> int:
+    return int.from_bytes(_b64decode(segment), "big")
+
+
+class SigningKey:
+    """One verification key and the algorithms it may be used with"""
+
+    def __init__(self, algorithms: set, verify: Callable[[str, bytes, bytes], bool]):
+        self.algorithms = algorithms
+        self._verify = verify
+
+    def verify(self, algorithm: str, signing_input: bytes, signature: bytes) -> bool:
+        return algorithm in self.algorithms and self._verify(algorithm, signing_input, signature)
+
+    @classmethod
+    def hmac(cls, secret: bytes, algorithms: Optional[set] = None) -> "SigningKey":
+        def verify(algorithm: str, signing_input: bytes, signature: bytes) -> bool:
+            expected = hmac.new(secret, signing_input, HMAC_ALGORITHMS[algorithm]).digest()
+            return hmac.compare_digest(expected, signature)
+        return cls(set(HMAC_ALGORITHMS) if algorithms is None else algorithms, verify)
+
+    @classmethod
+    def from_jwk(cls, jwk: dict) -> Optional["SigningKey"]:
+        """Key for a JWK, or None for keys this server cannot use"""
+        kty = jwk.get("kty")
+        if jwk.get("use", "sig") != "sig":
+            return None
+        if kty == "oct":
+            algorithms = {jwk["alg"]} & set(HMAC_ALGORITHMS) if "alg" in jwk else None
+            return cls.hmac(_b64decode(jwk["k"]), algorithms)
+        crypto = _cryptography()
+        if crypto is None:
+            return None
+        InvalidSignature, hashes, ec, padding, rsa, encode_dss_signature = crypto
+        if kty == "RSA":
+            public_key = rsa.RSAPublicNumbers(_b64int(jwk["e"]), _b64int(jwk["n"])).public_key()
+            algorithms = {jwk["alg"]} & RSA_ALGORITHMS if "alg" in jwk else set(RSA_ALGORITHMS)
+
+            def verify(algorithm: str, signing_input: bytes, signature: bytes) -> bool:
+                digest = getattr(hashes, "SHA" + algorithm[2:])()
+                try:
+                    public_key.verify(signature, signing_input, padding.PKCS1v15(), digest)
+                    return True
+                except InvalidSignature:
+                    return False
+            return cls(algorithms, verify)
+        if kty == "EC":
+            curves = {"P-256": ec.SECP256R1(), "P-384": ec.SECP384R1(), "P-521": ec.SECP521R1()}
+            curve = curves.get(jwk.get("crv"))
+            if curve is None:
+                return None
+            public_key = ec.EllipticCurvePublicNumbers(_b64int(jwk["x"]), _b64int(jwk["y"]), curve).public_key()
+            algorithms = {alg for alg, crv in EC_ALGORITHMS.items() if crv == jwk["crv"]}
+
+            def verify(algorithm: str, signing_input: bytes, signature: bytes) -> bool:
+                # JWS signatures are raw r || s; cryptography expects DER
+                half = len(signature) // 2
+                der = encode_dss_signature(
+                    int.from_bytes(signature[:half], "big"), int.from_bytes(signature[half:], "big"))
+                digest = getattr(hashes, "SHA" + algorithm[2:])()
+                try:
+                    public_key.verify(der, signing_input, ec.ECDSA(digest))
+                    return True
+                except InvalidSignature:
+                    return False
+            return cls(algorithms, verify)
+        return None
+
+
+@lru_cache(maxsize=None)
+def _cryptography():
+    """The cryptography names used for RSA and EC keys, or None when it is not installed
+
+    Imported on first use: only JWKS with RSA or EC keys need it.
+    """
+    try:
+        from cryptography.exceptions import InvalidSignature
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec, padding, rsa
+        from cryptography.hazmat.primitives.asymmetric.utils import encode_dss_signature
+    except ImportError:  # Only HS256 keys can be used without cryptography
+        return None
+    return InvalidSignature, hashes, ec, padding, rsa, encode_dss_signature
+
+
+def parse_jwks(jwks: dict) -> Dict[Optional[str], SigningKey]:
+    keys = {}
+    for jwk in jwks.get("keys") or []:
+        try:
+            key = SigningKey.from_jwk(jwk)
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Skipping unusable JWK {jwk.get('kid')}: {e}")
+            continue
+        if key is not None:
+            keys[jwk.get("kid")] = key
+    return keys
+
+
+class StaticKeys:
+    """A fixed set of keys, e.g. the project's JWT secret"""
+
+    def __init__(self, keys: Dict[Optional[str], SigningKey]):
+        self.keys = keys
+        self.version = 0
+
+    async def refresh(self) -> None:
+        pass
+
+    async def get(self, kid: Optional[str]) -> Optional[SigningKey]:
+        # A single key is used for tokens with or without a key id
+        if kid not in self.keys and len(self.keys) == 1:
+            return next(iter(self.keys.values()))
+        return self.keys.get(kid)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class JwksKeys:
+    """Keys from a JWKS file or URL, reloaded every refresh_interval seconds
+    and when a token names an unknown key"""
+
+    def __init__(self, source: str, refresh_interval: float = 600.0, clock: Callable[[], float] = time.monotonic):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self.keys: Dict[Optional[str], SigningKey] = {}
+        # Incremented when keys are replaced, so cached verifications can be dropped
+        self.version = 0
+        self._fingerprint = ""
+        self._loaded_at: Optional[float] = None
+        self._file_stamp: Optional[Tuple[int, int]] = None
+        self._lock = asyncio.Lock()
+        self._http = UpstreamClient(source, timeout=5.0, retries=1) if source.startswith(("http://", "https://")) else None
+
+    async def refresh(self) -> None:
+        """Reload the keys if they are older than refresh_interval"""
+        now = self.clock()
+        if self._loaded_at is None or now - self._loaded_at >= self.refresh_interval:
+            await self._refresh_once(now)
+
+    async def get(self, kid: Optional[str]) -> Optional[SigningKey]:
+        await self.refresh()
+        now = self.clock()
+        if kid not in self.keys and now - self._loaded_at >= MIN_REFRESH_INTERVAL:
+            await self._refresh_once(now)
+        return self.keys.get(kid)
+
+    async def _refresh_once(self, now: float) -> None:
+        async with self._lock:
+            # Another request may have refreshed while we waited
+            if self._loaded_at is None or self._loaded_at < now:
+                await self._refresh()
+
+    async def _refresh(self) -> None:
+        try:
+            if self._http is not None:
+                jwks = await self._http.get_json(self.source)
+            else:
+                stat = os.stat(self.source)
+                stamp = (stat.st_mtime_ns, stat.st_size)
+                if stamp == self._file_stamp:
+                    self._loaded_at = self.clock()
+                    return
+                with open(self.source) as f:
+                    jwks = json.load(f)
+                self._file_stamp = stamp
+        except (UpstreamError, OSError, ValueError) as e:
+            # Keep verifying with the keys we have
+            print(f"Error loading JWKS from {self.source}: {e}")
+            self._loaded_at = self.clock()
+            return
+        keys = parse_jwks(jwks)
+        # Key material, not just key ids: a key may be replaced under its old kid
+        fingerprint = hashlib.sha256(
+            json.dumps(jwks.get("keys") or [], sort_keys=True).encode()).hexdigest()
+        if fingerprint != self._fingerprint:
+            self.version += 1
+            self._fingerprint = fingerprint
+        self.keys = keys
+        self._loaded_at = self.clock()
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+
+
+class TokenVerifier:
+    def __init__(self, keys, audience: Optional[str] = "authenticated", issuer: Optional[str] = None,
+                 leeway: float = 30.0, cache_size: int = 10000, clock: Callable[[], float] = time.time):
+        self.keys = keys
+        self.audience = audience
+        self.issuer = issuer
+        self.leeway = leeway
+        self.cache_size = cache_size
+        self.clock = clock
+        # token -> (user, expiry); insertion order is recency
+        self._verified: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        self._keys_version = keys.version
+        self.hits = 0
+        self.misses = 0
+
+    async def verify(self, token: str) -> dict:
+        """The user a token was issued to; raises AuthError if it is not valid"""
+        # Cache hits never look a key up, so reload the keys here for rotation to be seen
+        await self.keys.refresh()
+        if self.keys.version != self._keys_version:
+            # Keys were rotated out; tokens must be checked against the new set
+            self._verified.clear()
+            self._keys_version = self.keys.version
+        cached = self._verified.get(token)
+        if cached is not None:
+            user, expires = cached
+            if self.clock() < expires + self.leeway:
+                self._verified.move_to_end(token)
+                self.hits += 1
+                return user
+            del self._verified[token]
+
+        self.misses += 1
+        claims = await self._verify_claims(token)
+        user = {"id": claims["sub"], "email": claims.get("email"), "role": claims.get("role")}
+        self._verified[token] = (user, float(claims["exp"]))
+        if len(self._verified) > self.cache_size:
+            self._verified.popitem(last=False)
+        return user
+
+    async def _verify_claims(self, token: str) -> dict:
+        try:
+            header_segment, payload_segment, signature_segment = token.split(".")
+        except ValueError as e:
+            raise AuthError("Malformed token") from e
+        try:
+            header = json.loads(_b64decode(header_segment))
+            claims = json.loads(_b64decode(payload_segment))
+        except ValueError as e:
+            raise AuthError("Malformed token") from e
+        if not isinstance(header, dict) or not isinstance(claims, dict):
+            raise AuthError("Malformed token")
+
+        key = await self.keys.get(header.get("kid"))
+        if key is None:
+            raise AuthError(f"Unknown signing key: {header.get('kid')}")
+        signing_input = f"{header_segment}.{payload_segment}".encode()
+        if not key.verify(header.get("alg"), signing_input, _b64decode(signature_segment)):
+            raise AuthError("Invalid token signature")
+
+        now = self.clock()
+        if not isinstance(claims.get("exp"), (int, float)):
+            raise AuthError("Token has no expiry")
+        if now >= claims["exp"] + self.leeway:
+            raise AuthError("Token has expired")
+        if isinstance(claims.get("nbf"), (int, float)) and now < claims["nbf"] - self.leeway:
+            raise AuthError("Token is not valid yet")
+        if self.issuer and claims.get("iss") != self.issuer:
+            raise AuthError("Token has the wrong issuer")
+        if self.audience:
+            audience = claims.get("aud")
+            audiences = audience if isinstance(audience, list) else [audience]
+            if self.audience not in audiences:
+                raise AuthError("Token has the wrong audience")
+        if not claims.get("sub"):
+            raise AuthError("Token has no subject")
+        return claims
+
+    def stats(self) -> dict:
+        return {"cached": len(self._verified), "hits": self.hits, "misses": self.misses}
+
+    async def aclose(self) -> None:
+        await self.keys.aclose()
+
+
+def issue_token(claims: dict, secret: str, algorithm: str = "HS256", kid: Optional[str] = None) -> str:
+    """HMAC-signed JWT, for local development and tests"""
+    header = {"alg": algorithm, "typ": "JWT", **({"kid": kid} if kid else {})}
+    signing_input = ".".join(
+        _b64encode(json.dumps(part, separators=(",", ":")).encode()) for part in (header, claims))
+    signature = hmac.new(secret.encode(), signing_input.encode(), HMAC_ALGORITHMS[algorithm]).digest()
+    return f"{signing_input}.{_b64encode(signature)}"
+
+
+def create_token_verifier() -> Optional[TokenVerifier]:
+    """Verifier configured by AUTH_JWKS_URL, AUTH_JWKS_PATH or SUPABASE_JWT_SECRET
+
+    Returns None when none of them is set, i.e. authentication is off.
+    """
+    source = os.getenv("AUTH_JWKS_URL") or os.getenv("AUTH_JWKS_PATH")
+    secret = os.getenv("SUPABASE_JWT_SECRET")
+    if source:
+        keys = JwksKeys(source, float(os.getenv("AUTH_JWKS_REFRESH_INTERVAL", "600")))
+    elif secret:
+        keys = StaticKeys({None: SigningKey.hmac(secret.encode())})
+    else:
+        return None
+    return TokenVerifier(
+        keys,
+        audience=os.getenv("AUTH_AUDIENCE", "authenticated") or None,
+        issuer=os.getenv("AUTH_ISSUER") or None,
+        leeway=float(os.getenv("AUTH_LEEWAY", "30")),
+        cache_size=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000")),
+    )
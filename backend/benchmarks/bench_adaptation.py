@@ -0,0 +1,112 @@
+"""Benchmark drill adaptation on a large synthetic catalog
+
+Compares the original per-request loop (repeated age_group.lower() and
+chained str.replace per drill) with compiled adaptations: every
+description is precomputed per (drill, adaptation), split around its
+focus slot when it has one, so a request adapts its focus string once
+and joins.
+
+    python benchmarks/bench_adaptation.py [--drills 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adaptation import ADAPTATIONS, adaptation_for  # noqa: E402
+from catalog import FOCUS_SLOT, Drill, catalog_store  # noqa: E402
+
+AGE_GROUPS = ["U8", "U10", "U12", "U14", "U16", "U18", ""]
+
+
+def synthetic_drills(count: int):
+    base = catalog_store.catalog.drills
+    return [
+        Drill(d.sport, f"{d.title} #{i}", d.description, d.source)
+        for i, d in ((i, base[i % len(base)]) for i in range(count))
+    ]
+
+
+def legacy_adapt(drills, focus: str, age_group: str):
+    # The original get_enhanced_drills customization loop
+    results = []
+    for drill in drills:
+        description = drill.description.replace(FOCUS_SLOT, focus)
+        if age_group:
+            if "u8" in age_group.lower() or "u10" in age_group.lower():
+                description = description.replace(
+                    "Focus on", "Simple focus on").replace("Practice", "Fun practice with")
+            elif "u16" in age_group.lower() or "u18" in age_group.lower():
+                description = description.replace(
+                    "Practice", "Advanced practice with").replace("Focus on", "Intensive focus on")
+        results.append(description)
+    return results
+
+
+def precompute(drills):
+    return {
+        adaptation: {
+            drill: (adaptation.apply(drill.description) if not drill.has_focus_slot
+                    else tuple(adaptation.apply(part) for part in drill.description.split(FOCUS_SLOT)))
+            for drill in drills
+        }
+        for adaptation in ADAPTATIONS
+    }
+
+
+def compiled_adapt(drills, views, focus: str, age_group: str):
+    adaptation = adaptation_for(age_group)
+    variants = views[adaptation]
+    adapted_focus = adaptation.apply(focus)
+    results = []
+    for drill in drills:
+        description = variants[drill]
+        if isinstance(description, tuple):
+            description = adapted_focus.join(description)
+        results.append(description)
+    return results
+
+
+def best_of(repeat: int, fn) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--drills", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    drills = synthetic_drills(args.drills)
+    focus = "passing accuracy under pressure"
+
+    start = time.perf_counter()
+    static = precompute(drills)
+    precompute_seconds = time.perf_counter() - start
+
+    for age_group in AGE_GROUPS:
+        assert legacy_adapt(drills, focus, age_group) == compiled_adapt(drills, static, focus, age_group)
+
+    legacy = best_of(args.repeat, lambda: [legacy_adapt(drills, focus, age) for age in AGE_GROUPS])
+    compiled = best_of(args.repeat, lambda: [compiled_adapt(drills, static, focus, age) for age in AGE_GROUPS])
+    requests = len(AGE_GROUPS)
+    print(json.dumps({
+        "benchmark": "adaptation",
+        "drills": args.drills,
+        "precompute_ms": round(precompute_seconds * 1000, 3),
+        "legacy_ms_per_request": round(legacy / requests * 1000, 3),
+        "compiled_ms_per_request": round(compiled / requests * 1000, 3),
+        "speedup": round(legacy / compiled, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
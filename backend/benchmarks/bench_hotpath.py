@@ -0,0 +1,142 @@
+"""Micro-benchmarks for the practice plan hot path
+
+Times the pieces of a /api/generate-practice request on their own: drill
+lookup and adaptation (get_enhanced_drills), inspiration retrieval,
+session scheduling, template rendering and a whole uncached
+render_practice_plan, plus the plan cache hit path. Results are JSON, so
+runs from different commits can be compared.
+
+    python benchmarks/bench_hotpath.py [--number 2000] [--repeat 5] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+# Offline and side-effect free: no upstream keys, no auth, throwaway databases
+for key in ("OPENAI_API_KEY", "TAVILY_API_KEY", "SUPABASE_JWT_SECRET", "AUTH_JWKS_URL", "AUTH_JWKS_PATH"):
+    os.environ.pop(key, None)
+WORKDIR = tempfile.mkdtemp(prefix="headcoach-bench-")
+for key, name in (("PRACTICE_DB_PATH", "bench.sqlite3"), ("PLAN_CACHE_PATH", "plan_cache.sqlite3"),
+                  ("JOB_DB_PATH", "jobs.sqlite3"), ("LLM_CACHE_PATH", "llm_cache.sqlite3"),
+                  ("RATE_LIMIT_PATH", "rate_limits.sqlite3"), ("SAVE_LOG_DIR", "save-log")):
+    os.environ.setdefault(key, os.path.join(WORKDIR, name))
+os.environ.setdefault("RATE_LIMIT_BACKEND", "off")
+os.environ.setdefault("PROFILE_SAMPLE_RATE", "0")
+
+import main as backend  # noqa: E402
+from plan_cache import cache_key  # noqa: E402
+from plan_templates import template_for  # noqa: E402
+from schedule import _schedule  # noqa: E402
+
+FOCUSES = ["passing", "shooting accuracy", "defensive positioning", "ball control under pressure"]
+AGE_GROUPS = ["", "U8", "U12", "U16"]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def requests(count: int):
+    sports = backend.catalog_store.catalog.sports
+    return [
+        backend.PracticeRequest(
+            sport=sports[i % len(sports)],
+            duration=str(60 + 15 * (i % 4)),
+            focus=FOCUSES[i % len(FOCUSES)],
+            ageGroup=AGE_GROUPS[i % len(AGE_GROUPS)] or None,
+            playerCount=str(8 + i % 12),
+            selectedDrills=["Rondo", "Box passing"][:i % 3],
+        )
+        for i in range(count)
+    ]
+
+
+def measure(fn, items, number: int, repeat: int) -> dict:
+    """Best of repeat runs of fn over number items (cycled); per-call statistics"""
+    calls = [items[i % len(items)] for i in range(number)]
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for item in calls:
+            fn(item)
+        runs.append(time.perf_counter() - start)
+    best = min(runs)
+    return {
+        "us_per_call": round(best / number * 1e6, 3),
+        "calls_per_second": round(number / best),
+        "spread": round(max(runs) / best, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    items = requests(64)
+    values = [
+        (template_for(r.sport),
+         backend.plan_values(r, backend.drill_inspiration(r), backend.practice_schedule(r)), r)
+        for r in items]
+
+    def uncached_schedule(r):
+        _schedule.cache_clear()
+        backend.practice_schedule(r)
+
+    loop = asyncio.new_event_loop()
+    for r in items:
+        loop.run_until_complete(backend.cached_practice_plan(r))
+    keys = [(r, cache_key(r)) for r in items]
+
+    benchmarks = {
+        "get_enhanced_drills": measure(
+            lambda r: backend.get_enhanced_drills(r.sport, r.focus, r.ageGroup or "", r.skillLevel or ""),
+            items, args.number, args.repeat),
+        "search_catalog": measure(
+            lambda r: backend.search_catalog(r.sport, r.focus, r.ageGroup or ""),
+            items, args.number, args.repeat),
+        "drill_inspiration": measure(backend.drill_inspiration, items, args.number, args.repeat),
+        "schedule_cached": measure(backend.practice_schedule, items, args.number, args.repeat),
+        "schedule_uncached": measure(uncached_schedule, items, args.number, args.repeat),
+        "template_render": measure(
+            lambda v: v[0].render(v[1], v[2].selectedDrills), values, args.number, args.repeat),
+        "render_practice_plan": measure(backend.render_practice_plan, items, args.number, args.repeat),
+        "cache_key": measure(cache_key, items, args.number, args.repeat),
+        "plan_cache_hit": measure(
+            lambda item: backend.bind_generated(backend.plan_cache.get(item[1])), keys, args.number, args.repeat),
+    }
+    loop.close()
+
+    results = {
+        "suite": "hotpath",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "drills": len(backend.catalog_store.catalog.drills),
+        "number": args.number,
+        "repeat": args.repeat,
+        "benchmarks": benchmarks,
+    }
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Cold start and memory per worker for each way of serving the app
+
+Starts the server as a subprocess and reports the time until /health
+first answers (cold start), then sends --requests generate requests
+spread over the workers and reports each process's memory: RSS, PSS
+(shared pages split between the processes sharing them) and USS (pages
+no other process uses). Compares a single uvicorn process, uvicorn
+--workers (each worker imports the app itself) and serve.py (workers
+forked from a preloaded parent). Also times `import main` in a fresh
+interpreter. Linux only: memory is read from /proc.
+
+    python benchmarks/bench_startup.py [--workers 4] [--requests 200] [--modes prefork] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import httpx
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FOCUSES = ["passing", "shooting accuracy", "defensive positioning", "ball control under pressure"]
+SPORTS = ["soccer", "basketball", "volleyball", "flag-football"]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def server_env(workdir: str) -> Dict[str, str]:
+    """Offline settings with throwaway databases"""
+    env = dict(os.environ)
+    for key in ("OPENAI_API_KEY", "TAVILY_API_KEY", "SUPABASE_JWT_SECRET", "AUTH_JWKS_URL", "AUTH_JWKS_PATH"):
+        env.pop(key, None)
+    env.update(
+        PRACTICE_DB_PATH=os.path.join(workdir, "practice_plans.sqlite3"),
+        JOB_DB_PATH=os.path.join(workdir, "jobs.sqlite3"),
+        LLM_CACHE_PATH=os.path.join(workdir, "llm_cache.sqlite3"),
+        SAVE_LOG_DIR=os.path.join(workdir, "save-log"),
+        RATE_LIMIT_BACKEND="off",
+        PROFILE_SAMPLE_RATE="0",
+    )
+    return env
+
+
+def commands(workers: int, port: int) -> Dict[str, List[str]]:
+    uvicorn = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+               "--log-level", "warning"]
+    return {
+        "uvicorn": uvicorn,
+        "uvicorn_workers": uvicorn + ["--workers", str(workers)],
+        "prefork": [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port),
+                    "--workers", str(workers)],
+    }
+
+
+def import_seconds(env: Dict[str, str], repeat: int) -> float:
+    """Fastest `import main` in a fresh interpreter"""
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    runs = [float(subprocess.run([sys.executable, "-c", code], cwd=BACKEND, env=env, check=True,
+                                 capture_output=True, text=True).stdout.split()[-1])
+            for _ in range(repeat)]
+    return min(runs)
+
+
+def descendants(pid: int) -> List[int]:
+    children: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces; fields resume after its ")"
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def memory_mb(pid: int) -> Dict[str, float]:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if rest.strip().endswith("kB"):
+                fields[name] = int(rest.split()[0])
+    uss = fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)
+    return {"rss_mb": round(fields["Rss"] / 1024, 1), "pss_mb": round(fields["Pss"] / 1024, 1),
+            "uss_mb": round(uss / 1024, 1)}
+
+
+def is_worker(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read()
+    except OSError:
+        return False
+    # uvicorn --workers also starts multiprocessing's resource tracker
+    return b"resource_tracker" not in cmdline
+
+
+def generate(base_url: str, i: int) -> int:
+    # A fresh connection for every request, so the kernel spreads them over the workers
+    with httpx.Client(base_url=base_url, headers={"Authorization": "Bearer bench"}, timeout=30) as client:
+        response = client.post("/api/generate-practice", json={
+            "sport": SPORTS[i % len(SPORTS)],
+            "duration": str(60 + 15 * (i % 4)),
+            "focus": f"{FOCUSES[i % len(FOCUSES)]} {i}",
+            "ageGroup": ["U8", "U12", "U16", None][i % 4],
+        })
+    return response.status_code
+
+
+def run_mode(name: str, args, env: Dict[str, str]) -> dict:
+    port = free_port()
+    command = commands(args.workers, port)[name]
+    stderr = tempfile.TemporaryFile()
+    start = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=stderr)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        with httpx.Client(base_url=base_url, timeout=30) as client:
+            while True:
+                if process.poll() is not None:
+                    stderr.seek(0)
+                    raise RuntimeError(f"{name} exited: {stderr.read().decode()[-2000:]}")
+                try:
+                    if client.get("/health").status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                if time.perf_counter() - start > 120:
+                    raise RuntimeError(f"{name} did not answer within 120s")
+                time.sleep(0.01)
+            ready = time.perf_counter() - start
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            statuses = list(pool.map(lambda i: generate(base_url, i), range(args.requests)))
+        time.sleep(args.settle)
+        pids = [process.pid] + [pid for pid in descendants(process.pid) if is_worker(pid)]
+        processes = [{"pid": pid, "role": "parent" if pid == process.pid and len(pids) > 1 else "worker",
+                      **memory_mb(pid)} for pid in pids]
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        stderr.close()
+    workers = [p for p in processes if p["role"] == "worker"]
+    return {
+        "ready_s": round(ready, 3),
+        "errors": sum(1 for status in statuses if status != 200),
+        "processes": processes,
+        "worker_rss_mb": round(sum(p["rss_mb"] for p in workers) / len(workers), 1),
+        "worker_uss_mb": round(sum(p["uss_mb"] for p in workers) / len(workers), 1),
+        "total_pss_mb": round(sum(p["pss_mb"] for p in processes), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200, help="generate requests sent before measuring memory")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--settle", type=float, default=1.0, help="seconds to wait before reading memory")
+    parser.add_argument("--modes", help="comma-separated subset of uvicorn,uvicorn_workers,prefork (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="fresh interpreters timed for import_main_s")
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="headcoach-startup-")
+    try:
+        env = server_env(workdir)
+        modes = args.modes.split(",") if args.modes else list(commands(args.workers, 0))
+        results = {
+            "suite": "startup",
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "workers": args.workers,
+            "requests": args.requests,
+            "import_main_s": round(import_seconds(env, args.repeat), 3),
+            "modes": {name: run_mode(name, args, env) for name in modes},
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""In-process load test of every API endpoint
+
+Drives the FastAPI app through httpx's ASGI transport (no sockets) at a
+configurable concurrency and reports latency percentiles, throughput and
+memory per endpoint as JSON. Upstream APIs are stubbed with a mock
+transport that answers after --upstream-latency milliseconds, and
+databases live in a temporary directory, so runs are offline and
+repeatable.
+
+    python benchmarks/loadtest.py [--concurrency 16] [--requests 500]
+                                  [--endpoints generate,search] [--llm] [--output results.json]
+
+With --llm, plans are written by a stubbed chat model (see
+mock_openai.py) through the completion cache. Set SAVE_MODE=write-behind
+in the environment to measure batched saves.
+
+Background jobs are measured twice: "job" submits a generation and
+long-polls it until it finishes, "job_submit" only queues one. Every
+request comes from the same user, so the per-user job limits are raised
+unless JOB_MAX_PENDING_PER_USER or JOB_MAX_RUNNING_PER_USER is set.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+WORKDIR = tempfile.mkdtemp(prefix="headcoach-loadtest-")
+for key in ("OPENAI_API_KEY", "TAVILY_API_KEY", "SUPABASE_JWT_SECRET", "AUTH_JWKS_URL", "AUTH_JWKS_PATH"):
+    os.environ.pop(key, None)
+os.environ.update(
+    PRACTICE_DB_PATH=os.path.join(WORKDIR, "practice_plans.sqlite3"),
+    PLAN_CACHE_PATH=os.path.join(WORKDIR, "plan_cache.sqlite3"),
+    RATE_LIMIT_BACKEND="off",
+    PROFILE_SAMPLE_RATE="0",
+    LLM_CACHE_PATH=os.path.join(WORKDIR, "llm_cache.sqlite3"),
+    JOB_DB_PATH=os.path.join(WORKDIR, "jobs.sqlite3"),
+    SAVE_LOG_DIR=os.path.join(WORKDIR, "save-log"),
+)
+os.environ.setdefault("JOB_MAX_PENDING_PER_USER", "1000000")
+os.environ.setdefault("JOB_MAX_RUNNING_PER_USER", "1000000")
+
+import httpx  # noqa: E402
+
+import main as backend  # noqa: E402
+from bench_hotpath import FOCUSES, git_revision  # noqa: E402
+from llm import create_plan_writer  # noqa: E402
+from mock_openai import completion_response, stream_body  # noqa: E402
+from upstream import OpenAIClient, TavilyClient  # noqa: E402
+
+HEADERS = {"Authorization": "Bearer loadtest"}
+
+
+def rss_mb() -> float:
+    """Current resident set size, from /proc where available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def stub_tavily(latency: float) -> TavilyClient:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        query = json.loads(request.content)["query"]
+        return httpx.Response(200, json={"results": [
+            {"title": f"Drill {i} for {query[:40]}", "url": f"https://drills.example/{i}",
+             "content": "Set up cones in a square and work in pairs. " * 4}
+            for i in range(6)]})
+    return TavilyClient("stub", "https://api.tavily.test", transport=httpx.MockTransport(handler))
+
+
+def stub_openai(latency: float) -> OpenAIClient:
+    async def handler(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(latency)
+        payload = json.loads(request.content)
+        if payload.get("stream"):
+            return httpx.Response(200, text=stream_body(payload), headers={"Content-Type": "text/event-stream"})
+        return httpx.Response(200, json=completion_response(payload))
+    return OpenAIClient("stub", "https://api.openai.test/v1", transport=httpx.MockTransport(handler))
+
+
+def practice(i: int, distinct: int) -> dict:
+    # i % distinct controls the plan cache hit rate
+    n = i % distinct
+    sports = backend.catalog_store.catalog.sports
+    return {
+        "sport": sports[n % len(sports)],
+        "duration": str(60 + 15 * (n % 4)),
+        "focus": f"{FOCUSES[n % len(FOCUSES)]} {n // len(FOCUSES)}",
+        "ageGroup": ["U8", "U12", "U16", None][n % 4],
+        "playerCount": str(8 + n % 12),
+    }
+
+
+def scenarios(distinct: int, saved_ids: List[str]) -> Dict[str, Callable[[httpx.AsyncClient, int], object]]:
+    """Endpoint name -> coroutine function issuing request i"""
+
+    async def consume_stream(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> httpx.Response:
+        async with client.stream(method, url, **kwargs) as response:
+            async for _ in response.aiter_bytes():
+                pass
+        return response
+
+    async def run_job(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        submitted = await client.post("/api/jobs/generate-practice", headers=HEADERS, json=practice(i, distinct))
+        if submitted.status_code != 202:
+            return submitted
+        while True:
+            response = await client.get(submitted.headers["Location"], headers=HEADERS, params={"wait": 30})
+            if response.status_code != 200 or response.json()["status"] in ("succeeded", "failed"):
+                break
+        if response.json().get("status") == "failed":
+            raise RuntimeError(response.json().get("error"))
+        return response
+
+    return {
+        "root": lambda c, i: c.get("/"),
+        "health": lambda c, i: c.get("/health"),
+        "metrics": lambda c, i: c.get("/metrics"),
+        "search": lambda c, i: c.post("/api/search-drills", headers=HEADERS, params={
+            "sport": practice(i, distinct)["sport"], "focus": practice(i, distinct)["focus"]}),
+        "suggest": lambda c, i: c.get("/api/drills/suggest", headers=HEADERS, params={
+            "q": ["pa", "sho", "def", "dri", "ser"][i % 5]}),
+        "generate": lambda c, i: c.post("/api/generate-practice", headers=HEADERS, json=practice(i, distinct)),
+        "stream": lambda c, i: consume_stream(
+            c, "POST", "/api/generate-practice/stream", json=practice(i, distinct),
+            headers=dict(HEADERS, Accept="text/event-stream")),
+        "batch": lambda c, i: consume_stream(c, "POST", "/api/generate-practices/batch", headers=HEADERS, json={
+            "season": dict(practice(i, distinct), sessions=8, focuses=FOCUSES)}),
+        "save": lambda c, i: c.post("/api/save-practice", headers=HEADERS, json={
+            "title": f"Plan {i}", "sport": "soccer", "duration": 60, "selected_drills": [],
+            "generated_plan": f"# Plan {i % distinct}\n" + "Warm up, drills, games. " * 50}),
+        "list": lambda c, i: c.get("/api/practice-plans", headers=HEADERS, params={"limit": 10}),
+        "get": lambda c, i: c.get(f"/api/practice-plans/{saved_ids[i % len(saved_ids)]}", headers=HEADERS),
+        "job": run_job,
+        # Last: the jobs it queues keep the workers busy after it returns
+        "job_submit": lambda c, i: c.post("/api/jobs/generate-practice", headers=HEADERS, json=practice(i, distinct)),
+    }
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_endpoint(client: httpx.AsyncClient, request, total: int, concurrency: int) -> dict:
+    latencies: List[float] = []
+    errors = 0
+    statuses: Dict[str, int] = {}
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await request(client, i)
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if not status.startswith("2"):
+                errors += 1
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "rss_delta_mb": round(rss_mb() - rss_before, 2),
+    }
+
+
+async def run(args) -> dict:
+    backend.tavily_client = stub_tavily(args.upstream_latency / 1000)
+    if args.llm:
+        os.environ["PLAN_GENERATOR"] = "openai"
+        backend.plan_writer = create_plan_writer(stub_openai(args.llm_latency / 1000))
+    # The ASGI transport does not run startup handlers
+    backend.job_queue.start()
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+        saved_ids = []
+        for i in range(10):
+            response = await scenarios(args.distinct, ["-"])["save"](client, i)
+            saved_ids.append(response.json()["id"])
+        all_scenarios = scenarios(args.distinct, saved_ids)
+        names = args.endpoints.split(",") if args.endpoints else list(all_scenarios)
+        unknown = set(names) - set(all_scenarios)
+        if unknown:
+            raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        # Warm up imports, caches and connections before measuring
+        for name in names:
+            await run_endpoint(client, all_scenarios[name], min(20, args.requests), 2)
+        gc.collect()
+
+        rss_start = rss_mb()
+        endpoints = {}
+        for name in names:
+            endpoints[name] = await run_endpoint(client, all_scenarios[name], args.requests, args.concurrency)
+    await backend.job_queue.stop()
+    await backend.tavily_client.aclose()
+    if backend.plan_writer is not None:
+        await backend.plan_writer.client.aclose()
+    return {
+        "suite": "loadtest",
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "concurrency": args.concurrency,
+        "requests_per_endpoint": args.requests,
+        "distinct_practices": args.distinct,
+        "upstream_latency_ms": args.upstream_latency,
+        "llm": backend.plan_writer.stats() if backend.plan_writer is not None else None,
+        "save_mode": os.getenv("SAVE_MODE", "direct"),
+        "memory": {"rss_start_mb": round(rss_start, 2), "rss_end_mb": round(rss_mb(), 2),
+                   "peak_rss_mb": round(peak_rss_mb(), 2)},
+        "endpoints": endpoints,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--endpoints", help="comma-separated subset of endpoints (default: all)")
+    parser.add_argument("--distinct", type=int, default=100,
+                        help="distinct practice requests, which sets the plan cache hit rate")
+    parser.add_argument("--upstream-latency", type=float, default=20.0, help="stubbed upstream latency (ms)")
+    parser.add_argument("--llm", action="store_true", help="write plans with a stubbed chat model")
+    parser.add_argument("--llm-latency", type=float, default=800.0, help="stubbed completion latency (ms)")
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        backend.plan_repository.close()
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Local mock of the OpenAI chat completions API
+
+Answers POST /v1/chat/completions with a canned markdown practice plan
+built from the prompt, after --latency milliseconds, and reports token
+usage the way the real API does. Requests with "stream": true get the
+plan as Server-Sent Events, one chunk per line. Point the backend at it to exercise
+PLAN_GENERATOR=openai without an API key:
+
+    python benchmarks/mock_openai.py [--port 8400] [--latency 800]
+    OPENAI_API_KEY=test OPENAI_BASE_URL=http://127.0.0.1:8400/v1 PLAN_GENERATOR=openai uvicorn main:app
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+from llm import count_tokens  # noqa: E402
+
+
+def completion_response(payload: dict) -> dict:
+    """A chat completion for a request payload, echoing the prompt's first line"""
+    model = payload.get("model", "gpt-4o")
+    prompt = "\n".join(message.get("content", "") for message in payload.get("messages", []))
+    request = payload["messages"][-1]["content"] if payload.get("messages") else ""
+    heading = request.splitlines()[0] if request else "Practice plan"
+    schedule = [line[2:] for line in request.splitlines() if line.startswith("- ")]
+    drills = [line.split(". ", 1)[1].split(" (")[0] for line in request.splitlines()
+              if line[:1].isdigit() and ". " in line]
+    text = "\n".join(
+        [f"# {heading}", "", "## Overview", "A mock plan from the local completion server.", ""]
+        + [f"## {block}\n- Coaching point: keep the tempo high." for block in schedule]
+        + ["", "## Drills"] + [f"- {drill}" for drill in drills])
+    prompt_tokens = count_tokens(prompt, model)
+    completion_tokens = count_tokens(text, model)
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def stream_body(payload: dict) -> str:
+    """A completion for a request payload as the chunks of a streamed response"""
+    response = completion_response(payload)
+    base = {"id": response["id"], "object": "chat.completion.chunk", "created": response["created"],
+            "model": response["model"]}
+    lines = response["choices"][0]["message"]["content"].splitlines(keepends=True)
+    chunks = [dict(base, choices=[{"index": 0, "delta": {"content": line}, "finish_reason": None}])
+              for line in lines]
+    chunks.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+    if (payload.get("stream_options") or {}).get("include_usage"):
+        chunks.append(dict(base, choices=[], usage=response["usage"]))
+    return "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+
+
+def handler_class(latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+                self._reply(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+            time.sleep(latency)
+            if payload.get("stream"):
+                self._send(200, "text/event-stream", stream_body(payload).encode())
+            else:
+                self._reply(200, completion_response(payload))
+
+        def _reply(self, status: int, body: dict):
+            self._send(status, "application/json", json.dumps(body).encode())
+
+        def _send(self, status: int, content_type: str, data: bytes):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8400)
+    parser.add_argument("--latency", type=float, default=800.0, help="response latency (ms)")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), handler_class(args.latency / 1000))
+    print(f"Mock completions at http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+from dataclasses import astuple, dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import hashlib
+import json
+import os
+import re
+import struct
+import sys
+
+from adaptation import NO_ADAPTATION, Adaptation
+
+# Drill catalog
+#
+# Drills are edited in data/drills.json and compiled into a compact
+# columnar file (data/drills.bin) that loads without parsing JSON. The file
+# is only a faster load format: it is read once and every drill decoded
+# into Drill objects and indexed, so each process holds its own copy.
+# Workers share one copy only when they are forked from a parent that
+# loaded it (serve.py), copy-on-write.
+# Records are frozen and every lookup the API needs (sport, source,
+# keyword) is a precomputed dictionary hit. Per-request customization
+# (focus text, age group wording) is applied on top of the shared records
+# instead of rebuilding them. CatalogStore reloads the catalog when the
+# compiled file changes.
+
+FOCUS_SLOT = "{focus}"
+
+
+# Records compare and hash by identity: each catalog entry is one object,
+# and identity hashing keeps per-drill lookups on the request path cheap.
+@dataclass(frozen=True, eq=False)
+class Drill:
+    sport: str
+    title: str
+    description: str
+    source: str
+    url: Optional[str] = None
+
+    @property
+    def has_focus_slot(self) -> bool:
+        return FOCUS_SLOT in self.description
+
+    def fields(self) -> tuple:
+        return astuple(self)
+
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def keywords(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+class DrillCatalog:
+    """Immutable drill store with precomputed lookup indexes"""
+
+    def __init__(self, drills: Sequence[Drill]):
+        self.drills = tuple(drills)
+        by_sport: Dict[str, List[Drill]] = {}
+        by_source: Dict[str, List[Drill]] = {}
+        by_keyword: Dict[str, List[Drill]] = {}
+        for drill in drills:
+            by_sport.setdefault(drill.sport, []).append(drill)
+            by_source.setdefault(drill.source, []).append(drill)
+            text = drill.title + " " + drill.description.replace(FOCUS_SLOT, "")
+            for word in dict.fromkeys(keywords(text)):
+                by_keyword.setdefault(word, []).append(drill)
+
+        self._by_sport = {k: tuple(v) for k, v in by_sport.items()}
+        self._by_source = {k: tuple(v) for k, v in by_source.items()}
+        self._by_keyword = {k: tuple(v) for k, v in by_keyword.items()}
+
+    @property
+    def sports(self) -> Tuple[str, ...]:
+        return tuple(self._by_sport)
+
+    def by_sport(self, sport: str) -> Tuple[Drill, ...]:
+        return self._by_sport.get(sport, ())
+
+    def by_source(self, source: str) -> Tuple[Drill, ...]:
+        return self._by_source.get(source, ())
+
+    def by_keyword(self, word: str) -> Tuple[Drill, ...]:
+        return self._by_keyword.get(word.lower(), ())
+
+    def describe(self, drill: Drill, focus: str, adaptation: Adaptation = NO_ADAPTATION) -> str:
+        """Description of a drill customized for one request"""
+        return adaptation.apply(drill.description.replace(FOCUS_SLOT, focus))
+
+    @staticmethod
+    def adapted_parts(drill: Drill, adaptation: Adaptation) -> Tuple[str, ...]:
+        """Adapted description split around its focus slots
+
+        Joining the parts with the adapted focus text gives the adapted
+        description, so only the focus needs adapting per request.
+        """
+        return tuple(adaptation.apply(part) for part in drill.description.split(FOCUS_SLOT))
+
+
+# Compiled catalog file
+#
+# Header: magic, drill count, column count. Then, per column, the file
+# position of its offset table and of its UTF-8 blob. Each offset table
+# holds count + 1 little-endian u32 offsets into the blob, so field i of a
+# column is blob[offsets[i]:offsets[i + 1]]. An empty url means none.
+
+MAGIC = b"HCDRILL1"
+COLUMNS = ("sport", "title", "description", "source", "url")
+_HEADER = struct.Struct("<8sII")
+_DIRECTORY_ENTRY = struct.Struct("<II")
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+SOURCE_PATH = os.getenv("DRILL_CATALOG_SOURCE", os.path.join(DATA_DIR, "drills.json"))
+COMPILED_PATH = os.getenv("DRILL_CATALOG_PATH", os.path.join(DATA_DIR, "drills.bin"))
+
+
+def read_source(path: str) -> List[Drill]:
+    with open(path, encoding="utf-8") as f:
+        records = json.load(f)
+    return [
+        Drill(
+            sport=record["sport"],
+            title=record["title"],
+            description=record["description"],
+            source=record["source"],
+            url=record.get("url"),
+        )
+        for record in records
+    ]
+
+
+def _column_values(drill: Drill) -> Tuple[str, ...]:
+    return drill.sport, drill.title, drill.description, drill.source, drill.url or ""
+
+
+def compile_catalog(drills: Sequence[Drill], path: str) -> None:
+    """Write drills as a compiled catalog file, atomically replacing path"""
+    columns = list(zip(*(_column_values(drill) for drill in drills))) or [()] * len(COLUMNS)
+    position = _HEADER.size + _DIRECTORY_ENTRY.size * len(COLUMNS)
+    directory, sections = [], []
+    for values in columns:
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = [0]
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        table = struct.pack(f"<{len(offsets)}I", *offsets)
+        directory.append(_DIRECTORY_ENTRY.pack(position, position + len(table)))
+        sections += [table, b"".join(encoded)]
+        position += len(table) + offsets[-1]
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, len(drills), len(COLUMNS)))
+        f.writelines(directory)
+        f.writelines(sections)
+    # Readers never see a partly written file
+    os.replace(tmp_path, path)
+
+
+class CompiledCatalog:
+    """The contents of a compiled catalog file, read into memory"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        magic, self.count, column_count = _HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or column_count != len(COLUMNS):
+            raise ValueError(f"{path} is not a compiled drill catalog")
+        self._columns = []
+        for i in range(column_count):
+            offsets_at, blob_at = _DIRECTORY_ENTRY.unpack_from(self.data, _HEADER.size + i * _DIRECTORY_ENTRY.size)
+            offsets = struct.unpack_from(f"<{self.count + 1}I", self.data, offsets_at)
+            self._columns.append((blob_at, offsets))
+
+    def value(self, column: int, i: int) -> str:
+        blob_at, offsets = self._columns[column]
+        return self.data[blob_at + offsets[i]:blob_at + offsets[i + 1]].decode("utf-8")
+
+    def drill(self, i: int) -> Drill:
+        sport, title, description, source, url = (self.value(column, i) for column in range(len(COLUMNS)))
+        return Drill(sport, title, description, source, url or None)
+
+    def drills(self) -> Tuple[Drill, ...]:
+        return tuple(self.drill(i) for i in range(self.count))
+
+
+class CatalogStore:
+    """Current drill catalog, reloaded when the compiled file changes
+
+    The compiled file is rebuilt from the JSON source when it is missing,
+    older than the source or written in another format. Listeners registered with on_reload run
+    after every reload with the new catalog.
+    """
+
+    def __init__(self, path: str = COMPILED_PATH, source_path: str = SOURCE_PATH):
+        self.path = path
+        self.source_path = source_path
+        self._listeners: List[Callable[[DrillCatalog], None]] = []
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self.fingerprint = ""
+        self.catalog = self._load()
+
+    def _file_stamp(self) -> Tuple[int, int, int]:
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _load(self) -> DrillCatalog:
+        has_source = os.path.exists(self.source_path)
+        if has_source and (
+                not os.path.exists(self.path)
+                or os.path.getmtime(self.source_path) > os.path.getmtime(self.path)):
+            compile_catalog(read_source(self.source_path), self.path)
+        stamp = self._file_stamp()
+        try:
+            compiled = CompiledCatalog(self.path)
+        except ValueError:
+            if not has_source:
+                raise
+            compile_catalog(read_source(self.source_path), self.path)
+            stamp = self._file_stamp()
+            compiled = CompiledCatalog(self.path)
+        catalog = DrillCatalog(compiled.drills())
+        # Identifies this exact catalog, e.g. for data derived from it
+        self.fingerprint = hashlib.sha1(compiled.data).hexdigest()
+        self._stamp = stamp
+        return catalog
+
+    def on_reload(self, listener: Callable[[DrillCatalog], None]) -> None:
+        self._listeners.append(listener)
+
+    def refresh(self) -> bool:
+        """Reload if the compiled file or its source changed; True if reloaded"""
+        try:
+            changed = self._file_stamp() != self._stamp or (
+                os.path.exists(self.source_path)
+                and os.path.getmtime(self.source_path) > os.path.getmtime(self.path))
+        except FileNotFoundError:
+            return False
+        if not changed:
+            return False
+        self.catalog = self._load()
+        for listener in self._listeners:
+            listener(self.catalog)
+        return True
+
+
+catalog_store = CatalogStore()
+
+
+if __name__ == "__main__":
+    # python catalog.py [source.json] [compiled.bin]
+    source = sys.argv[1] if len(sys.argv) > 1 else SOURCE_PATH
+    target = sys.argv[2] if len(sys.argv) > 2 else COMPILED_PATH
+    drills = read_source(source)
+    compile_catalog(drills, target)
+    print(f"Compiled {len(drills)} drills from {source} into {target}")
@@ -0,0 +1,365 @@
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from metrics import JOB_SECONDS, JOB_WAIT_SECONDS
+
+# Background jobs
+#
+# Slow work is submitted as a job and run by a bounded pool of asyncio
+# workers instead of inside the request handler; clients poll (or
+# long-poll) the job for its result. Jobs live in a SQLite table, so they
+# survive restarts and are shared by the workers on one host: a worker
+# claims the oldest runnable job in one short write transaction and holds
+# a lease on it, renewed while the job runs. A job whose lease runs out
+# (its process died) is queued again, up to max_attempts.
+#
+# Each user has at most max_pending queued or running jobs (submitting
+# more is refused) and at most max_running running at once, so one user's
+# burst waits in the queue instead of taking every worker.
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+JOB_COLUMNS = (
+    "id", "user_id", "kind", "status", "payload", "result", "error",
+    "attempts", "created_at", "started_at", "finished_at", "lease_until",
+)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS jobs (
+        id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        status TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        result TEXT,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        lease_until REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)",
+    "CREATE INDEX IF NOT EXISTS jobs_user_status ON jobs (user_id, status)",
+)
+
+Handler = Callable[[dict], Awaitable[dict]]
+
+
+class JobLimitExceeded(Exception):
+    pass
+
+
+def _timestamp(value: Optional[float]) -> Optional[str]:
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def job_view(row: dict) -> dict:
+    """A job as returned by the API: payload omitted, result only once succeeded"""
+    job = {
+        "id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "created_at": _timestamp(row["created_at"]),
+        "started_at": _timestamp(row["started_at"]),
+        "finished_at": _timestamp(row["finished_at"]),
+    }
+    if row["status"] == SUCCEEDED:
+        job["result"] = json.loads(row["result"])
+    elif row["status"] == FAILED:
+        job["error"] = row["error"]
+    return job
+
+
+class JobStore:
+    """Jobs in a SQLite file shared by the workers on one host"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        for statement in SCHEMA:
+            conn.execute(statement)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Close this thread's connection; the next call opens a new one"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _write(self, fn):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def submit(self, user_id: str, kind: str, payload: dict, max_pending: int) -> dict:
+        row = {
+            "id": str(uuid.uuid4()), "user_id": user_id, "kind": kind, "status": QUEUED,
+            "payload": json.dumps(payload, separators=(",", ":")), "result": None, "error": None,
+            "attempts": 0, "created_at": time.time(), "started_at": None, "finished_at": None,
+            "lease_until": None,
+        }
+
+        def insert(conn: sqlite3.Connection) -> None:
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status IN (?, ?)",
+                (user_id, QUEUED, RUNNING)).fetchone()[0]
+            if pending >= max_pending:
+                raise JobLimitExceeded(f"Too many pending jobs, at most {max_pending} per user")
+            conn.execute(
+                f"INSERT INTO jobs ({', '.join(JOB_COLUMNS)}) VALUES ({', '.join('?' for _ in JOB_COLUMNS)})",
+                [row[column] for column in JOB_COLUMNS])
+
+        self._write(insert)
+        return row
+
+    def claim(self, max_running: int, lease: float, max_attempts: int) -> Optional[dict]:
+        """Mark the oldest job whose user has a free running slot as running, and return it"""
+        now = time.time()
+
+        def claim(conn: sqlite3.Connection) -> Optional[dict]:
+            # Jobs of workers that died without finishing them
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, error = ?"
+                " WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, f"Job abandoned after {max_attempts} attempts", RUNNING, now, max_attempts))
+            conn.execute(
+                "UPDATE jobs SET status = ?, lease_until = NULL WHERE status = ? AND lease_until < ?",
+                (QUEUED, RUNNING, now))
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs AS job WHERE status = ?"
+                " AND (SELECT COUNT(*) FROM jobs AS other"
+                "      WHERE other.user_id = job.user_id AND other.status = ?) < ?"
+                " ORDER BY created_at, id LIMIT 1",
+                (QUEUED, RUNNING, max_running)).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ?"
+                " WHERE id = ?", (RUNNING, now, now + lease, row["id"]))
+            return dict(row, status=RUNNING, attempts=row["attempts"] + 1, started_at=now, lease_until=now + lease)
+
+        return self._write(claim)
+
+    def renew(self, job_id: str, lease: float) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = ?", (time.time() + lease, job_id, RUNNING))
+
+    def finish(self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None) -> None:
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL"
+            " WHERE id = ? AND status = ?",
+            (FAILED if error is not None else SUCCEEDED,
+             json.dumps(result, separators=(",", ":")) if error is None else None,
+             error, time.time(), job_id, RUNNING))
+
+    def release(self, job_id: str) -> None:
+        """Queue a running job again without counting the interrupted attempt"""
+        self._conn().execute(
+            "UPDATE jobs SET status = ?, attempts = attempts - 1, started_at = NULL, lease_until = NULL"
+            " WHERE id = ? AND status = ?", (QUEUED, job_id, RUNNING))
+
+    def get(self, user_id: str, job_id: str) -> Optional[dict]:
+        row = self._conn().execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ? AND user_id = ?",
+            (job_id, user_id)).fetchone()
+        return dict(row) if row is not None else None
+
+    def prune(self, finished_before: float) -> int:
+        return self._conn().execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            FINISHED + (finished_before,)).rowcount
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in (QUEUED, RUNNING) + FINISHED} | {row[0]: row[1] for row in rows}
+
+
+class JobQueue:
+    """Runs stored jobs with a fixed number of asyncio workers"""
+
+    def __init__(self, store: JobStore, handlers: Dict[str, Handler], workers: int = 4,
+                 max_pending: int = 20, max_running: int = 2, timeout: float = 120,
+                 lease: float = 30, max_attempts: int = 3, poll_interval: float = 1.0,
+                 retention: float = 86400):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_running = max_running
+        self.timeout = timeout
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        # job id -> [event set when this process finishes the job, waiter count]
+        self._waiters: Dict[str, list] = {}
+        self._next_prune = 0.0
+        self.succeeded = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Cancel the workers; jobs they were running are queued again"""
+        # Before Python 3.12, asyncio.wait_for loses a cancellation that
+        # arrives as what it waits for completes (e.g. a submit's wakeup),
+        # so workers also check this before claiming another job
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, user_id: str, kind: str, payload: dict) -> dict:
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        row = await asyncio.to_thread(self.store.submit, user_id, kind, payload, self.max_pending)
+        self._wakeup.set()
+        return job_view(row)
+
+    async def get(self, user_id: str, job_id: str, wait: float = 0) -> Optional[dict]:
+        """The job, after waiting up to wait seconds for it to finish"""
+        deadline = time.monotonic() + wait
+        waiter = self._waiters.setdefault(job_id, [asyncio.Event(), 0])
+        waiter[1] += 1
+        try:
+            while True:
+                row = await asyncio.to_thread(self.store.get, user_id, job_id)
+                remaining = deadline - time.monotonic()
+                if row is None or row["status"] in FINISHED or remaining <= 0:
+                    return job_view(row) if row is not None else None
+                # Jobs run by other processes are only seen by polling
+                try:
+                    await asyncio.wait_for(waiter[0].wait(), min(remaining, self.poll_interval))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            waiter[1] -= 1
+            if waiter[1] == 0 and self._waiters.get(job_id) is waiter:
+                del self._waiters[job_id]
+
+    async def _work(self) -> None:
+        while not self._stopping:
+            # Cleared before claiming, so a submit committed after the claim
+            # looked still wakes this worker instead of waiting a poll interval
+            self._wakeup.clear()
+            try:
+                await self._maybe_prune()
+                row = await asyncio.to_thread(self.store.claim, self.max_running, self.lease, self.max_attempts)
+            except Exception as e:
+                print(f"Error claiming job: {e}")
+                row = None
+            if row is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(row)
+
+    async def _run(self, row: dict) -> None:
+        kind = row["kind"]
+        JOB_WAIT_SECONDS.observe(row["started_at"] - row["created_at"], kind)
+        heartbeat = asyncio.create_task(self._renew(row["id"]))
+        start = time.perf_counter()
+        result, error = None, None
+        try:
+            result = await asyncio.wait_for(self.handlers[kind](json.loads(row["payload"])), self.timeout)
+        except asyncio.CancelledError:
+            heartbeat.cancel()
+            await asyncio.to_thread(self.store.release, row["id"])
+            raise
+        except asyncio.TimeoutError:
+            error = f"Job timed out after {self.timeout:g} seconds"
+        except Exception as e:
+            print(f"Error running {kind} job: {e}")
+            error = f"Failed to run {kind} job: {str(e)}"
+        finally:
+            heartbeat.cancel()
+        outcome = SUCCEEDED if error is None else FAILED
+        JOB_SECONDS.observe(time.perf_counter() - start, kind, outcome)
+        try:
+            await asyncio.to_thread(self.store.finish, row["id"], result, error)
+        except Exception as e:
+            # The lease runs out and another attempt is made
+            print(f"Error recording {kind} job: {e}")
+            return
+        if error is None:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        waiter = self._waiters.get(row["id"])
+        if waiter is not None:
+            waiter[0].set()
+
+    async def _renew(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await asyncio.to_thread(self.store.renew, job_id, self.lease)
+            except Exception as e:
+                print(f"Error renewing job lease: {e}")
+
+    async def _maybe_prune(self) -> None:
+        now = time.monotonic()
+        if now < self._next_prune:
+            return
+        self._next_prune = now + 3600
+        await asyncio.to_thread(self.store.prune, time.time() - self.retention)
+
+    def stats(self) -> dict:
+        return {"workers": len(self._tasks), "jobs": self.store.counts(),
+                "succeeded": self.succeeded, "failed": self.failed}
+
+
+def create_job_queue(handlers: Dict[str, Handler]) -> JobQueue:
+    """Queue configured by JOB_DB_PATH, JOB_WORKERS, JOB_MAX_PENDING_PER_USER,
+    JOB_MAX_RUNNING_PER_USER, JOB_TIMEOUT, JOB_LEASE, JOB_MAX_ATTEMPTS and JOB_RETENTION"""
+    return JobQueue(
+        JobStore(os.getenv("JOB_DB_PATH", "jobs.sqlite3")),
+        handlers,
+        workers=int(os.getenv("JOB_WORKERS", "4")),
+        max_pending=int(os.getenv("JOB_MAX_PENDING_PER_USER", "20")),
+        max_running=int(os.getenv("JOB_MAX_RUNNING_PER_USER", "2")),
+        timeout=float(os.getenv("JOB_TIMEOUT", "120")),
+        lease=float(os.getenv("JOB_LEASE", "30")),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+        retention=float(os.getenv("JOB_RETENTION", "86400")),
+    )
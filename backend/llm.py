@@ -0,0 +1,381 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Optional, Sequence, Tuple
+import asyncio
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import LLM_SECONDS, LLM_TOKENS
+from schedule import SKILLS, Schedule
+from upstream import UpstreamError
+
+# Practice plans written by a chat model
+#
+# The prompt is assembled from the practice request, its session schedule
+# and the best matching catalog drills, and kept under a token budget:
+# the request and schedule always fit, and the remaining tokens are shared
+# between the drills, whose descriptions are trimmed to their share (the
+# lowest ranked drills are dropped when even a short description would
+# not fit). Tokens are counted with tiktoken when it is installed and
+# estimated at four characters per token otherwise.
+#
+# Completions are cached in a SQLite file keyed by a hash of the model,
+# messages and sampling parameters, with a TTL and least recently used
+# eviction once the stored text exceeds max_bytes. Every call records its
+# tokens and latency, per model, in the metrics registry. Streamed plans
+# go through the same cache: a hit is sent as one piece, and a completed
+# stream is stored.
+
+SYSTEM_PROMPT = (
+    "You are an experienced youth sports coach. Write a practice plan in markdown with a "
+    "title, a short overview, one section per block of the given schedule with its "
+    "minutes, step-by-step drill instructions and coaching points, and a closing "
+    "reflection. Follow the schedule exactly and prefer the listed drills."
+)
+
+# Tokens the chat format adds around each message
+MESSAGE_OVERHEAD = 4
+# Shortest drill description worth sending; below this a drill is dropped
+MIN_DESCRIPTION_TOKENS = 16
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    # Imported on first use, since tiktoken is slow to import
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        print(f"Token encoding unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = "") -> int:
+    encoding = _encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return math.ceil(len(text) / 4)
+
+
+def trim_to_tokens(text: str, limit: int, model: str = "") -> str:
+    """text cut at a word boundary to at most limit tokens, marked with an ellipsis"""
+    if count_tokens(text, model) <= limit:
+        return text
+    encoding = _encoding(model)
+    # One token is kept for the ellipsis
+    if encoding is not None:
+        cut = encoding.decode(encoding.encode(text)[:max(0, limit - 1)])
+    else:
+        cut = text[:max(0, limit - 1) * 4]
+    if " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip(" ,.;:") + "…"
+
+
+@dataclass(frozen=True)
+class Prompt:
+    messages: Tuple[dict, ...]
+    tokens: int
+    drills: int
+    trimmed: int
+    dropped: int
+
+
+def _request_text(request, schedule: Schedule) -> str:
+    lines = [
+        f"Write a {schedule.duration}-minute {request.sport} practice plan.",
+        f"Focus: {request.focus}",
+        f"Age group: {request.ageGroup or 'All ages'}",
+        f"Skill level: {request.skillLevel or 'Mixed abilities'}",
+        f"Players: {request.playerCount or 'Flexible group size'}",
+    ]
+    if request.selectedDrills:
+        lines.append(f"Drills the coach wants included: {', '.join(request.selectedDrills)}")
+    lines.append("")
+    lines.append("Schedule (minutes from the start):")
+    for segment in schedule.segments:
+        line = f"- {segment.name}: {segment.start}-{segment.start + segment.minutes}"
+        if segment.name == SKILLS and schedule.rotations:
+            line += (f", {len(schedule.group_sizes)} groups of {'/'.join(map(str, schedule.group_sizes))}"
+                     f" rotating every {schedule.rotations[0].minutes} minutes")
+        elif segment.parts:
+            line += " (" + ", ".join(f"{part.name} {part.minutes}" for part in segment.parts) + ")"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def build_prompt(request, drills: Sequence, schedule: Schedule, max_tokens: int, model: str = "") -> Prompt:
+    """Chat messages for a practice request within about max_tokens prompt tokens
+
+    drills are DrillSearchResults, best matches first.
+    """
+    request_text = _request_text(request, schedule)
+    fixed = (count_tokens(SYSTEM_PROMPT, model) + count_tokens(request_text, model)
+             + 2 * MESSAGE_OVERHEAD + count_tokens("\n\nDrills to draw from:", model))
+    remaining = max_tokens - fixed
+
+    heads = [f"{i}. {drill.title} ({drill.source}): " for i, drill in enumerate(drills, 1)]
+    head_tokens = [count_tokens(head, model) + 1 for head in heads]
+    kept = len(drills)
+    # Drop the lowest ranked drills until each one left gets a useful share
+    while kept and remaining // kept < max(head_tokens[:kept]) + MIN_DESCRIPTION_TOKENS:
+        kept -= 1
+
+    lines = []
+    trimmed = 0
+    for i in range(kept):
+        share = remaining // (kept - i) - head_tokens[i]
+        description = " ".join(drills[i].description.split())
+        short = trim_to_tokens(description, share, model)
+        trimmed += short != description
+        lines.append(heads[i] + short)
+        # Tokens a short description did not use go to the drills after it
+        remaining -= head_tokens[i] + count_tokens(short, model)
+
+    user_text = request_text
+    if lines:
+        user_text += "\n\nDrills to draw from:\n" + "\n".join(lines)
+    messages = ({"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": user_text})
+    tokens = sum(count_tokens(message["content"], model) + MESSAGE_OVERHEAD for message in messages)
+    return Prompt(messages, tokens, kept, trimmed, len(drills) - kept)
+
+
+def completion_key(model: str, messages: Sequence[dict], params: dict) -> str:
+    canonical = json.dumps([model, list(messages), params], sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class CompletionCache:
+    """Completions in a local SQLite file, evicted by TTL and then least recently used
+    once the stored text exceeds max_bytes. Hit/miss counters are per process."""
+
+    def __init__(self, path: str, ttl: float = 7 * 86400, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            " key TEXT PRIMARY KEY, model TEXT NOT NULL, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL, used_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS completions_used_at ON completions (used_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Close this thread's connection; the next call opens a new one"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value FROM completions WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute("UPDATE completions SET used_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, model: str, value: dict) -> None:
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO completions (key, model, value, size, expires_at, used_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)", (key, model, data, len(data), now + self.ttl, now))
+        conn.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+        # Keep the most recently used entries that fit in max_bytes
+        self.evictions += conn.execute(
+            "DELETE FROM completions WHERE key IN (SELECT key FROM"
+            " (SELECT key, SUM(size) OVER (ORDER BY used_at DESC, key) AS total FROM completions)"
+            " WHERE total > ?)", (self.max_bytes,)).rowcount
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        entries, size = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions").fetchone()
+        return {
+            "entries": entries,
+            "bytes": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class PlanWriter:
+    """Writes practice plans with a chat model, through the completion cache"""
+
+    def __init__(self, client, cache: Optional[CompletionCache], model: str = "gpt-4o",
+                 max_prompt_tokens: int = 3000, max_completion_tokens: int = 1500,
+                 temperature: float = 0.7):
+        self.client = client
+        self.cache = cache
+        self.model = model
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_completion_tokens = max_completion_tokens
+        self.temperature = temperature
+        # model -> calls, cached, errors, prompt and completion tokens, seconds
+        self.usage: Dict[str, Dict[str, float]] = {}
+
+    def _usage(self, model: str) -> Dict[str, float]:
+        usage = self.usage.get(model)
+        if usage is None:
+            usage = self.usage[model] = dict.fromkeys(
+                ("calls", "cached", "errors", "prompt_tokens", "completion_tokens", "seconds"), 0)
+        return usage
+
+    def _prompt(self, request, drills: Sequence, schedule: Schedule) -> Tuple[Prompt, dict, str]:
+        prompt = build_prompt(request, drills, schedule, self.max_prompt_tokens, self.model)
+        params = {"max_tokens": self.max_completion_tokens, "temperature": self.temperature}
+        return prompt, params, completion_key(self.model, prompt.messages, params)
+
+    async def _cached(self, key: str) -> Optional[dict]:
+        if self.cache is None:
+            return None
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            self._usage(self.model)["cached"] += 1
+        return cached
+
+    async def write(self, request, drills: Sequence, schedule: Schedule) -> dict:
+        """{"text", "model", "usage", "cached"} for a practice request"""
+        prompt, params, key = self._prompt(request, drills, schedule)
+        usage = self._usage(self.model)
+        cached = await self._cached(key)
+        if cached is not None:
+            return dict(cached, cached=True)
+
+        start = time.perf_counter()
+        try:
+            response = await self.client.chat(list(prompt.messages), model=self.model, **params)
+            text = response["choices"][0]["message"]["content"]
+            if not text:
+                raise UpstreamError(f"Empty completion from {self.model}")
+        except (UpstreamError, KeyError, IndexError, TypeError, ValueError) as e:
+            LLM_SECONDS.observe(time.perf_counter() - start, self.model, "error")
+            usage["errors"] += 1
+            if isinstance(e, UpstreamError):
+                raise
+            raise UpstreamError(f"Malformed completion from {self.model}: {e}") from e
+        elapsed = time.perf_counter() - start
+        completion = self._completed(prompt, text, response.get("model", self.model),
+                                     response.get("usage") or {}, elapsed)
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.set, key, self.model, completion)
+        return dict(completion, cached=False)
+
+    async def stream(self, request, drills: Sequence, schedule: Schedule) -> AsyncIterator[str]:
+        """A practice plan's text in pieces, as the model writes it
+
+        Raises UpstreamError like write; once text has been yielded, the
+        caller has to deal with a plan that broke off.
+        """
+        prompt, params, key = self._prompt(request, drills, schedule)
+        cached = await self._cached(key)
+        if cached is not None:
+            yield cached["text"]
+            return
+
+        start = time.perf_counter()
+        pieces = []
+        model, reported = self.model, {}
+        try:
+            async for chunk in self.client.chat_stream(list(prompt.messages), model=self.model, **params):
+                model = chunk.get("model") or model
+                reported = chunk.get("usage") or reported
+                for choice in chunk.get("choices") or ():
+                    piece = (choice.get("delta") or {}).get("content")
+                    if piece:
+                        pieces.append(piece)
+                        yield piece
+            if not pieces:
+                raise UpstreamError(f"Empty completion from {self.model}")
+        except (UpstreamError, AttributeError, TypeError) as e:
+            LLM_SECONDS.observe(time.perf_counter() - start, self.model, "error")
+            self._usage(self.model)["errors"] += 1
+            if isinstance(e, UpstreamError):
+                raise
+            raise UpstreamError(f"Malformed completion from {self.model}: {e}") from e
+        completion = self._completed(prompt, "".join(pieces), model, reported, time.perf_counter() - start)
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.set, key, self.model, completion)
+
+    def _completed(self, prompt: Prompt, text: str, model: str, reported: dict, elapsed: float) -> dict:
+        """Record a finished completion's usage and return it in cache form"""
+        usage = self._usage(self.model)
+        prompt_tokens = reported.get("prompt_tokens", prompt.tokens)
+        completion_tokens = reported.get("completion_tokens", count_tokens(text, self.model))
+        LLM_SECONDS.observe(elapsed, self.model, "ok")
+        LLM_TOKENS.observe(prompt_tokens, self.model, "prompt")
+        LLM_TOKENS.observe(completion_tokens, self.model, "completion")
+        usage["calls"] += 1
+        usage["prompt_tokens"] += prompt_tokens
+        usage["completion_tokens"] += completion_tokens
+        usage["seconds"] += elapsed
+        return {
+            "text": text,
+            "model": model,
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "seconds": round(elapsed, 3), "drills": prompt.drills, "trimmed": prompt.trimmed},
+        }
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model,
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "usage": {model: dict(usage) for model, usage in self.usage.items()},
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+def create_plan_writer(client) -> Optional[PlanWriter]:
+    """Writer configured by PLAN_GENERATOR (templates or openai), OPENAI_MODEL,
+    LLM_MAX_PROMPT_TOKENS, LLM_MAX_COMPLETION_TOKENS, LLM_TEMPERATURE and
+    LLM_CACHE_PATH, LLM_CACHE_TTL and LLM_CACHE_MAX_BYTES ("off" path disables
+    the cache); None when plans come from the templates"""
+    if client is None or os.getenv("PLAN_GENERATOR", "templates") != "openai":
+        return None
+    path = os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite3")
+    cache = None
+    if path != "off":
+        cache = CompletionCache(
+            path,
+            float(os.getenv("LLM_CACHE_TTL", str(7 * 86400))),
+            int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+        )
+    return PlanWriter(
+        client,
+        cache,
+        os.getenv("OPENAI_MODEL", "gpt-4o"),
+        int(os.getenv("LLM_MAX_PROMPT_TOKENS", "3000")),
+        int(os.getenv("LLM_MAX_COMPLETION_TOKENS", "1500")),
+        float(os.getenv("LLM_TEMPERATURE", "0.7")),
+    )
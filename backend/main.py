@@ -1,18 +1,41 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field
+from typing import Annotated, Dict, Iterable, List, Optional
+import asyncio
+import hmac
+import math
 import os
 from dotenv import load_dotenv
-import requests
-import json
 from datetime import datetime
 
+from adaptation import ADAPTATIONS, adaptation_for
+from auth import AuthError, create_token_verifier
+from catalog import Drill, DrillCatalog, catalog_store
+from coalesce import SingleFlight
+from jobs import JobLimitExceeded, create_job_queue
+from llm import create_plan_writer
+from metrics import MetricsMiddleware, registry, timed
+from plan_cache import GENERATED_SLOT, bind_generated, cache_key, create_plan_cache, generated_timestamp
+from plan_model import MEDIA_TYPE_FOR, UnknownSection, negotiate_format, parse_plan, parse_sections, render_plan
+from plan_templates import sample_output, slot_values, template_for
+from profiling import ProfilingMiddleware, create_profiler
+from ratelimit import LIMITS, create_rate_limiter
+from retrieval import best_matching_drills
+from schedule import COOLDOWN, GAMES, MIN_DURATION, SKILLS, WARMUP, Schedule, schedule_session
+from search import drill_index
+from storage import InvalidCursor, InvalidPlan, create_plan_repository, plan_detail
+from writebehind import SaveQueueFull, WriteBehindRepository, create_write_behind
+from transport import JSON_RESPONSE_CLASS, TransportMiddleware, json_dumps
+from upstream import OpenAIClient, TavilyClient, UpstreamError
+
 # Load environment variables from .env file
 load_dotenv()
 
-app = FastAPI(title="HeadCoachAI Backend", version="1.0.0")
+app = FastAPI(title="HeadCoachAI Backend", version="1.0.0", default_response_class=JSON_RESPONSE_CLASS)
 
 # CORS middleware
 app.add_middleware(
@@ -21,21 +44,86 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Location"],
 )
 
+# Sampled request profiling, off unless PROFILE_SAMPLE_RATE or the admin endpoint enables it
+profiler = create_profiler()
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Compressed responses and ETag revalidation (304) for GET responses
+app.add_middleware(TransportMiddleware, minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "512")))
+
+# Request metrics, outermost so they include the other middleware
+app.add_middleware(MetricsMiddleware)
+
 # Environment variables
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+TAVILY_BASE_URL = os.getenv("TAVILY_BASE_URL", "https://api.tavily.com")
+
+# Outbound API clients, only created when their key is configured
+tavily_client = TavilyClient(TAVILY_API_KEY, TAVILY_BASE_URL) if TAVILY_API_KEY else None
+openai_client = OpenAIClient(OPENAI_API_KEY, OPENAI_BASE_URL) if OPENAI_API_KEY else None
+
+# Practice plans written by the chat model when PLAN_GENERATOR=openai; None renders the templates
+plan_writer = create_plan_writer(openai_client)
 
 # Security
 security = HTTPBearer()
 
+# Access token verification; None when no signing keys are configured
+token_verifier = create_token_verifier()
+
+# Rendered practice plans, keyed on the canonical request
+plan_cache = create_plan_cache()
+
+# Saved practice plans, written in batches behind a local log when SAVE_MODE=write-behind
+plan_repository = create_write_behind(create_plan_repository(sample_output().encode()))
+
+# Per-user token buckets for the generation endpoints; None when disabled
+rate_limiter = create_rate_limiter()
+
+# Identical concurrent drill searches and plan generations share one call
+inflight = SingleFlight()
+
+# Seconds between checks for a changed drill catalog file
+CATALOG_RELOAD_INTERVAL = float(os.getenv("CATALOG_RELOAD_INTERVAL", "5"))
+
+# Batch generation limits
+BATCH_MAX_PRACTICES = int(os.getenv("BATCH_MAX_PRACTICES", "200"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+# Longest a job status request may wait for the job to finish
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+
+# Longest practice session a request may ask for, in minutes
+MAX_DURATION = int(os.getenv("MAX_PRACTICE_MINUTES", "480"))
+
 # Pydantic models
 
 
+def check_duration(value: str) -> str:
+    """Empty (60 minutes) or a whole number of minutes the scheduler can fill"""
+    if not value:
+        return value
+    try:
+        minutes = int(value)
+    except ValueError:
+        raise ValueError("duration must be a whole number of minutes")
+    if not MIN_DURATION <= minutes <= MAX_DURATION:
+        raise ValueError(f"duration must be between {MIN_DURATION} and {MAX_DURATION} minutes")
+    return value
+
+
+Duration = Annotated[str, AfterValidator(check_duration)]
+
+
 class PracticeRequest(BaseModel):
     sport: str
-    duration: str
+    duration: Duration
     playerCount: Optional[str] = None
     ageGroup: Optional[str] = None
     skillLevel: Optional[str] = None
@@ -43,13 +131,37 @@ class PracticeRequest(BaseModel):
     selectedDrills: List[str] = []
 
 
+class SeasonSpec(BaseModel):
+    sport: str
+    duration: Duration
+    sessions: int = Field(ge=1, le=BATCH_MAX_PRACTICES)
+    focuses: List[str]
+    playerCount: Optional[str] = None
+    ageGroup: Optional[str] = None
+    skillLevel: Optional[str] = None
+    selectedDrills: List[str] = []
+
+
+class BatchPracticeRequest(BaseModel):
+    practices: List[PracticeRequest] = []
+    season: Optional[SeasonSpec] = None
+
+
 class DrillSearchResult(BaseModel):
+    # Shared between requests, so instances must never be mutated
+    model_config = ConfigDict(frozen=True)
+
     title: str
     description: str
     source: str
     url: Optional[str] = None
 
 
+class ProfilingSettings(BaseModel):
+    sample_rate: float
+    interval: Optional[float] = None
+
+
 class PracticePlan(BaseModel):
     title: str
     sport: str
@@ -60,15 +172,17 @@ class PracticePlan(BaseModel):
     selected_drills: List[str] = []
     generated_plan: str
 
-# Auth dependency (simplified for now)
+# Auth dependency
 
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    try:
-        # For now, we'll skip auth verification and return a mock user
-        # In production, you'd verify the JWT token with Supabase
+    if token_verifier is None:
+        # Authentication is not configured (local development): every
+        # request acts as the same mock user
         return {"id": "mock-user-id", "email": "test@example.com"}
-    except Exception as e:
+    try:
+        return await token_verifier.verify(credentials.credentials)
+    except AuthError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid authentication credentials",
@@ -76,6 +190,95 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         )
 
 
+async def call_store(store, method: str, *args):
+    """Call a cache or rate limiter method, from a thread when the store can block on SQLite locks"""
+    function = getattr(store, method)
+    if store.blocking:
+        return await asyncio.to_thread(function, *args)
+    return function(*args)
+
+
+async def enforce_rate_limit(user: dict, name: str, cost: float = 1) -> None:
+    """Spend cost units of the user's budget for name, or raise a 429"""
+    limit = LIMITS.get(name)
+    if rate_limiter is None or limit is None:
+        return
+    retry_after = await call_store(rate_limiter, "acquire", limit, user["id"], cost)
+    if retry_after:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded, retry in {math.ceil(retry_after)} seconds",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+def rate_limited(name: str):
+    """Dependency returning the current user after charging one unit of name"""
+    async def limited_user(user=Depends(get_current_user)):
+        await enforce_rate_limit(user, name)
+        return user
+    return limited_user
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints take the ADMIN_TOKEN in X-Admin-Token; without one they are disabled"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin endpoints are disabled")
+    # compare_digest only takes ASCII str, and header values are latin-1
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+
+@app.on_event("startup")
+async def start_catalog_watcher():
+    asyncio.create_task(watch_catalog())
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    job_queue.start()
+
+
+@app.on_event("startup")
+async def start_save_writer():
+    # Adopts saves left unwritten by a worker that died
+    if isinstance(plan_repository, WriteBehindRepository):
+        await run_in_threadpool(plan_repository.start)
+
+
+async def watch_catalog():
+    """Reload the drill catalog when its compiled file changes"""
+    while True:
+        await asyncio.sleep(CATALOG_RELOAD_INTERVAL)
+        try:
+            if catalog_store.refresh():
+                print(f"Drill catalog reloaded: {len(catalog_store.catalog.drills)} drills")
+        except Exception as e:
+            print(f"Error reloading drill catalog: {e}")
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    await job_queue.stop()
+    for client in (tavily_client, openai_client, token_verifier):
+        if client is not None:
+            await client.aclose()
+    plan_repository.close()
+
+
+def release_connections() -> None:
+    """Close the database connections opened at import; each store reopens on next use
+
+    The prefork server (serve.py) calls this before forking, so workers
+    never share a SQLite connection.
+    """
+    plan_repository.close()
+    job_queue.store.close()
+    for store in (plan_cache, rate_limiter, plan_writer.cache if plan_writer is not None else None):
+        if hasattr(store, "close"):
+            store.close()
+
+
 @app.get("/")
 async def root():
     return {"message": "HeadCoachAI Backend API", "version": "1.0.0", "status": "running"}
@@ -83,7 +286,104 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow().isoformat(),
+        "plan_cache": await call_store(plan_cache, "stats"),
+        "inflight": inflight.stats(),
+        "auth": token_verifier.stats() if token_verifier is not None else None,
+        "rate_limit": await call_store(rate_limiter, "stats") if rate_limiter is not None else None,
+        "jobs": await run_in_threadpool(job_queue.stats),
+        "llm": await run_in_threadpool(plan_writer.stats) if plan_writer is not None else None,
+        "saves": plan_repository.stats() if isinstance(plan_repository, WriteBehindRepository) else None,
+    }
+
+
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    """Metrics for this worker in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/admin/profiling", dependencies=[Depends(require_admin)])
+async def get_profiling() -> dict:
+    return profiler.stats()
+
+
+@app.put("/api/admin/profiling", dependencies=[Depends(require_admin)])
+async def configure_profiling(settings: ProfilingSettings) -> dict:
+    """Profile a sample of generate and search requests; a sample_rate of 0 turns it off
+
+    Every worker picks the settings up within a second; the counts in the
+    response are for the worker that served it.
+    """
+    try:
+        profiler.publish(settings.sample_rate, settings.interval)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        print(f"Error saving profiling settings: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to save profiling settings: {str(e)}")
+    return profiler.stats()
+
+
+def _cache_samples(name: str, cache):
+    def samples():
+        if cache is None:
+            return
+        # The counters, not stats(): that can query a shared cache
+        yield name, {"result": "hit"}, cache.hits
+        yield name, {"result": "miss"}, cache.misses
+    return samples
+
+
+def _coalesced_samples():
+    stats = inflight.stats()
+    yield "headcoach_coalesced_calls_total", {"result": "started"}, stats["started"]
+    yield "headcoach_coalesced_calls_total", {"result": "shared"}, stats["shared"]
+
+
+def _rate_limit_samples():
+    if rate_limiter is None:
+        return
+    # The counters, not stats(): that can query a shared limiter
+    for result, counts in (("allowed", rate_limiter.allowed), ("limited", rate_limiter.limited)):
+        for name, count in dict(counts).items():
+            yield "headcoach_rate_limit_decisions_total", {"limit": name, "result": result}, count
+
+
+registry.collector(
+    "headcoach_plan_cache_lookups_total", "counter", "Plan cache lookups by result",
+    _cache_samples("headcoach_plan_cache_lookups_total", plan_cache))
+registry.collector(
+    "headcoach_token_cache_lookups_total", "counter", "Verified token cache lookups by result",
+    _cache_samples("headcoach_token_cache_lookups_total", token_verifier))
+registry.collector(
+    "headcoach_llm_cache_lookups_total", "counter", "Chat completion cache lookups by result",
+    _cache_samples("headcoach_llm_cache_lookups_total", plan_writer.cache if plan_writer is not None else None))
+registry.collector(
+    "headcoach_coalesced_calls_total", "counter", "Searches and generations started or shared", _coalesced_samples)
+registry.collector(
+    "headcoach_rate_limit_decisions_total", "counter", "Rate limit checks by limit and result", _rate_limit_samples)
+registry.collector(
+    "headcoach_jobs", "gauge", "Stored background jobs by status",
+    lambda: [("headcoach_jobs", {"status": name}, count) for name, count in job_queue.store.counts().items()])
+if isinstance(plan_repository, WriteBehindRepository):
+    registry.collector(
+        "headcoach_save_queue_depth", "gauge", "Saves acknowledged but not yet written",
+        lambda: [("headcoach_save_queue_depth", {}, plan_repository.stats()["depth"])])
+    registry.collector(
+        "headcoach_save_queue_oldest_seconds", "gauge", "Age of the oldest save not yet written",
+        lambda: [("headcoach_save_queue_oldest_seconds", {}, plan_repository.stats()["oldest_seconds"])])
+    registry.collector(
+        "headcoach_saves_rejected_total", "counter", "Saves refused because the write-behind queue was full",
+        lambda: [("headcoach_saves_rejected_total", {}, plan_repository.rejected)])
+    registry.collector(
+        "headcoach_saves_dead_lettered_total", "counter", "Saves the database refused, moved to the dead-letter file",
+        lambda: [("headcoach_saves_dead_lettered_total", {}, plan_repository.dead_lettered)])
+registry.collector(
+    "headcoach_catalog_drills", "gauge", "Drills in the loaded catalog",
+    lambda: [("headcoach_catalog_drills", {}, len(catalog_store.catalog.drills))])
 
 
 @app.post("/api/search-drills")
@@ -96,463 +396,342 @@ async def search_drills(
 ) -> List[DrillSearchResult]:
     """Search for sports drills using Tavily API"""
     try:
-        # For now, return enhanced fallback drills
-        return get_enhanced_drills(sport, focus, age_group, skill_level)
+        if tavily_client is not None:
+            key = ("search-drills",) + search_key(sport, focus, age_group, skill_level)
+            drills = await inflight.do(
+                key, lambda: tavily_client.search_drills(sport, focus, age_group, skill_level))
+            if drills:
+                return [DrillSearchResult(**drill) for drill in drills]
+        return search_catalog(sport, focus, age_group)
+    except UpstreamError as e:
+        print(f"Drill search unavailable, using drill catalog: {e}")
+        return search_catalog(sport, focus, age_group)
     except Exception as e:
         print(f"Error searching drills: {e}")
-        return get_enhanced_drills(sport, focus, age_group, skill_level)
+        return search_catalog(sport, focus, age_group)
+
+
+@app.get("/api/drills/suggest")
+async def suggest_drills(
+    q: str,
+    sport: Optional[str] = None,
+    limit: int = Query(8, ge=1, le=50),
+    user=Depends(get_current_user)
+) -> List[str]:
+    """Drill titles matching a partially typed query"""
+    return drill_index.suggest(q, limit=limit, sport=sport)
+
+
+def search_key(sport: str, focus: str, age_group: str = "", skill_level: str = "") -> tuple:
+    """Normalized drill search parameters; web search ignores case and spacing"""
+    return tuple(" ".join((value or "").lower().split()) for value in (sport, focus, age_group, skill_level))
+
+
+def _drill_result(drill: Drill, description: str) -> DrillSearchResult:
+    return DrillSearchResult.model_construct(
+        title=drill.title,
+        description=description,
+        source=drill.source,
+        url=drill.url,
+    )
+
+
+def _drill_views(catalog: DrillCatalog) -> dict:
+    """Per adaptation, each drill's shared result or its adapted description parts"""
+    views = {}
+    for adaptation in ADAPTATIONS:
+        views[adaptation] = {
+            drill: (_drill_result(drill, catalog.describe(drill, "", adaptation))
+                    if not drill.has_focus_slot else catalog.adapted_parts(drill, adaptation))
+            for drill in catalog.drills
+        }
+    return views
+
+
+# Drills whose description does not depend on the request's focus are
+# rendered once per adaptation when the catalog loads and shared between
+# requests. The others keep their adapted text around the focus slot, so
+# a request only adapts its focus string once.
+_drill_view_table = _drill_views(catalog_store.catalog)
+
+
+def _catalog_reloaded(catalog: DrillCatalog) -> None:
+    global _drill_view_table
+    _drill_view_table = _drill_views(catalog)
+    # Cached plans name drills from the previous catalog
+    plan_cache.clear()
+
+
+catalog_store.on_reload(_catalog_reloaded)
+
+
+def drill_results(drills: Iterable[Drill], focus: str, age_group: str = "") -> List[DrillSearchResult]:
+    """Catalog drills customized for the request's focus and age group"""
+    adaptation = adaptation_for(age_group)
+    views = _drill_view_table[adaptation]
+    adapted_focus = None
+    results = []
+    for drill in drills:
+        view = views.get(drill)
+        if view is None:
+            # Drill added after the views were built
+            view = _drill_result(drill, catalog_store.catalog.describe(drill, focus, adaptation))
+        elif isinstance(view, tuple):
+            if adapted_focus is None:
+                adapted_focus = adaptation.apply(focus)
+            view = _drill_result(drill, adapted_focus.join(view))
+        results.append(view)
+    return results
 
 
 def get_enhanced_drills(sport: str, focus: str, age_group: str = "", skill_level: str = "") -> List[DrillSearchResult]:
-    """Enhanced drill database with more comprehensive options"""
-
-    # Base drills for each sport
-    drill_database = {
-        "soccer": [
-            DrillSearchResult(
-                title="Progressive Passing Circuit",
-                description=f"Multi-station passing drill focusing on {focus}. Players rotate through short, medium, and long passing stations with increasing difficulty.",
-                source="soccer-coaching-weekly"
-            ),
-            DrillSearchResult(
-                title="1v1 Attacking & Defending",
-                description="Dynamic 1v1 scenarios in a 20x15 yard box. Attacker tries to score while defender works on positioning and tackling technique.",
-                source="uefa-coaching"
-            ),
-            DrillSearchResult(
-                title="Ball Mastery Stations",
-                description="Technical skill circuit with cone weaving, ball juggling, and close control exercises. Perfect for developing touch and confidence.",
-                source="coerver-coaching"
-            ),
-            DrillSearchResult(
-                title="Small-Sided Games (4v4)",
-                description="Conditioned games emphasizing quick passing, movement off the ball, and decision-making in tight spaces.",
-                source="fa-coaching"
-            ),
-            DrillSearchResult(
-                title="Shooting Technique Progression",
-                description="Systematic shooting practice from stationary ball to moving ball scenarios. Focus on placement, power, and technique.",
-                source="soccer-specific"
-            ),
-            DrillSearchResult(
-                title="Defensive Shape & Pressing",
-                description="Team defensive drill working on compact shape, communication, and coordinated pressing triggers.",
-                source="tactical-soccer"
-            )
-        ],
-        "basketball": [
-            DrillSearchResult(
-                title="Triple Threat Position",
-                description=f"Fundamental stance work focusing on {focus}. Players practice jab steps, shot fakes, and drive moves from triple threat.",
-                source="basketball-hq"
-            ),
-            DrillSearchResult(
-                title="Dribbling Gauntlet",
-                description="Multi-cone dribbling course with crossovers, between-legs, and behind-back moves. Builds ball handling confidence.",
-                source="breakthrough-basketball"
-            ),
-            DrillSearchResult(
-                title="Form Shooting Progression",
-                description="Systematic shooting development starting close to basket. Focus on arc, follow-through, and consistent mechanics.",
-                source="shooting-coach"
-            ),
-            DrillSearchResult(
-                title="Defensive Slides & Closeouts",
-                description="Footwork drill for defensive positioning. Practice lateral movement, proper stance, and closing out on shooters.",
-                source="defensive-basketball"
-            ),
-            DrillSearchResult(
-                title="3-Man Weave",
-                description="Classic passing and cutting drill. Develops court vision, timing, and unselfish play in transition.",
-                source="fundamental-basketball"
-            ),
-            DrillSearchResult(
-                title="Rebounding Box-Out",
-                description="Contact drill teaching proper box-out technique and aggressive rebounding mentality.",
-                source="rebounding-fundamentals"
-            )
-        ],
-        "baseball": [
-            DrillSearchResult(
-                title="Tee Work Progression",
-                description=f"Hitting fundamentals focusing on {focus}. Progress from tee to soft toss to live pitching with emphasis on mechanics.",
-                source="baseball-positive"
-            ),
-            DrillSearchResult(
-                title="Fielding Fundamentals",
-                description="Ground ball and fly ball practice with proper footwork, glove positioning, and throwing mechanics.",
-                source="little-league"
-            ),
-            DrillSearchResult(
-                title="Throwing Accuracy Circuit",
-                description="Progressive throwing drill with targets at various distances. Focus on proper grip, stride, and follow-through.",
-                source="throwing-program"
-            ),
-            DrillSearchResult(
-                title="Base Running Technique",
-                description="Proper running form, base rounding, and sliding technique. Include reading coaches and situational awareness.",
-                source="baserunning-academy"
-            ),
-            DrillSearchResult(
-                title="Catching Fundamentals",
-                description="Stance, framing, and blocking drills for catchers. Include throwing to second base and game situation practice.",
-                source="catching-101"
-            ),
-            DrillSearchResult(
-                title="Pitching Mechanics",
-                description="Step-by-step pitching instruction focusing on balance, stride, and arm action. Age-appropriate pitch counts.",
-                source="pitching-coach"
-            )
-        ],
-        "volleyball": [
-            DrillSearchResult(
-                title="Platform Passing",
-                description=f"Fundamental passing technique focusing on {focus}. Work on proper platform angle and ball control.",
-                source="volleyball-1on1"
-            ),
-            DrillSearchResult(
-                title="Setting Footwork",
-                description="Proper setter positioning and hand technique. Practice quick sets, back sets, and communication.",
-                source="setting-secrets"
-            ),
-            DrillSearchResult(
-                title="Attacking Approach",
-                description="Three-step and four-step approach patterns. Focus on timing, jump technique, and arm swing.",
-                source="volleyball-advantage"
-            ),
-            DrillSearchResult(
-                title="Serving Progression",
-                description="Underhand to overhand serving development. Target practice and consistency training.",
-                source="serving-ace"
-            ),
-            DrillSearchResult(
-                title="Blocking Technique",
-                description="Proper hand position, timing, and footwork for effective blocking at the net.",
-                source="blocking-clinic"
-            ),
-            DrillSearchResult(
-                title="Pepper Drill Variations",
-                description="Classic control drill with modifications for different skill levels. Builds ball control and communication.",
-                source="volleyball-drills"
-            )
-        ],
-        "flag-football": [
-            DrillSearchResult(
-                title="Route Running Precision",
-                description=f"Detailed route practice focusing on {focus}. Work on cuts, timing, and catching technique.",
-                source="flag-football-plays"
-            ),
-            DrillSearchResult(
-                title="Flag Pulling Technique",
-                description="Proper defensive positioning and flag removal. Practice angles and pursuit drills.",
-                source="youth-flag-football"
-            ),
-            DrillSearchResult(
-                title="Quarterback Mechanics",
-                description="Throwing fundamentals including grip, stance, and follow-through. Practice with moving targets.",
-                source="qb-development"
-            ),
-            DrillSearchResult(
-                title="Center-QB Exchange",
-                description="Snap timing and quarterback footwork. Practice under center and shotgun formations.",
-                source="football-fundamentals"
-            ),
-            DrillSearchResult(
-                title="Agility & Footwork",
-                description="Cone drills, ladder work, and change of direction exercises specific to flag football movement.",
-                source="speed-agility"
-            ),
-            DrillSearchResult(
-                title="7v7 Scrimmage",
-                description="Game-like situations with modified rules. Focus on strategy, communication, and sportsmanship.",
-                source="flag-football-games"
-            )
-        ]
+    """Drills for a sport, customized for the request's focus and age group"""
+    with timed("drills"):
+        return drill_results(catalog_store.catalog.by_sport(sport), focus, age_group)
+
+
+def search_catalog(sport: str, focus: str, age_group: str = "") -> List[DrillSearchResult]:
+    """Catalog drills for a sport, best matches for the focus first, worded
+    for the age group"""
+    drills = drill_index.rank(focus, sport=sport)
+    return drill_results(drills, focus, age_group)
+
+
+def drill_inspiration(request: PracticeRequest) -> List[str]:
+    """Titles of the catalog drills most relevant to the request's focus"""
+    with timed("inspiration"):
+        return [drill.title for drill in best_matching_drills(request.focus, request.sport, k=2)]
+
+
+def practice_schedule(request: PracticeRequest) -> Schedule:
+    """Session schedule for the request's duration, focus and player count"""
+    duration = int(request.duration) if request.duration else 60
+    return schedule_session(duration, request.focus, request.playerCount)
+
+
+def plan_values(request: PracticeRequest, inspiration: List[str], schedule: Schedule) -> dict:
+    """Slot values for the practice plan templates"""
+    values = {
+        "sport_title": request.sport.title(),
+        "duration": schedule.duration,
+        "focus": request.focus,
+        "age_group": request.ageGroup or 'All ages',
+        "skill_level": request.skillLevel or 'Mixed abilities',
+        "players": request.playerCount or 'Flexible group size',
+        "generated": GENERATED_SLOT,
+        "warmup_time": schedule.segment(WARMUP).minutes,
+        "warmup_general_time": schedule.part(WARMUP, "general").minutes,
+        "warmup_activation_time": schedule.part(WARMUP, "activation").minutes,
+        "skill_time": schedule.segment(SKILLS).minutes,
+        "skill_station_time": schedule.rotations[0].minutes,
+        "game_time": schedule.segment(GAMES).minutes,
+        "game_half_time": schedule.part(GAMES, "small_sided").minutes,
+        "cooldown_time": schedule.segment(COOLDOWN).minutes,
+        "cooldown_recovery_time": schedule.part(COOLDOWN, "recovery").minutes,
+        "cooldown_reflection_time": schedule.part(COOLDOWN, "reflection").minutes,
+        "drill_1_title": inspiration[0] if inspiration else 'Progressive Skill Building',
+        "drill_2_title": inspiration[1] if len(inspiration) > 1 else 'Competitive Application',
     }
+    return slot_values(values)
+
+
+def render_practice_plan(request: PracticeRequest) -> dict:
+    """Render a practice plan with the generation time left as GENERATED_SLOT"""
+    # Get relevant drills for context
+    relevant_drills = get_enhanced_drills(
+        request.sport, request.focus, request.ageGroup, request.skillLevel)
+
+    template = template_for(request.sport)
+    schedule = practice_schedule(request)
+    values = plan_values(request, drill_inspiration(request), schedule)
+    with timed("render"):
+        practice_plan = template.render(values, request.selectedDrills)
+
+    return {
+        "generated_plan": practice_plan,
+        "web_drills_found": len(relevant_drills),
+        "sources_used": [drill.source for drill in relevant_drills[:3]],
+        "schedule": schedule.as_dict(),
+    }
+
 
-    base_drills = drill_database.get(sport, [])
+async def write_practice_plan(request: PracticeRequest) -> dict:
+    """Practice plan written by the chat model, or rendered from the templates
+    when no model is configured or the model is unavailable"""
+    result = render_practice_plan(request)
+    if plan_writer is None:
+        return result
+    drills = search_catalog(request.sport, request.focus, request.ageGroup or "")
+    try:
+        with timed("llm"):
+            completion = await plan_writer.write(request, drills, practice_schedule(request))
+    except UpstreamError as e:
+        print(f"Plan writer unavailable, using templates: {e}")
+        return result
+    result["generated_plan"] = completion["text"]
+    return result
+
+
+async def generate_and_cache(request: PracticeRequest, key: str) -> dict:
+    result = await write_practice_plan(request)
+    await call_store(plan_cache, "set", key, result)
+    return result
+
+
+async def cached_practice_plan(request: PracticeRequest, key: Optional[str] = None) -> dict:
+    """Practice plan from the cache, or generated once for concurrent callers"""
+    key = key or cache_key(request)
+    result = await call_store(plan_cache, "get", key)
+    if result is None:
+        result = await inflight.do(("generate-practice", key), lambda: generate_and_cache(request, key))
+    return result
 
-    # Customize drills based on age group and skill level
-    if age_group:
-        for drill in base_drills:
-            if "u8" in age_group.lower() or "u10" in age_group.lower():
-                drill.description = drill.description.replace(
-                    "Focus on", "Simple focus on").replace("Practice", "Fun practice with")
-            elif "u16" in age_group.lower() or "u18" in age_group.lower():
-                drill.description = drill.description.replace(
-                    "Practice", "Advanced practice with").replace("Focus on", "Intensive focus on")
 
-    return base_drills
+def plan_format(http_request: Request, format: Optional[str]) -> str:
+    """Plan format from the format parameter or the Accept header"""
+    try:
+        return negotiate_format(http_request.headers.get("accept", ""), format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def render_sections(markdown: str, fmt: str, names: List[str], generated: str = "") -> str:
+    try:
+        return render_plan(parse_plan(markdown), fmt, names, generated)
+    except UnknownSection as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def negotiated_plan(result: dict, fmt: str, names: List[str], generated: str = "") -> object:
+    """A generate or saved plan response in the negotiated format
+
+    JSON keeps the usual response, with generated_plan limited to the
+    selected sections; other formats are the plan document alone.
+    """
+    if fmt == "json":
+        return dict(result, generated_plan=render_sections(result["generated_plan"], "markdown", names, generated))
+    return Response(
+        render_sections(result["generated_plan"], fmt, names, generated),
+        media_type=MEDIA_TYPE_FOR[fmt],
+        headers={"Vary": "Accept"},
+    )
 
 
 @app.post("/api/generate-practice")
 async def generate_practice_plan(
     request: PracticeRequest,
-    user=Depends(get_current_user)
+    http_request: Request,
+    response: Response,
+    format: Optional[str] = None,
+    sections: Optional[str] = None,
+    user=Depends(rate_limited("generate"))
 ) -> dict:
-    """Generate comprehensive AI-powered practice plan"""
+    """Generate comprehensive AI-powered practice plan
+
+    JSON by default; the Accept header or the format parameter selects
+    markdown, html or plan (a structured plan as compact JSON,
+    application/vnd.headcoach.plan+json). sections limits the plan to some
+    of its sections, e.g. "warmup,skills".
+    """
+    fmt = plan_format(http_request, format)
+    names = parse_sections(sections)
+    response.headers["Vary"] = "Accept"
     try:
-        # Enhanced practice plan generation
-        sport_title = request.sport.title()
-        duration = int(request.duration) if request.duration else 60
+        result = await cached_practice_plan(request)
+    except Exception as e:
+        print(f"Error generating practice plan: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to generate practice plan: {str(e)}"
+        )
+    if fmt == "json" and not names:
+        return bind_generated(result)
+    return negotiated_plan(result, fmt, names, generated_timestamp())
 
-        # Get relevant drills for context
-        relevant_drills = get_enhanced_drills(
-            request.sport, request.focus, request.ageGroup, request.skillLevel)
 
-        # Calculate time segments based on best practices
-        warmup_time = max(8, duration // 8)
-        skill_time = max(20, duration // 2.5)
-        game_time = max(15, duration // 3)
-        cooldown_time = max(5, duration // 10)
-
-        # Generate comprehensive practice plan
-        practice_plan = f"""# 🏆 HeadCoachAI Practice Plan - {sport_title}
-
-## 📋 Practice Overview
-- **Sport**: {sport_title}
-- **Duration**: {duration} minutes
-- **Primary Focus**: {request.focus}
-- **Age Group**: {request.ageGroup or 'All ages'}
-- **Skill Level**: {request.skillLevel or 'Mixed abilities'}
-- **Players**: {request.playerCount or 'Flexible group size'}
-- **Generated**: {datetime.now().strftime('%B %d, %Y at %I:%M %p')}
-
----
-
-## 🔥 Dynamic Warm-Up ({warmup_time} minutes)
-**Objective**: Activate muscles, prevent injuries, and prepare for {request.focus}
-
-### General Movement (4 minutes)
-- **Light jogging** around playing area (2 minutes)
-- **Dynamic stretching sequence**:
-  - Leg swings (forward/back, side to side)
-  - Arm circles and shoulder rolls
-  - High knees and butt kicks
-  - Walking lunges with rotation
-
-### Sport-Specific Activation ({warmup_time-4} minutes)
-- **{sport_title} movement patterns** at 50% intensity
-- **Ball familiarization** (if applicable)
-- **Partner warm-up activities**
-- **Gradual intensity increase** leading into main session
-
-**🎯 Coaching Focus**: 
-- Check for any physical concerns or injuries
-- Build positive energy and team communication
-- Emphasize proper movement mechanics
-- Set the tone for focused, fun practice
-
----
-
-## ⚡ Technical Skills Development ({skill_time} minutes)
-**Primary Focus**: {request.focus}
-
-### Station 1: Fundamental Technique ({skill_time//2} minutes)
-**Drill Inspiration**: {relevant_drills[0].title if relevant_drills else 'Progressive Skill Building'}
-
-- **Individual skill work** with immediate feedback
-- **Progressive difficulty** from basic to advanced
-- **Repetition with purpose** - quality over quantity
-- **Peer coaching opportunities** for advanced players
-
-**Key Teaching Points**:
-- Break down complex skills into simple components
-- Use positive reinforcement and specific feedback
-- Demonstrate proper technique multiple times
-- Allow for individual learning pace differences
-
-### Station 2: Applied Skills Under Pressure ({skill_time//2} minutes)
-**Drill Inspiration**: {relevant_drills[1].title if len(relevant_drills) > 1 else 'Competitive Application'}
-
-- **Small group challenges** (2-4 players)
-- **Add time pressure and decision-making**
-- **Competitive elements** to maintain engagement
-- **Rotate roles** to develop different perspectives
-
-**Key Teaching Points**:
-- Encourage risk-taking and creativity
-- Focus on decision-making speed
-- Celebrate effort and improvement
-- Connect skills to game situations
-
----
-
-## 🎮 Game Application & Scrimmage ({game_time} minutes)
-**Objective**: Apply skills in realistic game scenarios
-
-### Small-Sided Games ({game_time//2} minutes)
-**Format**: Modified games (3v3, 4v4, or 5v5 depending on sport)
-
-- **Reduced playing area** for increased touches
-- **Modified rules** to emphasize {request.focus}
-- **Multiple games simultaneously** for maximum participation
-- **Quick rotations** every 3-4 minutes
-
-**Rule Modifications for {request.focus}**:
-- Bonus points for demonstrating focus skills
-- Mandatory touches or passes before scoring
-- Specific player roles to practice different positions
-
-### Competitive Challenges ({game_time//2} minutes)
-**Skills competitions and team challenges**
-
-- **Individual skill contests** related to session focus
-- **Team relay races** incorporating sport skills
-- **Fun games** that reinforce technique
-- **Positive competition** with emphasis on effort
-
-**🎯 Coaching During Games**:
-- Step back and let players make decisions
-- Provide encouragement rather than constant instruction
-- Highlight good examples of focus skills in action
-- Keep energy high with positive reinforcement
-
----
-
-## 🧘 Cool-Down & Team Building ({cooldown_time} minutes)
-**Objective**: Proper recovery and positive session closure
-
-### Physical Recovery (3 minutes)
-- **Walking cool-down** to lower heart rate
-- **Static stretching** for major muscle groups used
-- **Deep breathing exercises** for mental relaxation
-- **Hydration reminder** and injury check
-
-### Team Reflection & Connection (2 minutes)
-- **Circle up** for team discussion
-- **Highlight 3 positive moments** from practice
-- **Ask players**: "What did you learn today?"
-- **Preview next session** and upcoming events
-- **Team cheer or motivational closing**
-
----
-
-## 🎯 Sport-Specific Coaching Points for {sport_title}
-
-### Technical Focus Areas:
-- **Proper body mechanics** for injury prevention
-- **Progressive skill development** appropriate for age
-- **Decision-making skills** in game situations
-- **Teamwork and communication** emphasis
-
-### Safety Considerations:
-- Proper equipment check before starting
-- Age-appropriate contact and intensity levels
-- Hydration breaks every 15-20 minutes
-- Modified rules for safety in youth sports
-
-### Fun Factor Elements:
-- Variety in activities to maintain engagement
-- Opportunities for every player to succeed
-- Positive coaching language and encouragement
-- Games and challenges that build confidence
-
----
-
-## 📋 Equipment Checklist
-- **{sport_title} balls**: 1 per 2-3 players minimum
-- **Cones/markers**: 20-30 for boundaries and drills
-- **Water bottles**: Ensure every player has access
-- **First aid kit**: Basic supplies and emergency contacts
-- **Pinnies/scrimmage vests**: For team identification
-- **Clipboard**: For notes and player feedback
-
----
-
-## 🔄 Adaptations by Skill Level
-
-### **Beginner Modifications**:
-- Slower pace with more demonstrations
-- Simplified rules and fewer variables
-- Extra encouragement and patience
-- Focus on fun and basic skill development
-- Shorter activity durations (3-5 minutes)
-
-### **Intermediate Adaptations**:
-- Add tactical elements and strategy
-- Increase pace and intensity gradually
-- Introduce more advanced techniques
-- Longer sustained activities (5-8 minutes)
-- Peer teaching opportunities
-
-### **Advanced Challenges**:
-- Higher intensity and game-like pressure
-- Complex tactical scenarios
-- Leadership roles and responsibility
-- Competitive elements and performance goals
-- Extended activity periods (8-12 minutes)
-
----
-
-## 💡 HeadCoachAI Pro Tips
-
-### Before Practice:
-- Arrive 15 minutes early to set up equipment
-- Have a backup plan for weather or space issues
-- Review player names and any special considerations
-- Prepare positive energy and enthusiasm
-
-### During Practice:
-- Use every player's name frequently
-- Give specific, actionable feedback
-- Keep instructions simple and clear
-- Maintain high energy and positivity
-- Be flexible and adapt based on player needs
-
-### After Practice:
-- Clean up equipment together as a team
-- Send positive messages to parents about player progress
-- Reflect on what worked well and what to improve
-- Plan adjustments for next session
-
----
-
-## 🌟 Session Success Indicators
-- ✅ Every player touched the ball/participated actively
-- ✅ Players demonstrated improvement in {request.focus}
-- ✅ Positive team energy and communication
-- ✅ Safe environment with no injuries
-- ✅ Players left excited for next practice
-- ✅ Coach felt organized and prepared
-
----
-"""
-
-        # Add selected drills section if any were chosen
-        if request.selectedDrills:
-            practice_plan += f"""## 🎯 Your Selected Drills Integration
-
-You specifically requested these drills to be included:
-
-"""
-            for i, drill in enumerate(request.selectedDrills, 1):
-                practice_plan += f"**{i}. {drill}**\n"
-                practice_plan += f"   - Integrate into technical skills stations\n"
-                practice_plan += f"   - Modify difficulty based on player ability\n"
-                practice_plan += f"   - Use as warm-up or cool-down activity\n\n"
-
-        practice_plan += f"""
----
-
-*🏆 This comprehensive practice plan was generated by HeadCoachAI*
-
-*Remember: Every player develops at their own pace. Use this plan as a guide, but always prioritize safety, fun, and individual growth. Adapt activities based on your team's specific needs and energy levels.*
-
-**Next Steps**: 
-- Review this plan before practice
-- Gather all necessary equipment  
-- Prepare for an amazing coaching session!
-
-*Good luck, Coach! Your players are lucky to have someone who cares about their development.* 🌟
-"""
+async def run_practice_job(payload: dict) -> dict:
+    return bind_generated(await cached_practice_plan(PracticeRequest(**payload)))
 
-        return {
-            "generated_plan": practice_plan,
-            "web_drills_found": len(relevant_drills),
-            "sources_used": [drill.source for drill in relevant_drills[:3]]
-        }
 
+# Background jobs, run by workers started with the app
+job_queue = create_job_queue({"generate-practice": run_practice_job})
+
+
+@app.post("/api/jobs/generate-practice", status_code=status.HTTP_202_ACCEPTED)
+async def submit_practice_job(
+    request: PracticeRequest,
+    response: Response,
+    user=Depends(rate_limited("generate"))
+) -> dict:
+    """Queue a practice plan generation and return the job right away
+
+    GET /api/jobs/{job_id} (the Location header) reports its status and,
+    once it has succeeded, the same result as /api/generate-practice.
+    """
+    try:
+        job = await job_queue.submit(user["id"], "generate-practice", request.model_dump())
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=str(e))
+    except Exception as e:
+        print(f"Error queueing practice plan: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to queue practice plan: {str(e)}"
+        )
+    response.headers["Location"] = f"/api/jobs/{job['id']}"
+    return job
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(
+    job_id: str,
+    wait: float = Query(0, ge=0),
+    user=Depends(get_current_user)
+) -> dict:
+    """A job's status, and its result or error once finished
+
+    With wait, the request is held for up to that many seconds (at most
+    JOB_MAX_WAIT) until the job finishes.
+    """
+    try:
+        job = await job_queue.get(user["id"], job_id, min(wait, JOB_MAX_WAIT))
+    except Exception as e:
+        print(f"Error fetching job: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch job: {str(e)}"
+        )
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.post("/api/generate-practice/stream")
+async def stream_practice_plan(
+    request: PracticeRequest,
+    http_request: Request,
+    user=Depends(rate_limited("stream"))
+) -> StreamingResponse:
+    """Stream a practice plan as it is written
+
+    Clients sending "Accept: text/event-stream" get Server-Sent Events: one
+    "section" event per plan section followed by a "done" event carrying
+    the drill metadata. Other clients get the markdown as a chunked body.
+    With a chat model configured (PLAN_GENERATOR=openai), the plan is sent
+    as "delta" events carrying text as the model writes it instead of
+    "section" events. The plan comes from the templates when the model
+    fails before writing anything; if it fails later, an "error" event
+    follows the partial plan (the markdown body just ends).
+    """
+    try:
+        relevant_drills = get_enhanced_drills(
+            request.sport, request.focus, request.ageGroup, request.skillLevel)
+        schedule = practice_schedule(request)
+        values = plan_values(request, drill_inspiration(request), schedule)
+        values["generated"] = generated_timestamp()
+        sections = template_for(request.sport).render_sections(values, request.selectedDrills)
+        model_drills = (search_catalog(request.sport, request.focus, request.ageGroup or "")
+                        if plan_writer is not None else None)
     except Exception as e:
         print(f"Error generating practice plan: {e}")
         raise HTTPException(
@@ -560,6 +739,144 @@ You specifically requested these drills to be included:
             detail=f"Failed to generate practice plan: {str(e)}"
         )
 
+    async def pieces():
+        """("delta" or a section name, text) pairs of the plan"""
+        if plan_writer is not None:
+            written = False
+            try:
+                async for text in plan_writer.stream(request, model_drills, schedule):
+                    written = True
+                    yield "delta", text
+                return
+            except UpstreamError as e:
+                if written:
+                    raise
+                print(f"Plan writer unavailable, using templates: {e}")
+        for name, text in sections:
+            yield name, text
+
+    if "text/event-stream" not in http_request.headers.get("accept", ""):
+        async def markdown_chunks():
+            try:
+                async for _, text in pieces():
+                    yield text
+            except Exception as e:
+                print(f"Error streaming practice plan: {e}")
+        return StreamingResponse(markdown_chunks(), media_type="text/markdown")
+
+    async def events():
+        try:
+            async for name, text in pieces():
+                if name == "delta":
+                    yield sse_event("delta", {"text": text})
+                else:
+                    yield sse_event("section", {"name": name, "text": text})
+            yield sse_event("done", {
+                "web_drills_found": len(relevant_drills),
+                "sources_used": [drill.source for drill in relevant_drills[:3]],
+                "schedule": schedule.as_dict(),
+            })
+        except Exception as e:
+            print(f"Error streaming practice plan: {e}")
+            yield sse_event("error", {"detail": f"Failed to generate practice plan: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json_dumps(data)}\n\n"
+
+
+def batch_size(batch: BatchPracticeRequest) -> int:
+    """Practices the batch expands to, counted without expanding it"""
+    season = batch.season
+    return len(batch.practices) + (season.sessions if season is not None and season.focuses else 0)
+
+
+def expand_batch(batch: BatchPracticeRequest) -> List[PracticeRequest]:
+    """Explicit practices followed by the sessions of the season spec, if any
+
+    Season sessions rotate through the spec's focuses in order.
+    """
+    practices = list(batch.practices)
+    season = batch.season
+    if season is not None and season.focuses:
+        for session in range(season.sessions):
+            practices.append(PracticeRequest(
+                sport=season.sport,
+                duration=season.duration,
+                playerCount=season.playerCount,
+                ageGroup=season.ageGroup,
+                skillLevel=season.skillLevel,
+                focus=season.focuses[session % len(season.focuses)],
+                selectedDrills=season.selectedDrills,
+            ))
+    return practices
+
+
+@app.post("/api/generate-practices/batch")
+async def generate_practice_batch(
+    batch: BatchPracticeRequest,
+    user=Depends(get_current_user)
+) -> StreamingResponse:
+    """Generate many practice plans, streamed as NDJSON as they complete
+
+    Each line is {"index", "status", ...} where index refers to the position
+    in the expanded list (explicit practices first, then season sessions).
+    Identical practices are generated once and reported for every index.
+    """
+    size = batch_size(batch)
+    if not size:
+        raise HTTPException(status_code=400, detail="Batch contains no practices")
+    if size > BATCH_MAX_PRACTICES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch is limited to {BATCH_MAX_PRACTICES} practices"
+        )
+    practices = expand_batch(batch)
+    await enforce_rate_limit(user, "batch", cost=len(practices))
+
+    indexes_by_key: Dict[str, List[int]] = {}
+    for index, practice in enumerate(practices):
+        indexes_by_key.setdefault(cache_key(practice), []).append(index)
+
+    async def lines():
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        timestamp = generated_timestamp()
+
+        async def generate(key: str, practice: PracticeRequest):
+            async with semaphore:
+                try:
+                    return key, await cached_practice_plan(practice, key), None
+                except Exception as e:
+                    print(f"Error generating practice plan: {e}")
+                    return key, None, f"Failed to generate practice plan: {str(e)}"
+
+        tasks = [
+            asyncio.ensure_future(generate(key, practices[indexes[0]]))
+            for key, indexes in indexes_by_key.items()
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                key, result, error = await next_done
+                if result is not None:
+                    result = bind_generated(result, timestamp)
+                for index in indexes_by_key[key]:
+                    if error is None:
+                        line = {"index": index, "status": "ok", **result}
+                    else:
+                        line = {"index": index, "status": "error", "detail": error}
+                    yield json_dumps(line) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 
 @app.post("/api/save-practice")
 async def save_practice_plan(
@@ -568,16 +885,22 @@ async def save_practice_plan(
 ) -> dict:
     """Save practice plan to database"""
     try:
-        # For now, just return success with a generated ID
-        # In production, this would save to Supabase database
-        practice_id = f"practice-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        saved = await run_in_threadpool(plan_repository.save, user["id"], practice.model_dump())
 
         return {
             "success": True,
-            "id": practice_id,
+            "id": saved["id"],
             "message": "Practice plan saved successfully!"
         }
 
+    except InvalidPlan as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SaveQueueFull as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Too many saves in progress, retry shortly: {str(e)}",
+            headers={"Retry-After": "1"},
+        )
     except Exception as e:
         print(f"Error saving practice plan: {e}")
         raise HTTPException(
@@ -588,60 +911,25 @@ async def save_practice_plan(
 
 @app.get("/api/practice-plans")
 async def get_practice_plans(
-    limit: int = 10,
+    response: Response,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    sport: Optional[str] = None,
     user=Depends(get_current_user)
 ) -> List[dict]:
-    """Get user's saved practice plans"""
+    """Get user's saved practice plans, newest first
+
+    When more plans exist, the X-Next-Cursor response header holds the
+    cursor to pass back for the next page.
+    """
     try:
-        # Return enhanced sample data for demonstration
-        sample_plans = [
-            {
-                "id": "sample-1",
-                "title": "Soccer - U10 Passing & Movement",
-                "sport": "soccer",
-                "duration": 75,
-                "created_at": "2024-01-15T10:00:00Z",
-                "selected_drills": ["Progressive Passing Circuit", "Small-Sided Games"],
-                "focus_areas": "Passing accuracy under pressure"
-            },
-            {
-                "id": "sample-2",
-                "title": "Basketball - U12 Shooting Fundamentals",
-                "sport": "basketball",
-                "duration": 60,
-                "created_at": "2024-01-14T15:30:00Z",
-                "selected_drills": ["Form Shooting Progression", "Triple Threat Position"],
-                "focus_areas": "Shooting technique and confidence"
-            },
-            {
-                "id": "sample-3",
-                "title": "Baseball - U8 Hitting & Fielding",
-                "sport": "baseball",
-                "duration": 90,
-                "created_at": "2024-01-13T16:00:00Z",
-                "selected_drills": ["Tee Work Progression", "Fielding Fundamentals"],
-                "focus_areas": "Basic hitting mechanics"
-            },
-            {
-                "id": "sample-4",
-                "title": "Volleyball - U14 Serving & Passing",
-                "sport": "volleyball",
-                "duration": 75,
-                "created_at": "2024-01-12T14:00:00Z",
-                "selected_drills": ["Platform Passing", "Serving Progression"],
-                "focus_areas": "Consistent serving and passing"
-            },
-            {
-                "id": "sample-5",
-                "title": "Flag Football - U16 Route Running",
-                "sport": "flag-football",
-                "duration": 60,
-                "created_at": "2024-01-11T17:00:00Z",
-                "selected_drills": ["Route Running Precision", "7v7 Scrimmage"],
-                "focus_areas": "Precise route running and timing"
-            }
-        ]
-        return sample_plans[:limit]
+        plans, next_cursor = await run_in_threadpool(
+            plan_repository.list_for_user, user["id"], limit, cursor, sport)
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+        return plans
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error fetching practice plans: {e}")
         raise HTTPException(
@@ -649,6 +937,38 @@ async def get_practice_plans(
             detail=f"Failed to fetch practice plans: {str(e)}"
         )
 
+
+@app.get("/api/practice-plans/{plan_id}")
+async def get_practice_plan(
+    plan_id: str,
+    http_request: Request,
+    response: Response,
+    format: Optional[str] = None,
+    sections: Optional[str] = None,
+    user=Depends(get_current_user)
+) -> dict:
+    """Get one saved practice plan including its generated plan
+
+    Negotiates the format and takes sections like /api/generate-practice.
+    """
+    fmt = plan_format(http_request, format)
+    names = parse_sections(sections)
+    response.headers["Vary"] = "Accept"
+    try:
+        plan = await run_in_threadpool(plan_repository.get, user["id"], plan_id)
+    except Exception as e:
+        print(f"Error fetching practice plan: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to fetch practice plan: {str(e)}"
+        )
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Practice plan not found")
+    plan = plan_detail(plan)
+    if fmt == "json" and not names:
+        return plan
+    return negotiated_plan(plan, fmt, names)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,249 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+import threading
+import time
+
+# Metrics in the Prometheus text format
+#
+# A small in-process registry of counters, gauges and histograms, rendered
+# at GET /metrics. Label values are passed positionally and series are
+# plain dict entries, so recording a value costs a dict lookup and, for
+# histograms, a bisect. Values that other modules already count (cache
+# hits, coalesced calls) are read by collectors at scrape time instead of
+# being recorded twice. Every worker process exposes its own series.
+#
+# Most values are recorded on the event loop, but some come from threads
+# (the write-behind flusher, stores called with asyncio.to_thread), so each
+# metric updates and renders its series under its own lock.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+BATCH_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# (name, labels, value) as reported by collectors
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._series: dict = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            series = list(self._series.items())
+        for values, value in series:
+            lines.append(f"{self.name}{_labels(self.label_names, values)} {_number(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._series[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) - amount
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels: str) -> None:
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then sum and count
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[bucket] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        names = self.label_names + ("le",)
+        with self._lock:
+            # Copies, so the buckets, sum and count of a series agree
+            snapshot = [(values, list(series)) for values, series in self._series.items()]
+        for values, series in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, values + (_number(bound),))} {cumulative}")
+            labels = _labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {_number(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Sample]]]] = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def reset(self) -> None:
+        """Forget recorded values, e.g. from warming up a process before it forks"""
+        for metric in self.metrics:
+            metric.clear()
+
+    def collector(self, name: str, kind: str, help: str, collect: Callable[[], Iterable[Sample]]) -> None:
+        """A metric whose samples are read from collect() at scrape time"""
+        self._collectors.append((name, kind, help, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for name, kind, help, collect in self._collectors:
+            try:
+                samples = list(collect())
+            except Exception as e:
+                print(f"Error collecting metric {name}: {e}")
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    "headcoach_request_duration_seconds", "Time to send the full response", ("method", "route"))
+RESPONSE_BYTES = registry.histogram(
+    "headcoach_response_size_bytes", "Response body size", ("method", "route"), SIZE_BUCKETS)
+REQUESTS = registry.counter(
+    "headcoach_requests_total", "Requests by response status", ("method", "route", "status"))
+IN_FLIGHT = registry.gauge(
+    "headcoach_requests_in_flight", "Requests being handled", ("method",))
+STAGE_SECONDS = registry.histogram(
+    "headcoach_stage_duration_seconds", "Time spent in a stage of request handling", ("stage",))
+UPSTREAM_SECONDS = registry.histogram(
+    "headcoach_upstream_request_duration_seconds", "Outbound API call attempts", ("host", "outcome"))
+LLM_SECONDS = registry.histogram(
+    "headcoach_llm_request_duration_seconds", "Chat completion calls (cache misses)", ("model", "outcome"))
+LLM_TOKENS = registry.histogram(
+    "headcoach_llm_tokens", "Tokens per chat completion call", ("model", "kind"), TOKEN_BUCKETS)
+JOB_SECONDS = registry.histogram(
+    "headcoach_job_duration_seconds", "Background job run time", ("kind", "outcome"))
+JOB_WAIT_SECONDS = registry.histogram(
+    "headcoach_job_queue_wait_seconds", "Time background jobs spent queued before a worker claimed them", ("kind",))
+SAVE_FLUSH_SECONDS = registry.histogram(
+    "headcoach_save_flush_duration_seconds", "Time to write a batch of queued saves", ("outcome",))
+SAVE_BATCH_SIZE = registry.histogram(
+    "headcoach_save_flush_batch_size", "Saves written per batch", (), BATCH_BUCKETS)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status, size and in-flight requests
+
+    Routes are labelled by their path template (e.g. /api/practice-plans/{plan_id})
+    so the number of series stays bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        start = time.perf_counter()
+        status = 500
+        size = 0
+
+        async def send_measured(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc(method)
+        try:
+            await self.app(scope, receive, send_measured)
+        finally:
+            IN_FLIGHT.dec(method)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            REQUEST_SECONDS.observe(time.perf_counter() - start, method, path)
+            RESPONSE_BYTES.observe(size, method, path)
+            REQUESTS.inc(method, path, str(status))
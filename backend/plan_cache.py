@@ -0,0 +1,216 @@
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Practice plan response cache
+#
+# Generated plans are cached on a canonical form of the PracticeRequest.
+# The "Generated:" timestamp is rendered as GENERATED_SLOT and bound when a
+# response is served, so cached bodies never carry a stale time. The SQLite
+# backend can wait on other workers' locks, so, as with rate limiters,
+# caches with `blocking` set are called from a thread.
+
+GENERATED_SLOT = "\x00generated\x00"
+
+
+def generated_timestamp() -> str:
+    return datetime.now().strftime('%B %d, %Y at %I:%M %p')
+
+
+def bind_generated(result: dict, timestamp: Optional[str] = None) -> dict:
+    """Copy of a cached result with the generation time filled in"""
+    bound = dict(result)
+    bound["generated_plan"] = result["generated_plan"].replace(
+        GENERATED_SLOT, timestamp or generated_timestamp())
+    return bound
+
+
+def cache_key(request) -> str:
+    """Canonical key for a PracticeRequest
+
+    Only differences that change the rendered plan produce different keys:
+    "60" and "060" are the same duration and None/"" optional fields render
+    the same default text.
+    """
+    try:
+        duration = int(request.duration) if request.duration else 60
+    except ValueError:
+        duration = request.duration
+    return json.dumps([
+        request.sport,
+        duration,
+        request.focus,
+        request.ageGroup or "",
+        request.skillLevel or "",
+        request.playerCount or "",
+        list(request.selectedDrills),
+    ], separators=(",", ":"), ensure_ascii=False)
+
+
+def _entry_size(key: str, value: dict) -> int:
+    return len(key) + sum(len(v) for v in value.values() if isinstance(v, str)) + 128
+
+
+class MemoryPlanCache:
+    """In-process LRU with TTL, bounded by entry count and approximate bytes"""
+
+    blocking = False
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 16 * 1024 * 1024, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: dict) -> None:
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": "memory",
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SqlitePlanCache:
+    """Plan cache in a local SQLite file shared by every worker on the host
+
+    Eviction is by TTL and then least recently used once max_entries is
+    exceeded. Hit/miss counters are per process.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, max_entries: int = 4096, ttl: float = 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS plan_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL, used_at REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS plan_cache_used_at ON plan_cache (used_at)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Close this thread's connection; the next call opens a new one"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def get(self, key: str) -> Optional[dict]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value FROM plan_cache WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        conn.execute("UPDATE plan_cache SET used_at = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO plan_cache (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value, ensure_ascii=False), now + self.ttl, now))
+        conn.execute("DELETE FROM plan_cache WHERE expires_at <= ?", (now,))
+        overflow = conn.execute("SELECT COUNT(*) FROM plan_cache").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM plan_cache WHERE key IN"
+                " (SELECT key FROM plan_cache ORDER BY used_at LIMIT ?)", (overflow,))
+            self.evictions += overflow
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM plan_cache")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        entries = self._conn().execute("SELECT COUNT(*) FROM plan_cache").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def create_plan_cache():
+    """Build the cache selected by PLAN_CACHE_BACKEND (memory or sqlite)"""
+    backend = os.getenv("PLAN_CACHE_BACKEND", "memory")
+    ttl = float(os.getenv("PLAN_CACHE_TTL", "3600"))
+    max_entries = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "512"))
+    if backend == "sqlite":
+        return SqlitePlanCache(os.getenv("PLAN_CACHE_PATH", "plan_cache.sqlite3"), max_entries, ttl)
+    max_bytes = int(os.getenv("PLAN_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+    return MemoryPlanCache(max_entries, max_bytes, ttl)
@@ -0,0 +1,407 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from html import escape
+from typing import Dict, List, Optional, Pattern, Sequence, Tuple
+import re
+
+from plan_cache import GENERATED_SLOT
+from plan_templates import DEFAULT_PLAN, TEMPLATES
+from transport import json_dumps
+
+# Structured practice plans
+#
+# Plans are written as markdown, by the templates or by a chat model. A
+# Plan is the same document as data: sections (one per "##" heading, plus
+# the closing notes after the last rule) with their minutes and start
+# time, subsections ("###" headings and bold labels) with their key/value
+# details, bullet points and coaching points. Markdown is parsed once per
+# distinct text (parse_plan is memoized) and rendered on request: as the
+# original markdown, as HTML, or as compact JSON, for the whole plan or a
+# selection of its sections. Renderings are memoized too, with the
+# generation time left as GENERATED_SLOT and filled in per response.
+#
+# Section names come from the templates' section lists ("warmup",
+# "skills", "games", "cooldown", ...): a section whose heading is a
+# template's heading has that section's name, so clients can ask for
+# just the parts they need. Other headings are free text (model output);
+# one that spells a template section name ("## Warm-up") gets that name,
+# the rest a name made from the heading.
+
+# Formats by media type, for content negotiation
+MEDIA_TYPES = {
+    "application/json": "json",
+    "application/vnd.headcoach.plan+json": "plan",
+    "text/markdown": "markdown",
+    "text/html": "html",
+}
+FORMATS = tuple(MEDIA_TYPES.values())
+MEDIA_TYPE_FOR = {fmt: media_type for media_type, fmt in MEDIA_TYPES.items()}
+
+
+def _template_headings() -> Tuple[Tuple[Pattern, str], ...]:
+    """(heading pattern, section name) for the sections of every template"""
+    headings: Dict[str, Tuple[Pattern, str]] = {}
+    for template in (DEFAULT_PLAN, *TEMPLATES.values()):
+        for name, pattern in template.headings():
+            headings.setdefault(pattern.pattern, (pattern, name))
+    return tuple(headings.values())
+
+
+# Section names by heading, from every template's section list
+TEMPLATE_HEADINGS = _template_headings()
+# A free-text heading that is just a template section name ("Warm-up", "Cool Down")
+TEMPLATE_NAMES = {name.replace("_", ""): name for _, name in TEMPLATE_HEADINGS}
+COACHING_TITLES = re.compile(r"coaching|teaching point", re.IGNORECASE)
+
+SECTION_START = re.compile(r"^## ", re.MULTILINE)
+HEADING = re.compile(r"^(#{1,6}) +(.*?)\s*$")
+BULLET = re.compile(r"^(\s*)[-*+] +(.*?)\s*$")
+# "**Label**: value" (value may be empty)
+DETAIL = re.compile(r"^\*\*([^*]+?)\*\*:\s*(.*)$")
+BOLD_LINE = re.compile(r"^\*\*([^*]+)\*\*$")
+MINUTES = re.compile(r"\s*\((\d+) minutes?\)$")
+LEADING_SYMBOLS = re.compile(r"^[^\w(]+")
+BOLD = re.compile(r"\*\*(.+?)\*\*")
+ITALIC = re.compile(r"(?<![*\w])\*(?!\s)(.+?)(?<!\s)\*(?![*\w])")
+
+
+class UnknownSection(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class Point:
+    text: str
+    children: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class Subsection:
+    title: Optional[str]
+    minutes: Optional[int]
+    details: Tuple[Tuple[str, str], ...]
+    points: Tuple[Point, ...]
+    paragraphs: Tuple[str, ...]
+
+
+@dataclass(frozen=True)
+class Section:
+    name: str
+    title: str
+    start: Optional[int]
+    minutes: Optional[int]
+    subsections: Tuple[Subsection, ...]
+    # Markdown source, rendered as is
+    text: str
+
+    @property
+    def coaching_points(self) -> List[str]:
+        return [point.text for sub in self.subsections
+                if sub.title and COACHING_TITLES.search(sub.title) for point in sub.points]
+
+
+# Compared and hashed by identity, so memoized renderings are cheap to look up
+@dataclass(frozen=True, eq=False)
+class Plan:
+    title: str
+    sections: Tuple[Section, ...]
+
+    @property
+    def section_names(self) -> List[str]:
+        return [section.name for section in self.sections]
+
+    @property
+    def drills(self) -> List[str]:
+        """Drills the plan names: inspirations, then the coach's selected drills"""
+        drills = [value for section in self.sections for sub in section.subsections
+                  for label, value in sub.details if label == "Drill Inspiration"]
+        for section in self.sections:
+            if section.name == "drills":
+                drills.extend(re.sub(r"^\d+\.\s*", "", sub.title) for sub in section.subsections if sub.title)
+        return drills
+
+    def select(self, names: Optional[Sequence[str]]) -> "Plan":
+        """The plan with only the named sections, in document order"""
+        if not names:
+            return self
+        unknown = set(names) - set(self.section_names)
+        if unknown:
+            raise UnknownSection(
+                f"Unknown plan sections: {', '.join(sorted(unknown))}"
+                f" (available: {', '.join(self.section_names)})")
+        wanted = set(names)
+        return Plan(self.title, tuple(section for section in self.sections if section.name in wanted))
+
+    def markdown(self, generated: str = "") -> str:
+        return "".join(section.text for section in self.sections).replace(GENERATED_SLOT, generated)
+
+    def html(self, generated: str = "") -> str:
+        parts = [f'<article class="practice-plan">\n<h1>{_inline_html(self.title)}</h1>\n']
+        for section in self.sections:
+            attributes = f' id="{section.name}"'
+            if section.start is not None:
+                attributes += f' data-start="{section.start}" data-minutes="{section.minutes}"'
+            parts.append(f"<section{attributes}>\n<h2>{_inline_html(section.title)}{_minutes_html(section.minutes)}</h2>\n")
+            for sub in section.subsections:
+                if sub.title:
+                    parts.append(f"<h3>{_inline_html(sub.title)}{_minutes_html(sub.minutes)}</h3>\n")
+                if sub.details:
+                    parts.append("<dl>\n")
+                    for label, value in sub.details:
+                        parts.append(f"<dt>{_inline_html(label)}</dt><dd>{_inline_html(value)}</dd>\n")
+                    parts.append("</dl>\n")
+                for paragraph in sub.paragraphs:
+                    parts.append(f"<p>{_inline_html(paragraph)}</p>\n")
+                if sub.points:
+                    parts.append("<ul>\n")
+                    for point in sub.points:
+                        parts.append(f"<li>{_inline_html(point.text)}")
+                        if point.children:
+                            parts.append("<ul>" + "".join(
+                                f"<li>{_inline_html(child)}</li>" for child in point.children) + "</ul>")
+                        parts.append("</li>\n")
+                    parts.append("</ul>\n")
+            parts.append("</section>\n")
+        parts.append("</article>\n")
+        return "".join(parts).replace(escape(GENERATED_SLOT), escape(generated))
+
+    def compact(self, generated: str = "") -> dict:
+        """The plan as plain data, without markdown formatting or empty fields"""
+        def text(value: str) -> str:
+            return _plain(value).replace(GENERATED_SLOT, generated)
+
+        sections = []
+        for section in self.sections:
+            entry: Dict[str, object] = {"name": section.name, "title": text(section.title)}
+            if section.minutes is not None:
+                entry["start"] = section.start
+                entry["minutes"] = section.minutes
+            subsections = []
+            for sub in section.subsections:
+                item: Dict[str, object] = {}
+                if sub.title:
+                    item["title"] = text(sub.title)
+                if sub.minutes is not None:
+                    item["minutes"] = sub.minutes
+                if sub.details:
+                    item["details"] = {text(label): text(value) for label, value in sub.details}
+                if sub.paragraphs:
+                    item["text"] = [text(paragraph) for paragraph in sub.paragraphs]
+                if sub.points:
+                    item["points"] = [
+                        {"text": text(point.text), "points": [text(child) for child in point.children]}
+                        if point.children else text(point.text)
+                        for point in sub.points]
+                if item:
+                    subsections.append(item)
+            if subsections:
+                entry["subsections"] = subsections
+            coaching_points = section.coaching_points
+            if coaching_points:
+                entry["coaching_points"] = [text(point) for point in coaching_points]
+            sections.append(entry)
+        plan: Dict[str, object] = {"title": text(self.title), "sections": sections}
+        drills = self.drills
+        if drills:
+            plan["drills"] = [text(drill) for drill in drills]
+        return plan
+
+
+def _plain(value: str) -> str:
+    return ITALIC.sub(r"\1", BOLD.sub(r"\1", value))
+
+
+def _inline_html(value: str) -> str:
+    value = BOLD.sub(r"<strong>\1</strong>", escape(value, quote=False))
+    return ITALIC.sub(r"<em>\1</em>", value)
+
+
+def _minutes_html(minutes: Optional[int]) -> str:
+    return f' <small>{minutes} minutes</small>' if minutes is not None else ""
+
+
+def _heading(text: str) -> Tuple[str, Optional[int]]:
+    """Heading text without leading symbols (emoji) and its "(N minutes)" suffix"""
+    minutes = None
+    match = MINUTES.search(text)
+    if match:
+        minutes = int(match.group(1))
+        text = text[:match.start()]
+    return LEADING_SYMBOLS.sub("", text).strip() or text.strip(), minutes
+
+
+def section_name(text: str, title: str) -> str:
+    """Name of a section: the template section its heading line comes from,
+    else one made from its title"""
+    line = text.lstrip().partition("\n")[0].strip()
+    for pattern, name in TEMPLATE_HEADINGS:
+        if pattern.match(line):
+            return name
+    slug = re.sub(r"[^a-z0-9]+", "_", title.lower()).strip("_")
+    return TEMPLATE_NAMES.get(slug.replace("_", ""), slug or "section")
+
+
+def split_sections(markdown: str) -> List[str]:
+    """Section texts: one per "##" heading (text before the first joins it),
+    then the closing notes after the last horizontal rule, if any"""
+    starts = [match.start() for match in SECTION_START.finditer(markdown)]
+    if not starts or starts[0] != 0:
+        starts = [0] + starts[1:]
+    chunks = [markdown[start:end] for start, end in zip(starts, starts[1:] + [len(markdown)])]
+    last = chunks[-1]
+    rule = last.rfind("\n---\n")
+    if rule >= 0:
+        closing = last[rule + 5:]
+        if closing.strip() and not any(HEADING.match(line) for line in closing.splitlines()):
+            chunks[-1:] = [last[:rule], last[rule:]]
+    return [chunk for chunk in chunks if chunk]
+
+
+class _SubsectionBuilder:
+    def __init__(self, title: Optional[str] = None, minutes: Optional[int] = None):
+        self.title = title
+        self.minutes = minutes
+        self.details: List[Tuple[str, str]] = []
+        # [text, children, indent]
+        self.points: List[List] = []
+        self.paragraphs: List[str] = []
+
+    @property
+    def empty(self) -> bool:
+        return not (self.details or self.points or self.paragraphs)
+
+    def build(self) -> Subsection:
+        return Subsection(self.title, self.minutes, tuple(self.details),
+                          tuple(Point(text, tuple(children)) for text, children, _ in self.points),
+                          tuple(self.paragraphs))
+
+
+def parse_section(text: str) -> Tuple[Optional[str], str, Optional[int], Tuple[Subsection, ...]]:
+    """(document title, section title, minutes, subsections) of one section's markdown"""
+    document_title = None
+    title: Optional[str] = None
+    minutes = None
+    current = _SubsectionBuilder()
+    subsections = [current]
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped == "---":
+            continue
+        heading = HEADING.match(stripped)
+        if heading:
+            level = len(heading.group(1))
+            heading_title, heading_minutes = _heading(heading.group(2))
+            if level == 1:
+                document_title = heading_title
+            elif level == 2 and title is None:
+                title, minutes = heading_title, heading_minutes
+            else:
+                current = _SubsectionBuilder(heading_title, heading_minutes)
+                subsections.append(current)
+            continue
+        bullet = BULLET.match(line)
+        if bullet:
+            indent, content = len(bullet.group(1)), bullet.group(2)
+            detail = DETAIL.match(content)
+            if current.points and indent > current.points[-1][2]:
+                current.points[-1][1].append(content)
+            elif detail and detail.group(2):
+                current.details.append((detail.group(1).strip(), detail.group(2).strip()))
+            else:
+                current.points.append([content, [], indent])
+            continue
+        detail = DETAIL.match(stripped)
+        bold = BOLD_LINE.match(stripped)
+        if detail and detail.group(2):
+            current.details.append((detail.group(1).strip(), detail.group(2).strip()))
+        elif detail or (bold and not current.empty):
+            # A bold label starts a group of points ("Key Teaching Points:")
+            label = (detail or bold).group(1).strip()
+            current = _SubsectionBuilder(_heading(label)[0])
+            subsections.append(current)
+        else:
+            if current.points:
+                # Text after a list starts a new untitled group, keeping document order
+                current = _SubsectionBuilder()
+                subsections.append(current)
+            current.paragraphs.append(stripped)
+    if title is None:
+        title = "Closing" if document_title is None else "Overview"
+    built = tuple(sub.build() for sub in subsections if sub.title or not sub.empty)
+    return document_title, title, minutes, built
+
+
+@lru_cache(maxsize=256)
+def parse_plan(markdown: str) -> Plan:
+    """The structure of a markdown plan; memoized, so each distinct text is parsed once"""
+    document_title = None
+    sections = []
+    seen: Dict[str, int] = {}
+    clock = 0
+    chunks = split_sections(markdown)
+    for index, chunk in enumerate(chunks):
+        chunk_title, title, minutes, subsections = parse_section(chunk)
+        document_title = document_title or chunk_title
+        if index == len(chunks) - 1 and len(chunks) > 1 and not chunk.lstrip().startswith("#"):
+            name = "closing"
+        else:
+            name = section_name(chunk, title)
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = f"{name}_{seen[name]}"
+        start = None
+        if minutes is not None:
+            start, clock = clock, clock + minutes
+        sections.append(Section(name, title, start, minutes, subsections, chunk))
+    return Plan(document_title or (sections[0].title if sections else "Practice Plan"), tuple(sections))
+
+
+@lru_cache(maxsize=512)
+def _rendered(plan: Plan, names: Tuple[str, ...], fmt: str) -> str:
+    selected = plan.select(names)
+    if fmt == "markdown":
+        return selected.markdown(GENERATED_SLOT)
+    if fmt == "html":
+        return selected.html(GENERATED_SLOT)
+    return json_dumps(selected.compact(GENERATED_SLOT))
+
+
+def render_plan(plan: Plan, fmt: str, names: Sequence[str] = (), generated: str = "") -> str:
+    """The named sections (all by default) as markdown, html or plan (compact JSON)"""
+    body = _rendered(plan, tuple(names), fmt)
+    if fmt == "html":
+        return body.replace(escape(GENERATED_SLOT), escape(generated))
+    if fmt == "plan":
+        return body.replace(json_dumps(GENERATED_SLOT)[1:-1], json_dumps(generated)[1:-1])
+    return body.replace(GENERATED_SLOT, generated)
+
+
+def negotiate_format(accept: str, requested: Optional[str] = None) -> str:
+    """The plan format for an explicit format parameter or an Accept header;
+    JSON unless the client prefers another supported type"""
+    if requested:
+        if requested not in FORMATS:
+            raise ValueError(f"Unknown format: {requested} (available: {', '.join(FORMATS)})")
+        return requested
+    best, best_quality = "json", 0.0
+    for item in accept.split(","):
+        media_type, _, params = item.strip().lower().partition(";")
+        fmt = MEDIA_TYPES.get(media_type.strip())
+        if fmt is None:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > best_quality:
+            best, best_quality = fmt, quality
+    return best
+
+
+def parse_sections(sections: Optional[str]) -> List[str]:
+    """Section names from a comma-separated query parameter"""
+    return [name.strip() for name in (sections or "").split(",") if name.strip()]
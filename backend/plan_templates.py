@@ -0,0 +1,492 @@
+from string import Formatter
+from typing import Dict, Iterator, List, Optional, Pattern, Sequence, Tuple
+import re
+
+# Practice plan templates
+#
+# Templates are parsed once at import into literal segments and typed
+# slots. Rendering a plan is a lookup per slot and a single join; adding a
+# plan format or a sport-specific variant only means adding template text.
+
+# Slot names a template may use and the type the renderer supplies for each;
+# slot_values() checks them when a plan's values are built.
+SLOTS: Dict[str, type] = {
+    "sport_title": str,
+    "duration": int,
+    "focus": str,
+    "age_group": str,
+    "skill_level": str,
+    "players": str,
+    "generated": str,
+    "warmup_time": int,
+    "warmup_general_time": int,
+    "warmup_activation_time": int,
+    "skill_time": int,
+    "skill_station_time": int,
+    "game_time": int,
+    "game_half_time": int,
+    "cooldown_time": int,
+    "cooldown_recovery_time": int,
+    "cooldown_reflection_time": int,
+    "drill_1_title": str,
+    "drill_2_title": str,
+    # Selected drill items
+    "index": int,
+    "drill": str,
+}
+
+
+def slot_values(values: Dict[str, object]) -> Dict[str, str]:
+    """Check values against SLOTS and convert them to the text templates join"""
+    text: Dict[str, str] = {}
+    for slot, value in values.items():
+        expected = SLOTS.get(slot)
+        if expected is None:
+            raise ValueError(f"Unknown slot '{slot}'")
+        # bool is an int subclass but never a minute count
+        if not isinstance(value, expected) or isinstance(value, bool):
+            raise TypeError(f"Slot '{slot}' must be {expected.__name__}, got {type(value).__name__}")
+        text[slot] = str(value)
+    return text
+
+
+class Template:
+    """Template text compiled into alternating literals and slot names"""
+
+    __slots__ = ("name", "literals", "slots")
+
+    def __init__(self, name: str, source: str):
+        self.name = name
+        literals: List[str] = []
+        slots: List[str] = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if len(literals) > len(slots):
+                # A literal that directly follows another one (escaped braces)
+                literals[-1] += literal
+            else:
+                literals.append(literal)
+            if field is None:
+                continue
+            if field not in SLOTS:
+                raise ValueError(f"Unknown slot '{field}' in {name} template")
+            if spec or conversion:
+                raise ValueError(f"Slot '{field}' in {name} template must not have a format spec")
+            slots.append(field)
+        if len(literals) == len(slots):
+            literals.append("")
+        self.literals = tuple(literals)
+        self.slots = tuple(slots)
+
+    def extend(self, parts: List[str], values: Dict[str, str]) -> None:
+        literals = self.literals
+        for i, slot in enumerate(self.slots):
+            parts.append(literals[i])
+            parts.append(values[slot])
+        parts.append(literals[-1])
+
+    def render(self, values: Dict[str, str]) -> str:
+        parts: List[str] = []
+        self.extend(parts, values)
+        return "".join(parts)
+
+    def heading(self) -> Optional[Pattern]:
+        """Pattern for the first line when it is a markdown heading; slots match any text"""
+        if not self.literals[0].startswith("#"):
+            return None
+        parts = []
+        for i, literal in enumerate(self.literals):
+            line, newline, _ = literal.partition("\n")
+            parts.append(re.escape(line))
+            if newline or i == len(self.slots):
+                break
+            parts.append(".+?")
+        return re.compile("".join(parts).rstrip() + r"\s*$")
+
+
+class PlanTemplate:
+    """Ordered plan sections plus the selected drills block and closing"""
+
+    def __init__(self, sections: Sequence[Tuple[str, str]], drills_header: str, drill_item: str, closing: str):
+        self._sources = (dict(sections), drills_header, drill_item, closing)
+        self.sections = tuple(Template(name, source) for name, source in sections)
+        self.drills_header = Template("drills", drills_header)
+        self.drill_item = Template("drill item", drill_item)
+        self.closing = Template("closing", closing)
+
+    def variant(self, **overrides: str) -> "PlanTemplate":
+        """Copy of this template with some sections replaced"""
+        section_sources, drills_header, drill_item, closing = self._sources
+        unknown = set(overrides) - set(section_sources)
+        if unknown:
+            raise ValueError(f"Unknown plan sections: {', '.join(sorted(unknown))}")
+        sections = [(name, overrides.get(name, source)) for name, source in section_sources.items()]
+        return PlanTemplate(sections, drills_header, drill_item, closing)
+
+    def render_sections(self, values: Dict[str, str], selected_drills: Sequence[str]) -> Iterator[Tuple[str, str]]:
+        """Yield (section name, text) pairs in document order"""
+        for section in self.sections:
+            yield section.name, section.render(values)
+        if selected_drills:
+            parts: List[str] = []
+            self.drills_header.extend(parts, values)
+            for i, drill in enumerate(selected_drills, 1):
+                self.drill_item.extend(parts, {"index": str(i), "drill": drill})
+            yield "drills", "".join(parts)
+        yield "closing", self.closing.render(values)
+
+    def headings(self) -> Iterator[Tuple[str, Pattern]]:
+        """Yield (section name, heading pattern) pairs for the sections that start with a heading"""
+        named = [(section.name, section) for section in self.sections] + [("drills", self.drills_header)]
+        for name, template in named:
+            pattern = template.heading()
+            if pattern is not None:
+                yield name, pattern
+
+    def render(self, values: Dict[str, str], selected_drills: Sequence[str]) -> str:
+        parts: List[str] = []
+        for section in self.sections:
+            section.extend(parts, values)
+        if selected_drills:
+            self.drills_header.extend(parts, values)
+            for i, drill in enumerate(selected_drills, 1):
+                self.drill_item.extend(parts, {"index": str(i), "drill": drill})
+        self.closing.extend(parts, values)
+        return "".join(parts)
+
+
+# Default plan sections, in document order
+
+OVERVIEW = """# 🏆 HeadCoachAI Practice Plan - {sport_title}
+
+## 📋 Practice Overview
+- **Sport**: {sport_title}
+- **Duration**: {duration} minutes
+- **Primary Focus**: {focus}
+- **Age Group**: {age_group}
+- **Skill Level**: {skill_level}
+- **Players**: {players}
+- **Generated**: {generated}
+
+---
+
+"""
+
+WARMUP = """## 🔥 Dynamic Warm-Up ({warmup_time} minutes)
+**Objective**: Activate muscles, prevent injuries, and prepare for {focus}
+
+### General Movement ({warmup_general_time} minutes)
+- **Light jogging** around playing area (2 minutes)
+- **Dynamic stretching sequence**:
+  - Leg swings (forward/back, side to side)
+  - Arm circles and shoulder rolls
+  - High knees and butt kicks
+  - Walking lunges with rotation
+
+### Sport-Specific Activation ({warmup_activation_time} minutes)
+- **{sport_title} movement patterns** at 50% intensity
+- **Ball familiarization** (if applicable)
+- **Partner warm-up activities**
+- **Gradual intensity increase** leading into main session
+
+**🎯 Coaching Focus**: 
+- Check for any physical concerns or injuries
+- Build positive energy and team communication
+- Emphasize proper movement mechanics
+- Set the tone for focused, fun practice
+
+---
+
+"""
+
+SKILLS = """## ⚡ Technical Skills Development ({skill_time} minutes)
+**Primary Focus**: {focus}
+
+### Station 1: Fundamental Technique ({skill_station_time} minutes)
+**Drill Inspiration**: {drill_1_title}
+
+- **Individual skill work** with immediate feedback
+- **Progressive difficulty** from basic to advanced
+- **Repetition with purpose** - quality over quantity
+- **Peer coaching opportunities** for advanced players
+
+**Key Teaching Points**:
+- Break down complex skills into simple components
+- Use positive reinforcement and specific feedback
+- Demonstrate proper technique multiple times
+- Allow for individual learning pace differences
+
+### Station 2: Applied Skills Under Pressure ({skill_station_time} minutes)
+**Drill Inspiration**: {drill_2_title}
+
+- **Small group challenges** (2-4 players)
+- **Add time pressure and decision-making**
+- **Competitive elements** to maintain engagement
+- **Rotate roles** to develop different perspectives
+
+**Key Teaching Points**:
+- Encourage risk-taking and creativity
+- Focus on decision-making speed
+- Celebrate effort and improvement
+- Connect skills to game situations
+
+---
+
+"""
+
+GAMES = """## 🎮 Game Application & Scrimmage ({game_time} minutes)
+**Objective**: Apply skills in realistic game scenarios
+
+### Small-Sided Games ({game_half_time} minutes)
+**Format**: Modified games (3v3, 4v4, or 5v5 depending on sport)
+
+- **Reduced playing area** for increased touches
+- **Modified rules** to emphasize {focus}
+- **Multiple games simultaneously** for maximum participation
+- **Quick rotations** every 3-4 minutes
+
+**Rule Modifications for {focus}**:
+- Bonus points for demonstrating focus skills
+- Mandatory touches or passes before scoring
+- Specific player roles to practice different positions
+
+### Competitive Challenges ({game_half_time} minutes)
+**Skills competitions and team challenges**
+
+- **Individual skill contests** related to session focus
+- **Team relay races** incorporating sport skills
+- **Fun games** that reinforce technique
+- **Positive competition** with emphasis on effort
+
+**🎯 Coaching During Games**:
+- Step back and let players make decisions
+- Provide encouragement rather than constant instruction
+- Highlight good examples of focus skills in action
+- Keep energy high with positive reinforcement
+
+---
+
+"""
+
+COOLDOWN = """## 🧘 Cool-Down & Team Building ({cooldown_time} minutes)
+**Objective**: Proper recovery and positive session closure
+
+### Physical Recovery ({cooldown_recovery_time} minutes)
+- **Walking cool-down** to lower heart rate
+- **Static stretching** for major muscle groups used
+- **Deep breathing exercises** for mental relaxation
+- **Hydration reminder** and injury check
+
+### Team Reflection & Connection ({cooldown_reflection_time} minutes)
+- **Circle up** for team discussion
+- **Highlight 3 positive moments** from practice
+- **Ask players**: "What did you learn today?"
+- **Preview next session** and upcoming events
+- **Team cheer or motivational closing**
+
+---
+
+"""
+
+COACHING_POINTS = """## 🎯 Sport-Specific Coaching Points for {sport_title}
+
+### Technical Focus Areas:
+- **Proper body mechanics** for injury prevention
+- **Progressive skill development** appropriate for age
+- **Decision-making skills** in game situations
+- **Teamwork and communication** emphasis
+
+### Safety Considerations:
+- Proper equipment check before starting
+- Age-appropriate contact and intensity levels
+- Hydration breaks every 15-20 minutes
+- Modified rules for safety in youth sports
+
+### Fun Factor Elements:
+- Variety in activities to maintain engagement
+- Opportunities for every player to succeed
+- Positive coaching language and encouragement
+- Games and challenges that build confidence
+
+---
+
+"""
+
+EQUIPMENT = """## 📋 Equipment Checklist
+- **{sport_title} balls**: 1 per 2-3 players minimum
+- **Cones/markers**: 20-30 for boundaries and drills
+- **Water bottles**: Ensure every player has access
+- **First aid kit**: Basic supplies and emergency contacts
+- **Pinnies/scrimmage vests**: For team identification
+- **Clipboard**: For notes and player feedback
+
+---
+
+"""
+
+ADAPTATIONS = """## 🔄 Adaptations by Skill Level
+
+### **Beginner Modifications**:
+- Slower pace with more demonstrations
+- Simplified rules and fewer variables
+- Extra encouragement and patience
+- Focus on fun and basic skill development
+- Shorter activity durations (3-5 minutes)
+
+### **Intermediate Adaptations**:
+- Add tactical elements and strategy
+- Increase pace and intensity gradually
+- Introduce more advanced techniques
+- Longer sustained activities (5-8 minutes)
+- Peer teaching opportunities
+
+### **Advanced Challenges**:
+- Higher intensity and game-like pressure
+- Complex tactical scenarios
+- Leadership roles and responsibility
+- Competitive elements and performance goals
+- Extended activity periods (8-12 minutes)
+
+---
+
+"""
+
+PRO_TIPS = """## 💡 HeadCoachAI Pro Tips
+
+### Before Practice:
+- Arrive 15 minutes early to set up equipment
+- Have a backup plan for weather or space issues
+- Review player names and any special considerations
+- Prepare positive energy and enthusiasm
+
+### During Practice:
+- Use every player's name frequently
+- Give specific, actionable feedback
+- Keep instructions simple and clear
+- Maintain high energy and positivity
+- Be flexible and adapt based on player needs
+
+### After Practice:
+- Clean up equipment together as a team
+- Send positive messages to parents about player progress
+- Reflect on what worked well and what to improve
+- Plan adjustments for next session
+
+---
+
+"""
+
+SUCCESS = """## 🌟 Session Success Indicators
+- ✅ Every player touched the ball/participated actively
+- ✅ Players demonstrated improvement in {focus}
+- ✅ Positive team energy and communication
+- ✅ Safe environment with no injuries
+- ✅ Players left excited for next practice
+- ✅ Coach felt organized and prepared
+
+---
+"""
+
+
+DRILLS_HEADER = """## 🎯 Your Selected Drills Integration
+
+You specifically requested these drills to be included:
+
+"""
+
+DRILL_ITEM = """**{index}. {drill}**
+   - Integrate into technical skills stations
+   - Modify difficulty based on player ability
+   - Use as warm-up or cool-down activity
+
+"""
+
+CLOSING = """
+---
+
+*🏆 This comprehensive practice plan was generated by HeadCoachAI*
+
+*Remember: Every player develops at their own pace. Use this plan as a guide, but always prioritize safety, fun, and individual growth. Adapt activities based on your team's specific needs and energy levels.*
+
+**Next Steps**: 
+- Review this plan before practice
+- Gather all necessary equipment  
+- Prepare for an amazing coaching session!
+
+*Good luck, Coach! Your players are lucky to have someone who cares about their development.* 🌟
+"""
+
+FLAG_FOOTBALL_EQUIPMENT = """## 📋 Equipment Checklist
+- **Footballs**: 1 per 2-3 players minimum
+- **Flag belts**: 1 per player, plus spares
+- **Cones/markers**: 20-30 for boundaries and drills
+- **Water bottles**: Ensure every player has access
+- **First aid kit**: Basic supplies and emergency contacts
+- **Pinnies/scrimmage vests**: For team identification
+- **Clipboard**: For notes and player feedback
+
+---
+
+"""
+
+
+DEFAULT_PLAN = PlanTemplate(
+    [
+        ("overview", OVERVIEW),
+        ("warmup", WARMUP),
+        ("skills", SKILLS),
+        ("games", GAMES),
+        ("cooldown", COOLDOWN),
+        ("coaching_points", COACHING_POINTS),
+        ("equipment", EQUIPMENT),
+        ("adaptations", ADAPTATIONS),
+        ("pro_tips", PRO_TIPS),
+        ("success", SUCCESS),
+    ],
+    DRILLS_HEADER,
+    DRILL_ITEM,
+    CLOSING,
+)
+
+# Sport-specific variants of the default plan
+TEMPLATES: Dict[str, PlanTemplate] = {
+    "flag-football": DEFAULT_PLAN.variant(equipment=FLAG_FOOTBALL_EQUIPMENT),
+}
+
+
+def template_for(sport: Optional[str]) -> PlanTemplate:
+    return TEMPLATES.get(sport, DEFAULT_PLAN)
+
+
+# Representative slot values for sample_output()
+SAMPLE_VALUES: Dict[str, object] = {
+    "sport_title": "Soccer",
+    "duration": 60,
+    "focus": "Passing",
+    "age_group": "All ages",
+    "skill_level": "Mixed abilities",
+    "players": "Flexible group size",
+    "generated": "January 01, 2025 at 05:00 PM",
+    "warmup_time": 8,
+    "warmup_general_time": 4,
+    "warmup_activation_time": 4,
+    "skill_time": 26,
+    "skill_station_time": 13,
+    "game_time": 20,
+    "game_half_time": 10,
+    "cooldown_time": 6,
+    "cooldown_recovery_time": 4,
+    "cooldown_reflection_time": 2,
+    "drill_1_title": "Progressive Skill Building",
+    "drill_2_title": "Competitive Application",
+}
+
+
+def sample_output() -> str:
+    """Every template rendered with sample values, default plan last
+
+    Used as a compression dictionary for stored plans, so the text that
+    plans share most should sit at the end.
+    """
+    plans = list(TEMPLATES.values()) + [DEFAULT_PLAN]
+    values = slot_values(SAMPLE_VALUES)
+    return "".join(plan.render(values, ["Selected Drill"]) for plan in plans)
@@ -0,0 +1,225 @@
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+# Sampled request profiling
+#
+# When enabled, a random sample of requests to the profiled routes is run
+# with a sampler thread that records the stack of the thread serving the
+# request every `interval` seconds. Stacks are written in the collapsed
+# format ("outer;inner;leaf count", loadable in speedscope or
+# flamegraph.pl) to PROFILE_DIR, next to a JSON file with the route, query,
+# request body and timing. Stacks are wall-clock: time spent awaiting an
+# upstream shows up as the event loop waiting. Only one request is
+# profiled at a time so concurrent requests don't share a profile.
+#
+# Settings changed through publish() (the admin endpoint) are written to
+# PROFILE_DIR/settings.json, which every worker checks at most once per
+# SYNC_INTERVAL, so toggling profiling reaches all of them. A settings file
+# left from before the process started is ignored in favour of the env.
+#
+# While disabled the middleware is a clock comparison per request.
+
+PROFILED_ROUTES = ("/api/generate-practice", "/api/search-drills")
+MAX_BODY_BYTES = 4096
+SETTINGS_FILE = "settings.json"
+SYNC_INTERVAL = 1.0
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Counts the stacks of one thread, sampled from a background thread"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[";".join(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class Profiler:
+    def __init__(self, directory: str, sample_rate: float = 0.0, interval: float = 0.001,
+                 max_profiles: int = 200, routes: Iterable[str] = PROFILED_ROUTES):
+        self.directory = directory
+        self.interval = interval
+        self.max_profiles = max_profiles
+        self.routes = frozenset(routes)
+        self.sample_rate = 0.0
+        self.enabled = False
+        self.configure(sample_rate)
+        self._busy = False
+        self.written = 0
+        self._settings_path = os.path.join(directory, SETTINGS_FILE)
+        self._settings_stamp = self._stamp()
+        self._next_sync = 0.0
+
+    def configure(self, sample_rate: float, interval: Optional[float] = None) -> None:
+        """Profile sample_rate (0 to 1) of requests to the profiled routes; 0 disables"""
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1")
+        if interval is not None:
+            if interval <= 0:
+                raise ValueError("interval must be positive")
+            self.interval = interval
+        self.sample_rate = sample_rate
+        self.enabled = sample_rate > 0
+
+    def publish(self, sample_rate: float, interval: Optional[float] = None) -> None:
+        """Configure this worker and share the settings with the others"""
+        self.configure(sample_rate, interval)
+        os.makedirs(self.directory, exist_ok=True)
+        temp = f"{self._settings_path}.{os.getpid()}"
+        with open(temp, "w") as f:
+            json.dump({"sample_rate": self.sample_rate, "interval": self.interval}, f)
+        os.replace(temp, self._settings_path)
+        self._settings_stamp = self._stamp()
+
+    def sync(self) -> None:
+        """Apply settings another worker published, checking at most every SYNC_INTERVAL"""
+        now = time.monotonic()
+        if now < self._next_sync:
+            return
+        self._next_sync = now + SYNC_INTERVAL
+        stamp = self._stamp()
+        if stamp is None or stamp == self._settings_stamp:
+            return
+        self._settings_stamp = stamp
+        try:
+            with open(self._settings_path) as f:
+                settings = json.load(f)
+            self.configure(settings["sample_rate"], settings.get("interval"))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error loading profiling settings: {e}")
+
+    def _stamp(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self._settings_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def should_profile(self, path: str) -> bool:
+        return not self._busy and path in self.routes and random.random() < self.sample_rate
+
+    def write(self, route: str, metadata: dict, sampler: StackSampler) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S.%f")
+        slug = re.sub(r"[^a-z0-9]+", "-", route.lower()).strip("-")
+        base = os.path.join(self.directory, f"{stamp}-{slug}-{metadata['duration_ms']:.0f}ms")
+        with open(base + ".collapsed", "w") as f:
+            f.write(sampler.collapsed())
+        with open(base + ".json", "w") as f:
+            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        self.written += 1
+        self._prune()
+        return base
+
+    def _prune(self) -> None:
+        profiles = sorted(name for name in os.listdir(self.directory) if name.endswith(".collapsed"))
+        for name in profiles[:max(0, len(profiles) - self.max_profiles)]:
+            for suffix in (".collapsed", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, name[:-len(".collapsed")] + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate, "interval": self.interval,
+                "directory": self.directory, "written": self.written}
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: Profiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        profiler = self.profiler
+        profiler.sync()
+        if not profiler.enabled or scope["type"] != "http" or not profiler.should_profile(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        profiler._busy = True
+        body = bytearray()
+        status = 500
+
+        async def receive_recorded():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) < MAX_BODY_BYTES:
+                body.extend(message.get("body", b"")[:MAX_BODY_BYTES - len(body)])
+            return message
+
+        async def send_recorded(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        sampler = StackSampler(threading.get_ident(), profiler.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive_recorded, send_recorded)
+        finally:
+            sampler.stop()
+            duration = time.perf_counter() - start
+            profiler._busy = False
+            metadata: Dict[str, object] = {
+                "route": scope["path"],
+                "method": scope["method"],
+                "query": scope.get("query_string", b"").decode("latin-1"),
+                "body": body.decode("utf-8", "replace"),
+                "status": status,
+                "duration_ms": duration * 1000,
+                "interval": sampler.interval,
+                "samples": sum(sampler.stacks.values()),
+            }
+            try:
+                await asyncio.to_thread(profiler.write, scope["path"], metadata, sampler)
+            except OSError as e:
+                print(f"Error writing profile: {e}")
+
+
+def create_profiler() -> Profiler:
+    """Profiler configured by PROFILE_SAMPLE_RATE (0 disables), PROFILE_DIR,
+    PROFILE_INTERVAL and PROFILE_MAX_FILES"""
+    return Profiler(
+        os.getenv("PROFILE_DIR", "profiles"),
+        float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+        float(os.getenv("PROFILE_INTERVAL", "0.001")),
+        int(os.getenv("PROFILE_MAX_FILES", "200")),
+    )
@@ -0,0 +1,190 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import os
+import sqlite3
+import threading
+import time
+
+# Per-user rate limiting
+#
+# Each limited endpoint has a token bucket per user: it holds up to
+# `capacity` units and refills at capacity / period units per second, and
+# a request spends `cost` units (one per practice for batches). The memory
+# backend keeps buckets in a dict touched only from the event loop, so it
+# needs no locks, and forgets the least recently used bucket when full; the
+# SQLite backend shares buckets between the workers on one host, updating
+# a bucket in one short write transaction. That transaction can wait on
+# other workers' locks, so limiters with `blocking` set are called from a
+# thread.
+
+@dataclass(frozen=True)
+class Limit:
+    name: str
+    capacity: float
+    period: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+
+def parse_limit(name: str, spec: str) -> Optional[Limit]:
+    """A limit from "<units>/<seconds>", e.g. "30/60"; "off" or "" disables it"""
+    if not spec or spec == "off":
+        return None
+    capacity, period = spec.split("/")
+    return Limit(name, float(capacity), float(period))
+
+
+def _refill(tokens: float, updated_at: float, now: float, limit: Limit) -> float:
+    return min(limit.capacity, tokens + (now - updated_at) * limit.rate)
+
+
+def _retry_after(tokens: float, cost: float, limit: Limit) -> float:
+    if cost > limit.capacity:
+        # Never affordable; waiting for a full bucket is the best we can say
+        return limit.period
+    return (cost - tokens) / limit.rate
+
+
+class MemoryRateLimiter:
+    """Token buckets in this process; each worker enforces its own limits"""
+
+    blocking = False
+
+    def __init__(self, max_buckets: int = 100000):
+        self.max_buckets = max_buckets
+        # (limit name, user) -> [tokens, updated_at], least recently used first
+        self._buckets: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self.allowed: Dict[str, int] = {}
+        self.limited: Dict[str, int] = {}
+
+    def acquire(self, limit: Limit, user: str, cost: float = 1) -> float:
+        """Spend cost units; returns 0 when allowed, else seconds until it would be"""
+        now = time.monotonic()
+        key = (limit.name, user)
+        bucket = self._buckets.get(key)
+        tokens = limit.capacity if bucket is None else _refill(bucket[0], bucket[1], now, limit)
+        if tokens < cost:
+            if bucket is not None:
+                self._buckets.move_to_end(key)
+            self.limited[limit.name] = self.limited.get(limit.name, 0) + 1
+            return _retry_after(tokens, cost, limit)
+        tokens -= cost
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                # Usually refilled by now, and a full bucket is the same as none
+                self._buckets.popitem(last=False)
+            self._buckets[key] = [tokens, now]
+        else:
+            bucket[0], bucket[1] = tokens, now
+            self._buckets.move_to_end(key)
+        self.allowed[limit.name] = self.allowed.get(limit.name, 0) + 1
+        return 0.0
+
+    def stats(self) -> dict:
+        return {"backend": "memory", "buckets": len(self._buckets),
+                "allowed": dict(self.allowed), "limited": dict(self.limited)}
+
+
+class SqliteRateLimiter:
+    """Token buckets in a SQLite file shared by the workers on one host"""
+
+    blocking = True
+
+    def __init__(self, path: str, prune_every: int = 1000):
+        self.path = path
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._acquires = 0
+        # Counters are updated from the threads acquire is called from
+        self._counts_lock = threading.Lock()
+        self.allowed: Dict[str, int] = {}
+        self.limited: Dict[str, int] = {}
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            " name TEXT NOT NULL, user_id TEXT NOT NULL,"
+            " tokens REAL NOT NULL, updated_at REAL NOT NULL, full_at REAL NOT NULL,"
+            " PRIMARY KEY (name, user_id))")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Close this thread's connection; the next call opens a new one"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def acquire(self, limit: Limit, user: str, cost: float = 1) -> float:
+        # Wall-clock time: buckets are shared between processes
+        now = time.time()
+        conn = self._conn()
+        self._acquires += 1
+        if self._acquires % self.prune_every == 0:
+            self._prune(conn, now)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_buckets WHERE name = ? AND user_id = ?",
+                (limit.name, user)).fetchone()
+            tokens = limit.capacity if row is None else _refill(row[0], row[1], now, limit)
+            if tokens < cost:
+                conn.execute("COMMIT")
+                self._count(self.limited, limit.name)
+                return _retry_after(tokens, cost, limit)
+            tokens -= cost
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_buckets (name, user_id, tokens, updated_at, full_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (limit.name, user, tokens, now, now + (limit.capacity - tokens) / limit.rate))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._count(self.allowed, limit.name)
+        return 0.0
+
+    def _count(self, counts: Dict[str, int], name: str) -> None:
+        with self._counts_lock:
+            counts[name] = counts.get(name, 0) + 1
+
+    def _prune(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM rate_buckets WHERE full_at <= ?", (now,))
+
+    def stats(self) -> dict:
+        buckets = self._conn().execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0]
+        with self._counts_lock:
+            return {"backend": "sqlite", "buckets": buckets,
+                    "allowed": dict(self.allowed), "limited": dict(self.limited)}
+
+
+def _limit(name: str, default: str) -> Optional[Limit]:
+    return parse_limit(name, os.getenv(f"RATE_LIMIT_{name.upper()}", default))
+
+
+# Budgets per endpoint, configured by RATE_LIMIT_<NAME> as "<units>/<seconds>"
+LIMITS: Dict[str, Optional[Limit]] = {
+    "generate": _limit("generate", "60/60"),
+    "stream": _limit("stream", "60/60"),
+    # Batches spend one unit per practice
+    "batch": _limit("batch", "500/3600"),
+}
+
+
+def create_rate_limiter():
+    """Build the limiter selected by RATE_LIMIT_BACKEND (memory, sqlite or off)"""
+    backend = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        return SqliteRateLimiter(os.getenv("RATE_LIMIT_PATH", "rate_limits.sqlite3"))
+    return MemoryRateLimiter(int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000")))
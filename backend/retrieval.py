@@ -0,0 +1,182 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import os
+import zlib
+
+import numpy as np
+
+from catalog import FOCUS_SLOT, Drill, DrillCatalog, catalog_store, keywords
+
+# Semantic drill retrieval
+#
+# Drills are embedded when the catalog loads with a hashed TF-IDF
+# vectorizer (words, word bigrams and character trigrams hashed into a
+# fixed number of buckets), L2-normalized and stored in one float32
+# matrix ordered by sport, so each sport is a contiguous slice. A focus
+# query is embedded the same way and scored against a slice with one
+# matrix-vector product; batches of queries use one matrix product.
+#
+# Embeddings are saved next to the compiled catalog, named by its
+# fingerprint, and memory-mapped by every worker; they are only computed
+# when no file exists for the current catalog.
+
+DIMENSIONS = 512
+TRIGRAM_WEIGHT = 0.25
+# Below this, a match is indistinguishable from hashing noise
+MIN_SIMILARITY = 0.15
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s"):
+        if len(word) > len(suffix) + 3 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def _bucket(feature: str, dimensions: int) -> int:
+    # crc32 rather than hash(): stable across processes and restarts
+    return zlib.crc32(feature.encode()) % dimensions
+
+
+def features(text: str) -> Dict[str, float]:
+    words = [_stem(word) for word in keywords(text)]
+    weights: Dict[str, float] = {}
+    for word in words:
+        weights["w:" + word] = weights.get("w:" + word, 0.0) + 1.0
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            key = "c:" + padded[i:i + 3]
+            weights[key] = weights.get(key, 0.0) + TRIGRAM_WEIGHT
+    for first, second in zip(words, words[1:]):
+        key = f"b:{first} {second}"
+        weights[key] = weights.get(key, 0.0) + 1.0
+    return weights
+
+
+class DrillEmbeddings:
+    def __init__(self, drills: Sequence[Drill], dimensions: int = DIMENSIONS, path: Optional[str] = None):
+        self.dimensions = dimensions
+        # Order drills by sport so every sport is a contiguous row range
+        order = sorted(range(len(drills)), key=lambda i: (drills[i].sport, i))
+        self.drills: List[Drill] = [drills[i] for i in order]
+        self.slices: Dict[str, slice] = {}
+        for row, drill in enumerate(self.drills):
+            current = self.slices.get(drill.sport)
+            self.slices[drill.sport] = slice(current.start if current else row, row + 1)
+
+        # Row 0 of the saved array is the idf vector, the rest the drills
+        if path and os.path.exists(path):
+            stored = np.load(path, mmap_mode="r")
+            if stored.shape == (len(self.drills) + 1, dimensions):
+                self.idf, self.matrix = stored[0], stored[1:]
+                return
+        self.idf, self.matrix = self._embed_drills()
+        if path:
+            self._save(path)
+
+    def _embed_drills(self) -> Tuple[np.ndarray, np.ndarray]:
+        counts = np.zeros((len(self.drills), self.dimensions), dtype=np.float32)
+        for row, drill in enumerate(self.drills):
+            text = drill.title + " " + drill.description.replace(FOCUS_SLOT, "")
+            self._accumulate(counts[row], features(text))
+        document_frequency = np.count_nonzero(counts, axis=0)
+        idf = np.log((1 + len(self.drills)) / (1 + document_frequency)).astype(np.float32) + 1
+        return idf, self._normalize(np.log1p(counts) * idf)
+
+    def _save(self, path: str) -> None:
+        directory, name = os.path.split(path)
+        prefix = name.split(".emb-")[0] + ".emb-"
+        # Outside the prefix, so another worker's sweep cannot remove it
+        # before it is renamed into place
+        tmp_path = os.path.join(directory, f".tmp{os.getpid()}-{name}")
+        np.save(tmp_path, np.vstack([self.idf, self.matrix]))
+        os.replace(tmp_path, path)
+        for stale in os.listdir(directory or "."):
+            if stale.startswith(prefix) and stale != name:
+                os.remove(os.path.join(directory, stale))
+
+    def _accumulate(self, row: np.ndarray, weights: Dict[str, float]) -> None:
+        for feature, weight in weights.items():
+            row[_bucket(feature, self.dimensions)] += weight
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def embed(self, queries: Sequence[str]) -> np.ndarray:
+        counts = np.zeros((len(queries), self.dimensions), dtype=np.float32)
+        for row, query in enumerate(queries):
+            self._accumulate(counts[row], features(query))
+        return self._normalize(np.log1p(counts) * self.idf)
+
+    def _rows(self, sport: Optional[str] = None) -> slice:
+        if sport is None:
+            return slice(0, len(self.drills))
+        return self.slices.get(sport, slice(0, 0))
+
+    def top(self, query: str, sport: Optional[str] = None, k: int = 5) -> List[Tuple[Drill, float]]:
+        """The k drills most similar to the query, best first
+
+        Ties (including drills with no similarity at all) keep catalog order.
+        """
+        return self.top_many([query], sport, k)[0]
+
+    def top_many(self, queries: Sequence[str], sport: Optional[str] = None, k: int = 5) -> List[List[Tuple[Drill, float]]]:
+        rows = self._rows(sport)
+        candidates = self.matrix[rows]
+        if not len(queries) or not len(candidates):
+            return [[] for _ in queries]
+        scores = self.embed(queries) @ candidates.T
+        k = min(k, candidates.shape[0])
+        results = []
+        for query_scores in scores:
+            if k < len(query_scores):
+                # Everything above the k-th best score, then ties in row order
+                kth = np.partition(query_scores, len(query_scores) - k)[len(query_scores) - k]
+                above = np.flatnonzero(query_scores > kth)
+                ties = np.flatnonzero(query_scores == kth)[:k - len(above)]
+                best = np.concatenate([above, ties])
+            else:
+                best = np.arange(len(query_scores))
+            best = sorted(best, key=lambda i: (-query_scores[i], i))
+            results.append([(self.drills[rows.start + i], float(query_scores[i])) for i in best])
+        return results
+
+
+def embeddings_path() -> str:
+    version = f"d{DIMENSIONS}t{TRIGRAM_WEIGHT}"
+    return f"{catalog_store.path}.emb-{catalog_store.fingerprint[:16]}-{version}.npy"
+
+
+def _load_embeddings(catalog: DrillCatalog) -> DrillEmbeddings:
+    try:
+        return DrillEmbeddings(catalog.drills, path=embeddings_path())
+    except OSError as e:
+        print(f"Could not use saved drill embeddings, computing in memory: {e}")
+        return DrillEmbeddings(catalog.drills)
+
+
+drill_embeddings = _load_embeddings(catalog_store.catalog)
+
+
+def _catalog_reloaded(catalog: DrillCatalog) -> None:
+    global drill_embeddings
+    drill_embeddings = _load_embeddings(catalog)
+
+
+catalog_store.on_reload(_catalog_reloaded)
+
+
+def best_matching_drills(focus: str, sport: str, k: int = 2) -> List[Drill]:
+    """Catalog drills for a sport that best match a focus
+
+    When fewer than k drills match, the rest are the sport's first drills
+    in catalog order.
+    """
+    matches = [drill for drill, score in drill_embeddings.top(focus, sport, k) if score >= MIN_SIMILARITY]
+    for drill in catalog_store.catalog.by_sport(sport):
+        if len(matches) >= k:
+            break
+        if drill not in matches:
+            matches.append(drill)
+    return matches
@@ -0,0 +1,243 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+import re
+
+from catalog import keywords
+
+# Practice session scheduling
+#
+# A session is a sequence of blocks (warm-up, skills, games, cool-down),
+# each with a minimum length, a target share of the session and a step:
+# the skills block is split evenly into station rotations and the games
+# block into two halves, so their lengths are multiples of those counts.
+# The solver starts every block at its target rounded down to its step
+# (but not below its minimum), then moves one step at a time to or from
+# the block furthest from its target until the blocks add up to the
+# session length exactly. That takes a handful of steps per block, and
+# results are memoized on the duration, player count, stations and focus
+# weighting, so a season of same-length sessions is solved once.
+
+WARMUP = "warmup"
+SKILLS = "skills"
+GAMES = "games"
+COOLDOWN = "cooldown"
+
+
+@dataclass(frozen=True)
+class Block:
+    name: str
+    minimum: int
+    share: float
+    step: int = 1
+
+
+# Shares follow the previous fixed split of 1/8, 1/2.5, 1/3 and 1/10 of
+# the session, normalized by the solver
+BLOCKS: Tuple[Block, ...] = (
+    Block(WARMUP, 8, 1 / 8),
+    Block(SKILLS, 20, 1 / 2.5),
+    Block(GAMES, 15, 1 / 3, step=2),
+    Block(COOLDOWN, 5, 1 / 10),
+)
+
+# Focus keywords that shift time between blocks (multipliers on shares)
+FOCUS_WEIGHTS: Dict[str, Dict[str, float]] = {
+    "conditioning": {WARMUP: 1.25, GAMES: 1.25},
+    "fitness": {WARMUP: 1.25, GAMES: 1.25},
+    "scrimmage": {GAMES: 1.5},
+    "gameplay": {GAMES: 1.5},
+    "tactics": {GAMES: 1.25},
+    "technique": {SKILLS: 1.25},
+    "fundamentals": {SKILLS: 1.25},
+}
+
+# Skill stations in the plan templates, and the shortest useful station drill
+STATIONS = 2
+MIN_STATION_MINUTES = 5
+# Fewer players than this per station run the stations as one group
+MIN_GROUP_SIZE = 3
+
+# Fixed-length openings of the warm-up and cool-down, when there is room
+WARMUP_GENERAL_MINUTES = 4
+COOLDOWN_REFLECTION_MINUTES = 2
+
+
+@dataclass(frozen=True)
+class Segment:
+    name: str
+    start: int
+    minutes: int
+    parts: Tuple["Segment", ...] = ()
+
+    def as_dict(self) -> dict:
+        segment = {"name": self.name, "start": self.start, "minutes": self.minutes}
+        if self.parts:
+            segment["parts"] = [part.as_dict() for part in self.parts]
+        return segment
+
+
+@dataclass(frozen=True)
+class Rotation:
+    start: int
+    minutes: int
+    # Group at each station, or None when the station is idle
+    groups: Tuple[Optional[int], ...]
+
+
+@dataclass(frozen=True)
+class Schedule:
+    duration: int
+    segments: Tuple[Segment, ...]
+    group_sizes: Tuple[int, ...]
+    rotations: Tuple[Rotation, ...]
+
+    def segment(self, name: str) -> Segment:
+        return next(segment for segment in self.segments if segment.name == name)
+
+    def part(self, name: str, part: str) -> Segment:
+        return next(p for p in self.segment(name).parts if p.name == part)
+
+    def as_dict(self) -> dict:
+        return {
+            "duration": self.duration,
+            "segments": [segment.as_dict() for segment in self.segments],
+            "group_sizes": list(self.group_sizes),
+            "rotations": [
+                {"start": r.start, "minutes": r.minutes, "groups": list(r.groups)} for r in self.rotations],
+        }
+
+
+def focus_weights(focus: str) -> Tuple[float, ...]:
+    """Share multiplier per block for a focus, in BLOCKS order"""
+    weights = dict.fromkeys((block.name for block in BLOCKS), 1.0)
+    for word in keywords(focus):
+        for name, factor in FOCUS_WEIGHTS.get(word, {}).items():
+            weights[name] = max(weights[name], factor)
+    return tuple(weights[block.name] for block in BLOCKS)
+
+
+def parse_player_count(player_count: Optional[str]) -> Optional[int]:
+    """Smallest number in a free-form player count ("12", "10-14 players")"""
+    numbers = [int(n) for n in re.findall(r"\d+", player_count or "")]
+    return min(numbers) if numbers else None
+
+
+def allocate(duration: int, blocks: Sequence[Block], weights: Sequence[float]) -> List[int]:
+    """Whole minutes per block, adding up to duration
+
+    Each block gets a multiple of its step and at least its minimum; when
+    the minimums don't fit in the session they are scaled down to fit.
+    The last block must have a step of 1 so any duration can be filled.
+    """
+    if duration <= 0:
+        raise ValueError("Session duration must be positive")
+    if blocks[-1].step != 1:
+        raise ValueError("The last block must have a step of 1")
+
+    shares = [block.share * weight for block, weight in zip(blocks, weights)]
+    total_share = sum(shares)
+    targets = [duration * share / total_share for share in shares]
+
+    minimums = [block.minimum for block in blocks]
+    if sum(minimums) > duration:
+        minimums = [minimum * duration // sum(minimums) for minimum in minimums]
+    minimums = [m - m % block.step for m, block in zip(minimums, blocks)]
+
+    minutes = [
+        max(minimum, int(target) - int(target) % block.step)
+        for minimum, target, block in zip(minimums, targets, blocks)]
+
+    # Give back steps from the blocks furthest above target...
+    while sum(minutes) > duration:
+        i = max(
+            (i for i, block in enumerate(blocks) if minutes[i] - block.step >= minimums[i]),
+            key=lambda i: (minutes[i] - targets[i], -i))
+        minutes[i] -= blocks[i].step
+    # ...and hand out steps to the blocks furthest below it
+    while sum(minutes) < duration:
+        remaining = duration - sum(minutes)
+        i = max(
+            (i for i, block in enumerate(blocks) if block.step <= remaining),
+            key=lambda i: (targets[i] - minutes[i], -i))
+        minutes[i] += blocks[i].step
+    return minutes
+
+
+def _split(minutes: int, opening: int) -> Tuple[int, int]:
+    # A fixed opening part, shortened to at most half of short blocks
+    first = min(opening, minutes // 2)
+    return first, minutes - first
+
+
+def rotations(start: int, minutes: int, stations: int, groups: int) -> Tuple[Rotation, ...]:
+    """Station rotations for a skills block of minutes (a multiple of stations)
+
+    With one group per station every group visits every station; a single
+    group works through the stations in order.
+    """
+    length = minutes // stations
+    result = []
+    for r in range(stations):
+        if groups == stations:
+            assigned = tuple((station - r) % stations for station in range(stations))
+        else:
+            assigned = tuple(0 if station == r else None for station in range(stations))
+        result.append(Rotation(start + r * length, length, assigned))
+    return tuple(result)
+
+
+def session_blocks(stations: int = STATIONS) -> Tuple[Block, ...]:
+    """BLOCKS with the skills block sized for whole station rotations"""
+    return tuple(
+        Block(b.name, max(b.minimum, stations * MIN_STATION_MINUTES), b.share, stations) if b.name == SKILLS else b
+        for b in BLOCKS)
+
+
+def minimum_duration(stations: int = STATIONS) -> int:
+    """Shortest session in which every block gets its minimum"""
+    return sum(block.minimum for block in session_blocks(stations))
+
+
+# Shorter sessions would squeeze blocks below their minimums, down to nothing
+MIN_DURATION = minimum_duration()
+
+
+@lru_cache(maxsize=4096)
+def _schedule(duration: int, players: Optional[int], stations: int, weights: Tuple[float, ...]) -> Schedule:
+    blocks = session_blocks(stations)
+    minutes = dict(zip((block.name for block in blocks), allocate(duration, blocks, weights)))
+
+    warmup_general, warmup_activation = _split(minutes[WARMUP], WARMUP_GENERAL_MINUTES)
+    cooldown_reflection, cooldown_recovery = _split(minutes[COOLDOWN], COOLDOWN_REFLECTION_MINUTES)
+    parts = {
+        WARMUP: (("general", warmup_general), ("activation", warmup_activation)),
+        GAMES: (("small_sided", minutes[GAMES] // 2), ("challenges", minutes[GAMES] // 2)),
+        COOLDOWN: (("recovery", cooldown_recovery), ("reflection", cooldown_reflection)),
+    }
+    segments = []
+    clock = 0
+    for block in blocks:
+        part_clock = clock
+        block_parts = []
+        for name, length in parts.get(block.name, ()):
+            block_parts.append(Segment(name, part_clock, length))
+            part_clock += length
+        segments.append(Segment(block.name, clock, minutes[block.name], tuple(block_parts)))
+        clock += minutes[block.name]
+
+    groups = stations if players is None or players >= stations * MIN_GROUP_SIZE else 1
+    if players is None:
+        group_sizes: Tuple[int, ...] = ()
+    else:
+        group_sizes = tuple(players // groups + (1 if g < players % groups else 0) for g in range(groups))
+    skills = next(segment for segment in segments if segment.name == SKILLS)
+    return Schedule(
+        duration, tuple(segments), group_sizes,
+        rotations(skills.start, skills.minutes, stations, groups))
+
+
+def schedule_session(duration: int, focus: str = "", player_count: Optional[str] = None,
+                     stations: int = STATIONS) -> Schedule:
+    """Minute-by-minute schedule for one practice session"""
+    return _schedule(duration, parse_player_count(player_count), stations, focus_weights(focus))
@@ -0,0 +1,166 @@
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import heapq
+import math
+
+from catalog import FOCUS_SLOT, Drill, DrillCatalog, catalog_store, keywords
+
+# Drill search index
+#
+# In-memory inverted index over drill titles and descriptions with BM25
+# ranking, sport and source filters and prefix expansion of the last query word for
+# typeahead. Drills can be added one at a time; postings, facet sets and
+# the sorted term list are updated in place rather than rebuilt, and a
+# reloaded catalog that only appends drills is indexed incrementally.
+
+TITLE_WEIGHT = 2
+MAX_PREFIX_TERMS = 50
+
+
+class DrillIndex:
+    def __init__(self, drills: Iterable[Drill] = (), k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._reset()
+        for drill in drills:
+            self.add(drill)
+
+    def _reset(self) -> None:
+        self.drills: List[Drill] = []
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: List[int] = []
+        self._total_length = 0
+        self._norms: List[float] = []
+        self._terms: List[str] = []
+        self._facets: Dict[Tuple[str, str], Set[int]] = {}
+
+    def add(self, drill: Drill) -> int:
+        doc = len(self.drills)
+        self.drills.append(drill)
+
+        terms = keywords(drill.title) * TITLE_WEIGHT + keywords(drill.description.replace(FOCUS_SLOT, ""))
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                insort(self._terms, term)
+            postings[doc] = count
+        self._lengths.append(len(terms))
+        self._total_length += len(terms)
+
+        self._facets.setdefault(("sport", drill.sport), set()).add(doc)
+        self._facets.setdefault(("source", drill.source), set()).add(doc)
+        return doc
+
+    def sync(self, drills: Sequence[Drill]) -> None:
+        """Index a new version of the catalog
+
+        Appended drills are added incrementally; any other change rebuilds.
+        """
+        indexed = [drill.fields() for drill in self.drills]
+        if [drill.fields() for drill in drills[:len(indexed)]] != indexed:
+            self._reset()
+        for drill in drills[len(self.drills):]:
+            self.add(drill)
+
+    def __len__(self) -> int:
+        return len(self.drills)
+
+    def _expand(self, prefix: str) -> List[str]:
+        start = bisect_left(self._terms, prefix)
+        terms = []
+        for term in self._terms[start:start + MAX_PREFIX_TERMS]:
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+        return terms
+
+    def filter(self, sport: Optional[str] = None, source: Optional[str] = None) -> Optional[Set[int]]:
+        """Documents matching every given facet, or None when no facet is given"""
+        selected: Optional[Set[int]] = None
+
+        def narrow(docs: Set[int]):
+            nonlocal selected
+            selected = set(docs) if selected is None else selected & docs
+
+        if sport:
+            narrow(self._facets.get(("sport", sport), set()))
+        if source:
+            narrow(self._facets.get(("source", source), set()))
+        return selected
+
+    def scores(self, query: str, prefix: bool = False, docs: Optional[Set[int]] = None) -> Dict[int, float]:
+        """BM25 score of every document matching the query
+
+        With prefix=True the last query word also matches longer terms
+        (typeahead).
+        """
+        words = keywords(query)
+        if not words or not self.drills:
+            return {}
+        terms = list(dict.fromkeys(words))
+        if prefix:
+            last = terms.pop()
+            terms.extend(term for term in self._expand(last) if term not in terms)
+
+        n = len(self.drills)
+        norms = self._length_norms()
+        k1 = self.k1
+        scores: Dict[int, float] = {}
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5)) * (k1 + 1)
+            if docs is not None and len(docs) < len(postings):
+                matches = [(doc, postings[doc]) for doc in docs if doc in postings]
+            else:
+                matches = postings.items() if docs is None else [
+                    (doc, tf) for doc, tf in postings.items() if doc in docs]
+            for doc, tf in matches:
+                scores[doc] = scores.get(doc, 0.0) + idf * tf / (tf + norms[doc])
+        return scores
+
+    def _length_norms(self) -> List[float]:
+        # BM25 length normalization per document; depends on the average
+        # length, so it is recomputed only after drills are added
+        if len(self._norms) != len(self.drills):
+            average_length = self._total_length / len(self.drills)
+            self._norms = [
+                self.k1 * (1 - self.b + self.b * length / average_length) for length in self._lengths]
+        return self._norms
+
+    def search(self, query: str, limit: Optional[int] = 10, prefix: bool = False, **facets) -> List[Tuple[Drill, float]]:
+        """Drills matching the query and facets, best first"""
+        scores = self.scores(query, prefix, self.filter(**facets))
+        order = lambda item: (-item[1], item[0])
+        if limit is None:
+            ranked = sorted(scores.items(), key=order)
+        else:
+            ranked = heapq.nsmallest(limit, scores.items(), key=order)
+        return [(self.drills[doc], score) for doc, score in ranked]
+
+    def rank(self, query: str, **facets) -> List[Drill]:
+        """Every drill matching the facets, query matches first, otherwise in catalog order"""
+        docs = self.filter(**facets)
+        if docs is None:
+            docs = set(range(len(self.drills)))
+        scores = self.scores(query, docs=docs)
+        return [self.drills[doc] for doc in sorted(docs, key=lambda doc: (-scores.get(doc, 0.0), doc))]
+
+    def suggest(self, prefix: str, limit: int = 10, **facets) -> List[str]:
+        """Drill titles for a partially typed query"""
+        return [drill.title for drill, _ in self.search(prefix, limit=limit, prefix=True, **facets)]
+
+
+drill_index = DrillIndex(catalog_store.catalog.drills)
+
+
+def _catalog_reloaded(catalog: DrillCatalog) -> None:
+    drill_index.sync(catalog.drills)
+
+
+catalog_store.on_reload(_catalog_reloaded)
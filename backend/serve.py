@@ -0,0 +1,188 @@
+"""Preforking production server
+
+Loads the app once, then forks worker processes that share it:
+
+    python serve.py [--workers 4] [--host 0.0.0.0] [--port 8000]
+
+The worker count defaults to WEB_CONCURRENCY, or one per available CPU.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Dict
+
+from dotenv import load_dotenv
+
+# Prefork serving
+#
+# The parent imports the app, which loads the drill catalog, search index,
+# embeddings and compiled templates, and renders one plan per sport so
+# lazily built state (drill views, schedule and adaptation caches) exists
+# too. It then closes its database connections, binds the listening
+# socket and forks the workers, which all accept on that socket. Workers
+# share the parent's memory copy-on-write.
+#
+# The cyclic garbage collector writes to the header of every object it
+# examines, which would copy the shared pages into each worker. The parent
+# runs with the collector disabled and calls gc.freeze() before forking,
+# which moves everything loaded so far out of the collector's view; each
+# worker then re-enables it for its own objects.
+#
+# State that workers must agree on has to live outside them: with more
+# than one worker, the rate limiter and the plan cache default to their
+# SQLite backends (one file shared by the workers) instead of per-process
+# memory, unless RATE_LIMIT_BACKEND or PLAN_CACHE_BACKEND says otherwise.
+#
+# The parent restarts workers that exit and, on SIGTERM or SIGINT, stops
+# them (each finishes its in-flight requests) before exiting itself.
+
+RESTART_DELAY = 1.0
+STOP_TIMEOUT = 30.0
+# Backends shared by the workers on one host, used unless configured
+SHARED_BACKENDS = {"RATE_LIMIT_BACKEND": "sqlite", "PLAN_CACHE_BACKEND": "sqlite"}
+
+
+def warm_up(backend) -> None:
+    """Run the plan and search paths once per sport"""
+    from metrics import registry
+    from plan_model import parse_plan
+
+    for sport in backend.catalog_store.catalog.sports:
+        request = backend.PracticeRequest(sport=sport, duration="60", focus="passing")
+        parse_plan(backend.render_practice_plan(request)["generated_plan"])
+        backend.search_catalog(sport, "passing")
+    backend.app.openapi()
+    registry.reset()
+
+
+def listen(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket) -> None:
+    import uvicorn
+
+    # Signals reach workers only through the parent, so a Ctrl-C in a
+    # terminal does not also interrupt them directly (twice is a forced exit)
+    os.setpgid(0, 0)
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+    gc.enable()
+    uvicorn.Server(uvicorn.Config(app, lifespan="on")).run(sockets=[sock])
+
+
+class Arbiter:
+    """Forks the workers and keeps workers running until told to stop"""
+
+    def __init__(self, app, sock: socket.socket, workers: int):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.pids: Dict[int, float] = {}
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                run_worker(self.app, self.sock)
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                traceback.print_exc()
+                status = 1
+            finally:
+                # Skip the atexit handlers inherited from the parent
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+        self.pids[pid] = time.monotonic()
+
+    def stop(self, signum, frame) -> None:
+        if self.stopping:
+            return
+        self.stopping = True
+        print(f"Stopping {len(self.pids)} workers")
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        signal.alarm(int(STOP_TIMEOUT))
+
+    def kill(self, signum, frame) -> None:
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGALRM, self.kill)
+        for _ in range(self.workers):
+            self.spawn()
+        while self.pids:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.pids.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting",
+                  file=sys.stderr)
+            # Don't spin when workers die right after starting
+            if time.monotonic() - started < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            self.spawn()
+
+
+def default_workers() -> int:
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.environ["WEB_CONCURRENCY"])
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+
+
+def main():
+    # Before anything reads the environment, so .env settings win over the
+    # defaults below and WEB_CONCURRENCY can be set there too
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=default_workers())
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        for name, backend in SHARED_BACKENDS.items():
+            os.environ.setdefault(name, backend)
+
+    # Nothing loaded from here on is collected in the parent (see above)
+    gc.disable()
+    start = time.perf_counter()
+    import main as backend
+
+    warm_up(backend)
+    backend.release_connections()
+    sock = listen(args.host, args.port)
+    print(f"Loaded the app in {time.perf_counter() - start:.2f}s, "
+          f"starting {args.workers} workers on {args.host}:{args.port}")
+    gc.freeze()
+    Arbiter(backend.app, sock, args.workers).run()
+
+
+if __name__ == "__main__":
+    main()
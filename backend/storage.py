@@ -0,0 +1,388 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import base64
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import uuid
+import zlib
+
+# Practice plan storage
+#
+# Handlers talk to a PracticePlanRepository. The SQLite backend keeps a
+# small pool of connections and uses SQL that also runs on Postgres
+# (row-value comparisons, plain indexes), so the same schema and queries
+# carry over to a Supabase table. Listings use keyset pagination on
+# (created_at, id): the next page starts after the last row returned, so
+# the cost of a page does not grow with how many plans a user has.
+#
+# Generated plan bodies are stored once per distinct content (keyed by
+# SHA-256) and compressed with zlib using a preset dictionary of template
+# output, since most of every plan is shared boilerplate. Listings never
+# touch the bodies; they are loaded when a single plan is fetched.
+
+PLAN_COLUMNS = (
+    "id", "user_id", "title", "sport", "duration", "age_group", "skill_level",
+    "focus_areas", "selected_drills", "body_hash", "created_at", "updated_at",
+)
+
+# Columns returned by listings; plan bodies are fetched one plan at a time
+SUMMARY_COLUMNS = (
+    "id", "title", "sport", "duration", "age_group", "skill_level",
+    "focus_areas", "selected_drills", "created_at",
+)
+
+# Fields of a single plan returned to its owner; the rest is bookkeeping
+DETAIL_FIELDS = SUMMARY_COLUMNS + ("generated_plan",)
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS practice_plans (
+        id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        title TEXT NOT NULL,
+        sport TEXT NOT NULL,
+        duration INTEGER NOT NULL,
+        age_group TEXT,
+        skill_level TEXT,
+        focus_areas TEXT,
+        selected_drills TEXT NOT NULL DEFAULT '[]',
+        body_hash TEXT NOT NULL,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS plan_bodies (
+        hash TEXT PRIMARY KEY,
+        dictionary_id TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        data BLOB NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS compression_dictionaries (
+        id TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS practice_plans_user_created"
+    " ON practice_plans (user_id, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS practice_plans_sport ON practice_plans (sport)",
+)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class InvalidPlan(ValueError):
+    """A plan whose values cannot be stored"""
+
+
+# SQLite INTEGER range
+MIN_INTEGER, MAX_INTEGER = -2 ** 63, 2 ** 63 - 1
+
+# What utc_now() produces; cursors carry one
+TIMESTAMP_RE = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{6}Z")
+
+
+def encode_cursor(created_at: str, plan_id: str) -> str:
+    raw = json.dumps([created_at, plan_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, plan_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+    if not (isinstance(created_at, str) and TIMESTAMP_RE.fullmatch(created_at) and isinstance(plan_id, str)):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    return created_at, plan_id
+
+
+def new_plan_id() -> str:
+    return str(uuid.uuid4())
+
+
+def utc_now() -> str:
+    # Fixed-width ISO timestamps sort lexicographically in time order
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def body_hash(body: str) -> str:
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def plan_row(user_id: str, plan: dict, plan_id: Optional[str] = None, now: Optional[str] = None) -> dict:
+    """The practice_plans row for a new plan; the body is stored by its hash
+
+    Raises InvalidPlan for values the database would refuse, so a save is
+    rejected before it is acknowledged rather than when it is written.
+    """
+    validate_plan(plan)
+    now = now or utc_now()
+    return {
+        "id": plan_id or new_plan_id(),
+        "user_id": user_id,
+        "title": plan["title"],
+        "sport": plan["sport"],
+        "duration": plan["duration"],
+        "age_group": plan.get("age_group"),
+        "skill_level": plan.get("skill_level"),
+        "focus_areas": plan.get("focus_areas"),
+        "selected_drills": json.dumps(plan.get("selected_drills") or []),
+        "body_hash": body_hash(plan["generated_plan"]),
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def validate_plan(plan: dict) -> None:
+    duration = plan["duration"]
+    if not isinstance(duration, int) or not MIN_INTEGER <= duration <= MAX_INTEGER:
+        raise InvalidPlan(f"Duration out of range: {duration}")
+    texts = [plan[key] for key in ("title", "sport", "generated_plan")]
+    texts += [plan.get(key) for key in ("age_group", "skill_level", "focus_areas")]
+    texts += list(plan.get("selected_drills") or [])
+    for text in texts:
+        if text is None:
+            continue
+        try:
+            text.encode()
+        except (AttributeError, UnicodeEncodeError):
+            raise InvalidPlan(f"Not storable as text: {text!r:.40}")
+
+
+class BodyCodec:
+    """zlib with a preset dictionary; only the last 32 KiB of it is used"""
+
+    def __init__(self, dictionary: bytes = b""):
+        self.dictionary = dictionary[-32768:]
+        self.dictionary_id = hashlib.sha256(self.dictionary).hexdigest()[:16]
+
+    def compress(self, body: str) -> bytes:
+        compressor = zlib.compressobj(9, zdict=self.dictionary) if self.dictionary else zlib.compressobj(9)
+        return compressor.compress(body.encode()) + compressor.flush()
+
+    @staticmethod
+    def decompress(data: bytes, dictionary: bytes) -> str:
+        decompressor = zlib.decompressobj(zdict=dictionary) if dictionary else zlib.decompressobj()
+        return (decompressor.decompress(data) + decompressor.flush()).decode()
+
+
+class PracticePlanRepository(ABC):
+    """Storage interface used by the practice plan endpoints"""
+
+    @abstractmethod
+    def save(self, user_id: str, plan: dict) -> dict:
+        ...
+
+    @abstractmethod
+    def save_many(self, rows: Sequence[Tuple[dict, str]]) -> None:
+        """Insert (plan_row, body) pairs in one transaction; rows already stored are skipped"""
+
+    @abstractmethod
+    def get(self, user_id: str, plan_id: str, include_body: bool = True) -> Optional[dict]:
+        """The stored row, decoded, with generated_plan when include_body"""
+
+    @abstractmethod
+    def get_body(self, hash: str) -> Optional[str]:
+        """A generated plan body by its content hash"""
+
+    @abstractmethod
+    def list_for_user(self, user_id: str, limit: int = 10, cursor: Optional[str] = None,
+                      sport: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        """A page of plan summaries, newest first, and the cursor for the next page"""
+
+    def close(self) -> None:
+        pass
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections shared across threads
+
+    Connections are opened on first use, and again after close().
+    """
+
+    def __init__(self, path: str, size: int = 4):
+        self.path = path
+        self.size = size
+        self._pool: "Optional[queue.Queue[sqlite3.Connection]]" = None
+        self._lock = threading.Lock()
+
+    def _connections(self) -> "queue.Queue[sqlite3.Connection]":
+        with self._lock:
+            if self._pool is None:
+                self._pool = queue.Queue()
+                for _ in range(self.size):
+                    conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+                    conn.row_factory = sqlite3.Row
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    self._pool.put(conn)
+            return self._pool
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        pool = self._connections()
+        conn = pool.get()
+        try:
+            yield conn
+        finally:
+            pool.put(conn)
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            for _ in range(self.size):
+                pool.get().close()
+
+
+class SqlitePracticePlanRepository(PracticePlanRepository):
+    def __init__(self, path: str, pool_size: int = 4, dictionary: bytes = b""):
+        self.pool = ConnectionPool(path, pool_size)
+        self.codec = BodyCodec(dictionary)
+        # Bodies written with earlier dictionaries stay readable
+        self._dictionaries: Dict[str, bytes] = {self.codec.dictionary_id: self.codec.dictionary}
+        with self.pool.connection() as conn, conn:
+            # Holds the write lock, so only one of several workers migrates
+            conn.execute("BEGIN IMMEDIATE")
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT OR IGNORE INTO compression_dictionaries (id, data) VALUES (?, ?)",
+                (self.codec.dictionary_id, self.codec.dictionary))
+            if "generated_plan" in {row["name"] for row in conn.execute("PRAGMA table_info(practice_plans)")}:
+                self._move_inline_bodies(conn)
+
+    def _move_inline_bodies(self, conn: sqlite3.Connection) -> None:
+        """Move plans saved before plan_bodies existed, with their body in a
+        generated_plan column, to the current schema"""
+        for index in ("practice_plans_user_created", "practice_plans_sport"):
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        conn.execute("ALTER TABLE practice_plans RENAME TO practice_plans_inline")
+        for statement in SCHEMA:
+            conn.execute(statement)
+        moved = 0
+        for old in conn.execute("SELECT * FROM practice_plans_inline").fetchall():
+            row = dict(old)
+            body = row.pop("generated_plan")
+            row["body_hash"] = body_hash(body)
+            self._insert(conn, row, body)
+            moved += 1
+        conn.execute("DROP TABLE practice_plans_inline")
+        print(f"Moved the bodies of {moved} saved practice plans to plan_bodies")
+
+    def save(self, user_id: str, plan: dict) -> dict:
+        row = plan_row(user_id, plan)
+        self.save_many([(row, plan["generated_plan"])])
+        return self._decode(row)
+
+    def save_many(self, rows: Sequence[Tuple[dict, str]]) -> None:
+        with self.pool.connection() as conn, conn:
+            for row, body in rows:
+                self._insert(conn, row, body)
+
+    def _insert(self, conn: sqlite3.Connection, row: dict, body: str) -> None:
+        known = conn.execute(
+            "SELECT 1 FROM plan_bodies WHERE hash = ?", (row["body_hash"],)).fetchone()
+        if known is None:
+            conn.execute(
+                "INSERT OR IGNORE INTO plan_bodies (hash, dictionary_id, size, data) VALUES (?, ?, ?, ?)",
+                (row["body_hash"], self.codec.dictionary_id, len(body), self.codec.compress(body)))
+        # Ids are assigned before the insert, so replaying a row is a no-op
+        placeholders = ", ".join("?" for _ in PLAN_COLUMNS)
+        conn.execute(
+            f"INSERT OR IGNORE INTO practice_plans ({', '.join(PLAN_COLUMNS)}) VALUES ({placeholders})",
+            [row[column] for column in PLAN_COLUMNS])
+
+    def get(self, user_id: str, plan_id: str, include_body: bool = True) -> Optional[dict]:
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(PLAN_COLUMNS)} FROM practice_plans WHERE id = ? AND user_id = ?",
+                (plan_id, user_id)).fetchone()
+            if row is None:
+                return None
+            plan = self._decode(dict(row))
+            if include_body:
+                plan["generated_plan"] = self._load_body(conn, plan["body_hash"])
+        return plan
+
+    def get_body(self, hash: str) -> Optional[str]:
+        with self.pool.connection() as conn:
+            return self._load_body(conn, hash)
+
+    def _load_body(self, conn: sqlite3.Connection, hash: str) -> Optional[str]:
+        row = conn.execute(
+            "SELECT dictionary_id, data FROM plan_bodies WHERE hash = ?", (hash,)).fetchone()
+        if row is None:
+            return None
+        dictionary_id, data = row
+        dictionary = self._dictionaries.get(dictionary_id)
+        if dictionary is None:
+            dictionary = conn.execute(
+                "SELECT data FROM compression_dictionaries WHERE id = ?", (dictionary_id,)).fetchone()[0]
+            self._dictionaries[dictionary_id] = dictionary
+        return BodyCodec.decompress(data, dictionary)
+
+    def storage_stats(self) -> dict:
+        with self.pool.connection() as conn:
+            bodies, raw, stored = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM plan_bodies").fetchone()
+            plans = conn.execute("SELECT COUNT(*) FROM practice_plans").fetchone()[0]
+        return {"plans": plans, "bodies": bodies, "body_bytes": raw, "stored_bytes": stored}
+
+    def list_for_user(self, user_id: str, limit: int = 10, cursor: Optional[str] = None,
+                      sport: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        where = ["user_id = ?"]
+        params: list = [user_id]
+        if cursor:
+            where.append("(created_at, id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        if sport:
+            where.append("sport = ?")
+            params.append(sport)
+        params.append(limit + 1)
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(SUMMARY_COLUMNS)} FROM practice_plans"
+                f" WHERE {' AND '.join(where)}"
+                " ORDER BY created_at DESC, id DESC LIMIT ?", params).fetchall()
+        plans = [self._decode(dict(row)) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = plans[-1]
+            next_cursor = encode_cursor(last["created_at"], last["id"])
+        return plans, next_cursor
+
+    def close(self) -> None:
+        self.pool.close()
+
+    @staticmethod
+    def _decode(row: dict) -> dict:
+        return decode_row(row)
+
+
+def plan_detail(plan: dict) -> dict:
+    """A plan from get() as returned to its owner"""
+    return {field: plan[field] for field in DETAIL_FIELDS if field in plan}
+
+
+def decode_row(row: dict) -> dict:
+    row = dict(row)
+    if "selected_drills" in row:
+        row["selected_drills"] = json.loads(row["selected_drills"] or "[]")
+    return row
+
+
+def create_plan_repository(dictionary: bytes = b"") -> PracticePlanRepository:
+    """Repository configured by PRACTICE_DB_PATH and PRACTICE_DB_POOL_SIZE"""
+    return SqlitePracticePlanRepository(
+        os.getenv("PRACTICE_DB_PATH", "practice_plans.sqlite3"),
+        int(os.getenv("PRACTICE_DB_POOL_SIZE", "4")),
+        dictionary,
+    )
@@ -0,0 +1,22 @@
+"""Run from backend/: python -m pytest tests"""
+import os
+import sys
+import tempfile
+
+# The app is a flat set of modules in backend/, imported by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Files the app opens when main is imported go to a scratch directory, and
+# the per-user rate limits are off so tests can call endpoints freely
+_scratch = tempfile.mkdtemp(prefix="headcoach-tests-")
+for _name, _value in {
+    "PRACTICE_DB_PATH": os.path.join(_scratch, "practice_plans.sqlite3"),
+    "JOB_DB_PATH": os.path.join(_scratch, "jobs.sqlite3"),
+    "LLM_CACHE_PATH": os.path.join(_scratch, "llm_cache.sqlite3"),
+    "PLAN_CACHE_PATH": os.path.join(_scratch, "plan_cache.sqlite3"),
+    "RATE_LIMIT_PATH": os.path.join(_scratch, "rate_limits.sqlite3"),
+    "SAVE_LOG_DIR": os.path.join(_scratch, "save-log"),
+    "PROFILE_DIR": os.path.join(_scratch, "profiles"),
+    "RATE_LIMIT_BACKEND": "off",
+}.items():
+    os.environ.setdefault(_name, _value)
@@ -0,0 +1,35 @@
+import pytest
+
+from adaptation import ADAPTATIONS, NO_ADAPTATION, Adaptation, adaptation_for
+
+DESCRIPTION = "Practice passing in pairs. Focus on the first touch."
+
+
+@pytest.mark.parametrize("age_group, expected", [
+    ("U8", "Fun practice with passing in pairs. Simple focus on the first touch."),
+    ("u10 girls", "Fun practice with passing in pairs. Simple focus on the first touch."),
+    ("U16", "Advanced practice with passing in pairs. Intensive focus on the first touch."),
+    ("u18", "Advanced practice with passing in pairs. Intensive focus on the first touch."),
+    ("U12", DESCRIPTION),
+    ("", DESCRIPTION),
+    (None, DESCRIPTION),
+])
+def test_descriptions_are_worded_for_the_age_group(age_group, expected):
+    assert adaptation_for(age_group).apply(DESCRIPTION) == expected
+
+
+def test_the_younger_band_wins():
+    assert adaptation_for("u10/u16 mixed") is adaptation_for("u8")
+
+
+def test_rewrites_apply_in_one_pass():
+    # A rewrite's output is not rewritten again, and longer phrases win
+    adaptation = Adaptation({"Practice": "Practice drills", "Practice game": "Scrimmage"})
+
+    assert adaptation.apply("Practice, then Practice game") == "Practice drills, then Scrimmage"
+
+
+def test_every_band_has_one_shared_adaptation():
+    assert adaptation_for(None) is NO_ADAPTATION
+    assert len(ADAPTATIONS) == 3
+    assert {adaptation_for(age) for age in ("u8", "u16", "u12")} == set(ADAPTATIONS)
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from auth import (
+    MIN_REFRESH_INTERVAL, AuthError, JwksKeys, SigningKey, StaticKeys, TokenVerifier, _b64encode, issue_token,
+)
+
+SECRET = "test-secret"
+NOW = 1_700_000_000
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def claims(**overrides):
+    return {"sub": "user-1", "email": "coach@example.com", "aud": "authenticated", "exp": NOW + 3600,
+            **overrides}
+
+
+def verifier(keys=None, clock=None, **options) -> TokenVerifier:
+    keys = keys or StaticKeys({None: SigningKey.hmac(SECRET.encode())})
+    return TokenVerifier(keys, clock=clock or Clock(NOW), **options)
+
+
+def verify(token_verifier: TokenVerifier, token: str) -> dict:
+    return asyncio.run(token_verifier.verify(token))
+
+
+def unsigned(header: dict, payload: dict, signature: bytes = b"") -> str:
+    return ".".join(_b64encode(json.dumps(part).encode()) for part in (header, payload)) + "." + _b64encode(signature)
+
+
+def test_valid_token():
+    user = verify(verifier(), issue_token(claims(), SECRET))
+
+    assert user == {"id": "user-1", "email": "coach@example.com", "role": None}
+
+
+@pytest.mark.parametrize("token", [
+    issue_token(claims(), "another-secret"),
+    issue_token(claims(), SECRET)[:-4] + "AAAA",
+    # Payload swapped after signing
+    ".".join([issue_token(claims(), SECRET).split(".")[0], issue_token(claims(sub="admin"), "x").split(".")[1],
+              issue_token(claims(), SECRET).split(".")[2]]),
+])
+def test_bad_signatures_are_rejected(token):
+    with pytest.raises(AuthError, match="signature"):
+        verify(verifier(), token)
+
+
+@pytest.mark.parametrize("token", ["", "abc", "a.b", "a.b.c.d", "!!.??.**"])
+def test_malformed_tokens_are_rejected(token):
+    with pytest.raises(AuthError):
+        verify(verifier(), token)
+
+
+def test_alg_none_is_rejected():
+    with pytest.raises(AuthError, match="signature"):
+        verify(verifier(), unsigned({"alg": "none", "typ": "JWT"}, claims()))
+
+
+def test_expired_tokens_are_rejected_after_the_leeway():
+    clock = Clock(NOW)
+    token_verifier = verifier(clock=clock, leeway=30)
+    token = issue_token(claims(exp=NOW - 10), SECRET)
+
+    assert verify(token_verifier, token)["id"] == "user-1"
+    with pytest.raises(AuthError, match="expired"):
+        verify(verifier(clock=clock, leeway=30), issue_token(claims(exp=NOW - 31), SECRET))
+    with pytest.raises(AuthError, match="expiry"):
+        verify(token_verifier, issue_token(claims(exp=None), SECRET))
+
+
+def test_cached_tokens_still_expire():
+    clock = Clock(NOW)
+    token_verifier = verifier(clock=clock, leeway=0)
+    token = issue_token(claims(exp=NOW + 60), SECRET)
+
+    verify(token_verifier, token)
+    verify(token_verifier, token)
+    assert token_verifier.hits == 1
+    clock.now += 61
+    with pytest.raises(AuthError, match="expired"):
+        verify(token_verifier, token)
+
+
+def test_not_before():
+    with pytest.raises(AuthError, match="not valid yet"):
+        verify(verifier(leeway=0), issue_token(claims(nbf=NOW + 60), SECRET))
+
+
+@pytest.mark.parametrize("audience", ["anon", None, ["anon", "service"]])
+def test_wrong_audience_is_rejected(audience):
+    with pytest.raises(AuthError, match="audience"):
+        verify(verifier(), issue_token(claims(aud=audience), SECRET))
+
+
+def test_audience_lists():
+    assert verify(verifier(), issue_token(claims(aud=["anon", "authenticated"]), SECRET))["id"] == "user-1"
+
+
+def test_issuer():
+    token_verifier = verifier(issuer="https://auth.example")
+
+    with pytest.raises(AuthError, match="issuer"):
+        verify(token_verifier, issue_token(claims(iss="https://evil.example"), SECRET))
+    assert verify(token_verifier, issue_token(claims(iss="https://auth.example"), SECRET))
+
+
+def test_hmac_key_does_not_accept_other_algorithms():
+    # A key for HS256 only, as a JWKS with "alg" declares it
+    keys = StaticKeys({"k": SigningKey.from_jwk({"kty": "oct", "alg": "HS256", "k": _b64encode(SECRET.encode())})})
+    token = issue_token(claims(), SECRET, kid="k")
+    header, payload, signature = token.split(".")
+    forged_header = _b64encode(json.dumps({"alg": "RS256", "kid": "k"}).encode())
+
+    assert verify(verifier(keys), token)
+    with pytest.raises(AuthError, match="signature"):
+        verify(verifier(keys), f"{forged_header}.{payload}.{signature}")
+    with pytest.raises(AuthError, match="signature"):
+        verify(verifier(keys), issue_token(claims(), SECRET, "HS512", kid="k"))
+
+
+def test_rsa_public_key_cannot_be_used_as_an_hmac_secret():
+    pytest.importorskip("cryptography")
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    public_key = rsa.generate_private_key(public_exponent=65537, key_size=2048).public_key()
+    numbers = public_key.public_numbers()
+    jwk = {"kty": "RSA", "kid": "rsa", "n": _b64encode(numbers.n.to_bytes(256, "big")),
+           "e": _b64encode(numbers.e.to_bytes(3, "big"))}
+    keys = StaticKeys({"rsa": SigningKey.from_jwk(jwk)})
+    pem = public_key.public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+
+    # The classic confusion attack: sign with HS256 using the public key as the secret
+    with pytest.raises(AuthError, match="signature"):
+        verify(verifier(keys), issue_token(claims(), pem.decode(), kid="rsa"))
+
+
+def write_jwks(path, keys):
+    with open(path, "w") as f:
+        json.dump({"keys": [{"kty": "oct", "kid": kid, "k": _b64encode(secret.encode())}
+                            for kid, secret in keys.items()]}, f)
+    # Make sure the file looks changed even within one mtime tick
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def jwks_verifier(path, refresh_interval=600.0):
+    clock = Clock(0.0)
+    keys = JwksKeys(str(path), refresh_interval=refresh_interval, clock=clock)
+    return verifier(keys), clock
+
+
+def test_unknown_kid_loads_the_rotated_jwks(tmp_path):
+    path = tmp_path / "jwks.json"
+    write_jwks(path, {"old": "old-secret"})
+    token_verifier, clock = jwks_verifier(path)
+    assert verify(token_verifier, issue_token(claims(), "old-secret", kid="old"))
+
+    write_jwks(path, {"old": "old-secret", "new": "new-secret"})
+    clock.now += MIN_REFRESH_INTERVAL
+    assert verify(token_verifier, issue_token(claims(), "new-secret", kid="new"))
+
+
+def test_unknown_kid_refreshes_at_most_every_min_interval(tmp_path):
+    path = tmp_path / "jwks.json"
+    write_jwks(path, {"old": "old-secret"})
+    token_verifier, clock = jwks_verifier(path)
+    verify(token_verifier, issue_token(claims(), "old-secret", kid="old"))
+
+    write_jwks(path, {"new": "new-secret"})
+    with pytest.raises(AuthError, match="Unknown signing key"):
+        verify(token_verifier, issue_token(claims(), "new-secret", kid="new"))
+
+
+def test_removed_key_invalidates_cached_tokens(tmp_path):
+    path = tmp_path / "jwks.json"
+    write_jwks(path, {"old": "old-secret"})
+    token_verifier, clock = jwks_verifier(path, refresh_interval=60)
+    token = issue_token(claims(), "old-secret", kid="old")
+    verify(token_verifier, token)
+
+    write_jwks(path, {"new": "new-secret"})
+    clock.now += 60
+    with pytest.raises(AuthError, match="Unknown signing key"):
+        verify(token_verifier, token)
+
+
+def test_replaced_key_material_under_the_same_kid_invalidates_cached_tokens(tmp_path):
+    path = tmp_path / "jwks.json"
+    write_jwks(path, {"main": "compromised-secret"})
+    token_verifier, clock = jwks_verifier(path, refresh_interval=60)
+    token = issue_token(claims(), "compromised-secret", kid="main")
+    verify(token_verifier, token)
+
+    write_jwks(path, {"main": "replacement-secret"})
+    clock.now += 60
+    with pytest.raises(AuthError, match="signature"):
+        verify(token_verifier, token)
+    assert verify(token_verifier, issue_token(claims(), "replacement-secret", kid="main"))
+
+
+def test_unchanged_keys_keep_cached_tokens(tmp_path):
+    path = tmp_path / "jwks.json"
+    write_jwks(path, {"main": "secret"})
+    token_verifier, clock = jwks_verifier(path, refresh_interval=60)
+    token = issue_token(claims(), "secret", kid="main")
+    verify(token_verifier, token)
+
+    write_jwks(path, {"main": "secret"})
+    clock.now += 60
+    verify(token_verifier, token)
+    assert token_verifier.hits == 1
@@ -0,0 +1,59 @@
+import json
+import os
+
+from catalog import CatalogStore, CompiledCatalog, Drill, compile_catalog, read_source
+
+DRILLS = [
+    Drill("soccer", "Rondo", "Keep the ball in a circle while working on {focus}", "uefa"),
+    Drill("basketball", "Três pontos — shooting", "Spot-up shooting", "fiba", "https://example.com"),
+]
+
+
+def test_compiled_catalog_round_trip(tmp_path):
+    path = str(tmp_path / "drills.bin")
+    compile_catalog(DRILLS, path)
+
+    assert [drill.fields() for drill in CompiledCatalog(path).drills()] == [drill.fields() for drill in DRILLS]
+
+
+def test_empty_catalog(tmp_path):
+    path = str(tmp_path / "drills.bin")
+    compile_catalog([], path)
+
+    assert CompiledCatalog(path).drills() == ()
+
+
+def write_source(path, drills):
+    with open(path, "w") as f:
+        json.dump([{"sport": d.sport, "title": d.title, "description": d.description, "source": d.source}
+                   for d in drills], f)
+
+
+def test_store_reloads_when_the_source_changes(tmp_path):
+    source, compiled = str(tmp_path / "drills.json"), str(tmp_path / "drills.bin")
+    write_source(source, DRILLS[:1])
+    store = CatalogStore(compiled, source)
+    reloaded = []
+    store.on_reload(reloaded.append)
+    fingerprint = store.fingerprint
+    assert [drill.title for drill in store.catalog.drills] == ["Rondo"]
+    assert not store.refresh()
+
+    write_source(source, DRILLS)
+    os.utime(source, (os.path.getmtime(compiled) + 10,) * 2)
+    assert store.refresh()
+    assert [drill.title for drill in store.catalog.drills] == ["Rondo", "Três pontos — shooting"]
+    assert reloaded == [store.catalog]
+    assert store.fingerprint != fingerprint
+    assert len(read_source(source)) == 2
+
+
+def test_compiled_file_in_another_format_is_rebuilt(tmp_path):
+    source, compiled = str(tmp_path / "drills.json"), str(tmp_path / "drills.bin")
+    write_source(source, DRILLS)
+    with open(compiled, "wb") as f:
+        f.write(b"HCDRILL1" + bytes(8))
+    os.utime(source, (os.path.getmtime(compiled) - 10,) * 2)
+
+    store = CatalogStore(compiled, source)
+    assert [drill.title for drill in store.catalog.drills] == ["Rondo", "Três pontos — shooting"]
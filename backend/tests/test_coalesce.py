@@ -0,0 +1,123 @@
+import asyncio
+import gc
+
+import pytest
+
+from coalesce import SingleFlight
+
+
+class Work:
+    """A computation that runs until released, counting its executions"""
+
+    def __init__(self, result="plan", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_callers_share_one_execution():
+    async def run():
+        flight, work = SingleFlight(), Work()
+        callers = [asyncio.create_task(flight.do("key", work)) for _ in range(5)]
+        other = asyncio.create_task(flight.do("other", Work("other")))
+        await asyncio.sleep(0)
+        assert len(flight) == 2
+        work.release.set()
+        results = await asyncio.gather(*callers)
+        other.cancel()
+        return flight, work, results
+
+    flight, work, results = asyncio.run(run())
+    assert results == ["plan"] * 5
+    assert work.calls == 1
+    assert flight.stats() == {"in_flight": 0, "started": 2, "shared": 4}
+
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_work():
+    async def run():
+        flight, work = SingleFlight(), Work()
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        # The caller that started the work goes away
+        first.cancel()
+        await asyncio.sleep(0)
+        work.release.set()
+        return first, await second, work
+
+    first, result, work = asyncio.run(run())
+    assert first.cancelled()
+    assert result == "plan"
+    assert (work.calls, work.cancelled) == (1, False)
+
+
+def test_work_continues_when_every_caller_is_cancelled():
+    async def run():
+        flight, work = SingleFlight(), Work()
+        caller = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.sleep(0)
+        assert len(flight) == 1
+        # A later caller joins the same execution
+        late = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        work.release.set()
+        return await late, work, flight
+
+    result, work, flight = asyncio.run(run())
+    assert result == "plan"
+    assert work.calls == 1
+    assert flight.stats()["shared"] == 1
+
+
+def test_exceptions_reach_every_waiter_and_are_not_cached():
+    async def run():
+        flight, failing = SingleFlight(), Work(error=RuntimeError("upstream down"))
+        callers = [asyncio.create_task(flight.do("key", failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        failing.release.set()
+        outcomes = await asyncio.gather(*callers, return_exceptions=True)
+
+        retry = Work("recovered")
+        retry.release.set()
+        return outcomes, await flight.do("key", retry), failing
+
+    outcomes, retried, failing = asyncio.run(run())
+    assert [str(outcome) for outcome in outcomes] == ["upstream down"] * 3
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert failing.calls == 1
+    assert retried == "recovered"
+
+
+def test_an_exception_nobody_waits_for_is_not_reported_as_unretrieved():
+    errors = []
+
+    async def run():
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        flight, failing = SingleFlight(), Work(error=RuntimeError("upstream down"))
+        caller = asyncio.create_task(flight.do("key", failing))
+        await asyncio.sleep(0)
+        caller.cancel()
+        failing.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0.01)
+        del caller
+
+    asyncio.run(run())
+    gc.collect()
+    assert errors == []
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import pytest
+
+from jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, JobLimitExceeded, JobQueue, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.sqlite3"))
+
+
+def test_expired_leases_are_queued_again_then_failed(store):
+    job = store.submit("coach", "plan", {}, max_pending=5)
+
+    first = store.claim(max_running=2, lease=-1, max_attempts=2)
+    assert (first["id"], first["attempts"]) == (job["id"], 1)
+    # The lease is already over, as if the worker died
+    second = store.claim(max_running=2, lease=-1, max_attempts=2)
+    assert (second["id"], second["attempts"]) == (job["id"], 2)
+
+    assert store.claim(max_running=2, lease=-1, max_attempts=2) is None
+    row = store.get("coach", job["id"])
+    assert row["status"] == FAILED
+    assert "abandoned after 2 attempts" in row["error"]
+
+
+def test_a_live_lease_is_not_taken(store):
+    store.submit("coach", "plan", {}, max_pending=5)
+
+    assert store.claim(max_running=2, lease=60, max_attempts=3) is not None
+    assert store.claim(max_running=2, lease=60, max_attempts=3) is None
+    assert store.counts()[RUNNING] == 1
+
+
+def test_released_jobs_do_not_count_an_attempt(store):
+    job = store.submit("coach", "plan", {}, max_pending=5)
+    store.claim(max_running=2, lease=60, max_attempts=3)
+
+    store.release(job["id"])
+    row = store.get("coach", job["id"])
+    assert (row["status"], row["attempts"]) == (QUEUED, 0)
+
+
+def test_each_user_runs_at_most_max_running_jobs(store):
+    busy = [store.submit("busy", "plan", {"n": n}, max_pending=5)["id"] for n in range(3)]
+    other = store.submit("other", "plan", {}, max_pending=5)["id"]
+
+    claimed = [store.claim(max_running=2, lease=60, max_attempts=3) for _ in range(4)]
+    assert [row["id"] if row else None for row in claimed] == busy[:2] + [other, None]
+
+    store.finish(busy[0], {"ok": True})
+    assert store.claim(max_running=2, lease=60, max_attempts=3)["id"] == busy[2]
+
+
+def test_each_user_has_at_most_max_pending_jobs(store):
+    for n in range(2):
+        store.submit("coach", "plan", {"n": n}, max_pending=2)
+
+    with pytest.raises(JobLimitExceeded):
+        store.submit("coach", "plan", {}, max_pending=2)
+    store.submit("someone-else", "plan", {}, max_pending=2)
+
+
+def test_long_poll_returns_when_the_job_finishes(store):
+    async def run():
+        release = asyncio.Event()
+
+        async def handler(payload):
+            await release.wait()
+            return {"echo": payload["n"]}
+
+        queue = JobQueue(store, {"plan": handler}, workers=1, poll_interval=60)
+        queue.start()
+        job = await queue.submit("coach", "plan", {"n": 7})
+        assert (await queue.get("coach", job["id"], wait=0.05))["status"] in (QUEUED, RUNNING)
+
+        asyncio.get_running_loop().call_later(0.05, release.set)
+        start = time.monotonic()
+        finished = await queue.get("coach", job["id"], wait=30)
+        elapsed = time.monotonic() - start
+        await queue.stop()
+        return finished, elapsed, queue
+
+    finished, elapsed, queue = asyncio.run(run())
+    assert finished["status"] == SUCCEEDED
+    assert finished["result"] == {"echo": 7}
+    # Woken by the worker, not by the poll interval
+    assert elapsed < 5
+    assert queue.succeeded == 1
+    assert queue._waiters == {}
+
+
+class LateSubmit(JobStore):
+    """Another request submits a job right after the first claim finds nothing"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.queue = None
+        self.loop = None
+        self.submitted = None
+
+    def claim(self, max_running, lease, max_attempts):
+        row = super().claim(max_running, lease, max_attempts)
+        if row is None and self.submitted is None:
+            self.submitted = self.submit("coach", "plan", {}, max_pending=5)
+            self.loop.call_soon_threadsafe(self.queue._wakeup.set)
+        return row
+
+
+def test_a_submit_during_an_empty_claim_wakes_a_worker(tmp_path):
+    store = LateSubmit(str(tmp_path / "jobs.sqlite3"))
+
+    async def run():
+        async def handler(payload):
+            return {}
+
+        queue = JobQueue(store, {"plan": handler}, workers=1, poll_interval=60)
+        store.queue, store.loop = queue, asyncio.get_running_loop()
+        queue.start()
+        while store.submitted is None:
+            await asyncio.sleep(0.01)
+        finished = await queue.get("coach", store.submitted["id"], wait=5)
+        await queue.stop()
+        return finished
+
+    assert asyncio.run(run())["status"] == SUCCEEDED
@@ -0,0 +1,168 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import llm
+from llm import CompletionCache, PlanWriter, build_prompt, count_tokens
+from schedule import schedule_session
+from upstream import OpenAIClient, UpstreamError
+
+DESCRIPTION = ("Players pass in pairs across a grid, calling for the ball, checking away from "
+               "pressure and receiving on the back foot before switching the play to the far side. ") * 6
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    # The budgets below are sized for the four characters per token estimate
+    monkeypatch.setattr(llm, "_encoding", lambda model: None)
+
+
+def practice(**fields):
+    return SimpleNamespace(**{"sport": "soccer", "duration": "60", "focus": "passing", "ageGroup": "U12",
+                              "skillLevel": None, "playerCount": "12", "selectedDrills": [], **fields})
+
+
+def drill(i):
+    return SimpleNamespace(title=f"Drill {i}", source="catalog", description=DESCRIPTION)
+
+
+def prompt_for(max_tokens, drills=8):
+    return build_prompt(practice(), [drill(i) for i in range(drills)], schedule_session(60, "passing", "12"),
+                        max_tokens)
+
+
+def user_text(prompt):
+    return prompt.messages[1]["content"]
+
+
+def test_prompt_keeps_every_drill_when_the_budget_allows():
+    prompt = prompt_for(100000)
+
+    assert (prompt.drills, prompt.trimmed, prompt.dropped) == (8, 0, 0)
+    assert user_text(prompt).count(DESCRIPTION.strip()) == 8
+
+
+@pytest.mark.parametrize("max_tokens", [600, 900, 1500])
+def test_prompt_trims_descriptions_to_the_budget(max_tokens):
+    prompt = prompt_for(max_tokens)
+
+    assert prompt.tokens <= max_tokens
+    assert prompt.trimmed > 0
+    assert "…" in user_text(prompt)
+
+
+def test_prompt_drops_the_lowest_ranked_drills_first():
+    prompt = prompt_for(280)
+
+    assert 0 < prompt.drills < 8
+    assert prompt.dropped == 8 - prompt.drills
+    text = user_text(prompt)
+    assert all(f"Drill {i} " in text for i in range(prompt.drills))
+    assert not any(f"Drill {i} " in text for i in range(prompt.drills, 8))
+
+
+def test_prompt_always_carries_the_request_and_schedule():
+    prompt = prompt_for(10)
+
+    assert prompt.drills == 0 and prompt.dropped == 8
+    assert "Focus: passing" in user_text(prompt)
+    assert "Drills to draw from" not in user_text(prompt)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm.time, "time", clock)
+    return clock
+
+
+def completion(text):
+    return {"text": text, "model": "gpt-test", "usage": {}}
+
+
+def test_cache_entries_expire(tmp_path, clock):
+    cache = CompletionCache(str(tmp_path / "llm.sqlite3"), ttl=60)
+    cache.set("a", "gpt-test", completion("plan"))
+
+    clock.now += 59
+    assert cache.get("a") == completion("plan")
+    clock.now += 2
+    assert cache.get("a") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_evicts_least_recently_used_beyond_max_bytes(tmp_path, clock):
+    size = len(json.dumps(completion("x" * 100)))
+    cache = CompletionCache(str(tmp_path / "llm.sqlite3"), ttl=3600, max_bytes=2 * size)
+    for key in ("a", "b"):
+        clock.now += 1
+        cache.set(key, "gpt-test", completion("x" * 100))
+    clock.now += 1
+    assert cache.get("a") is not None
+
+    clock.now += 1
+    cache.set("c", "gpt-test", completion("x" * 100))
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.evictions == 1
+    assert cache.stats()["bytes"] <= 2 * size
+
+
+def sse(*chunks):
+    lines = [f"data: {json.dumps(chunk)}" for chunk in chunks] + ["data: [DONE]"]
+    return "\n\n".join(lines) + "\n\n"
+
+
+def delta(text):
+    return {"model": "gpt-test", "choices": [{"delta": {"content": text}}]}
+
+
+def writer(handler, cache=None):
+    client = OpenAIClient("key", "http://openai.test", retries=0, transport=httpx.MockTransport(handler))
+    return PlanWriter(client, cache, model="gpt-test")
+
+
+async def collect(plan_writer):
+    return [piece async for piece in plan_writer.stream(practice(), [drill(0)], schedule_session(60))]
+
+
+def test_stream_yields_the_completion_and_caches_it(tmp_path):
+    calls = []
+
+    def handler(request):
+        calls.append(json.loads(request.content))
+        usage = {"choices": [], "usage": {"prompt_tokens": 300, "completion_tokens": 3}}
+        return httpx.Response(200, text=sse(delta("# Plan"), delta("\n\nWarm"), delta(" up"), usage))
+
+    plan_writer = writer(handler, CompletionCache(str(tmp_path / "llm.sqlite3")))
+
+    assert asyncio.run(collect(plan_writer)) == ["# Plan", "\n\nWarm", " up"]
+    assert calls[0]["stream"] is True
+    assert plan_writer.usage["gpt-test"]["prompt_tokens"] == 300
+    # The second time comes from the cache, in one piece
+    assert asyncio.run(collect(plan_writer)) == ["# Plan\n\nWarm up"]
+    assert len(calls) == 1
+
+
+def test_stream_failures_are_upstream_errors():
+    plan_writer = writer(lambda request: httpx.Response(200, text="data: {not json\n\n"))
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(collect(plan_writer))
+    assert plan_writer.usage["gpt-test"]["errors"] == 1
+
+
+def test_count_tokens_estimates_without_tiktoken():
+    assert count_tokens("x" * 9) == 3
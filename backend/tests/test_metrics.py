@@ -0,0 +1,114 @@
+import threading
+
+from metrics import Registry
+
+
+def test_counters_and_gauges():
+    registry = Registry()
+    requests = registry.counter("app_requests_total", "Requests by status", ("method", "status"))
+    in_flight = registry.gauge("app_in_flight", "Requests being handled")
+    requests.inc("GET", "200")
+    requests.inc("GET", "200", amount=2)
+    requests.inc("POST", "500")
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    assert registry.render() == "\n".join([
+        "# HELP app_requests_total Requests by status",
+        "# TYPE app_requests_total counter",
+        'app_requests_total{method="GET",status="200"} 3',
+        'app_requests_total{method="POST",status="500"} 1',
+        "# HELP app_in_flight Requests being handled",
+        "# TYPE app_in_flight gauge",
+        "app_in_flight 1",
+    ]) + "\n"
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    counter = registry.counter("app_errors_total", "Errors", ("message",))
+    counter.inc('bad "quote" \\ and\nnewline')
+
+    assert 'app_errors_total{message="bad \\"quote\\" \\\\ and\\nnewline"} 1' in registry.render().splitlines()
+
+
+def test_histogram_buckets_are_cumulative_with_sum_and_count():
+    registry = Registry()
+    histogram = registry.histogram("app_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, "/plans")
+
+    lines = registry.render().splitlines()
+    assert lines[:2] == ["# HELP app_seconds Latency", "# TYPE app_seconds histogram"]
+    assert lines[2:] == [
+        # le is inclusive: 0.1 falls in the 0.1 bucket
+        'app_seconds_bucket{route="/plans",le="0.1"} 2',
+        'app_seconds_bucket{route="/plans",le="1"} 3',
+        'app_seconds_bucket{route="/plans",le="+Inf"} 4',
+        'app_seconds_sum{route="/plans"} 3.65',
+        'app_seconds_count{route="/plans"} 4',
+    ]
+
+
+def test_collectors_are_read_at_scrape_time():
+    registry = Registry()
+    hits = {"count": 0}
+    registry.collector("app_cache_hits_total", "counter", "Cache hits",
+                       lambda: [("app_cache_hits_total", {"cache": "plans"}, hits["count"])])
+
+    def broken():
+        raise RuntimeError("store closed")
+
+    registry.collector("app_broken", "gauge", "Fails", broken)
+    hits["count"] = 7
+
+    assert registry.render().splitlines() == [
+        "# HELP app_cache_hits_total Cache hits",
+        "# TYPE app_cache_hits_total counter",
+        'app_cache_hits_total{cache="plans"} 7',
+    ]
+
+
+def test_reset_forgets_recorded_values():
+    registry = Registry()
+    registry.counter("app_total", "Total").inc()
+    registry.histogram("app_seconds", "Latency").observe(0.2)
+
+    registry.reset()
+    assert registry.render().splitlines() == [
+        "# HELP app_total Total", "# TYPE app_total counter",
+        "# HELP app_seconds Latency", "# TYPE app_seconds histogram",
+    ]
+
+
+def test_values_recorded_from_threads_are_not_lost():
+    registry = Registry()
+    counter = registry.counter("app_total", "Total", ("worker",))
+    histogram = registry.histogram("app_batch", "Batch sizes", (), buckets=(1, 10))
+    scraped = []
+
+    def record():
+        for _ in range(20000):
+            counter.inc("flush")
+            histogram.observe(5)
+
+    def scrape():
+        for _ in range(50):
+            scraped.append(registry.render())
+
+    threads = [threading.Thread(target=record) for _ in range(4)] + [threading.Thread(target=scrape)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    lines = registry.render().splitlines()
+    assert 'app_total{worker="flush"} 80000' in lines
+    assert "app_batch_count 80000" in lines
+    assert "app_batch_sum 400000" in lines
+    # Every scrape saw a consistent histogram
+    for text in scraped:
+        values = dict(line.rsplit(" ", 1) for line in text.splitlines() if line.startswith("app_batch"))
+        if values:
+            assert values['app_batch_bucket{le="+Inf"}'] == values["app_batch_count"]
@@ -0,0 +1,57 @@
+import asyncio
+import sqlite3
+import threading
+
+from plan_cache import MemoryPlanCache, SqlitePlanCache
+
+
+def test_sqlite_cache_is_shared_between_connections(tmp_path):
+    path = str(tmp_path / "plan_cache.sqlite3")
+    SqlitePlanCache(path).set("key", {"generated_plan": "# Plan"})
+
+    other = SqlitePlanCache(path)
+    assert other.get("key") == {"generated_plan": "# Plan"}
+    assert other.get("missing") is None
+    assert (other.hits, other.misses) == (1, 1)
+
+
+def test_sqlite_cache_evicts_least_recently_used(tmp_path):
+    cache = SqlitePlanCache(str(tmp_path / "plan_cache.sqlite3"), max_entries=2)
+    for key in ("a", "b"):
+        cache.set(key, {"generated_plan": key})
+    cache.get("a")
+    cache.set("c", {"generated_plan": "c"})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_locked_sqlite_cache_does_not_stall_the_event_loop(tmp_path):
+    import main
+
+    path = str(tmp_path / "plan_cache.sqlite3")
+    cache = SqlitePlanCache(path)
+    cache.set("key", {"generated_plan": "# Plan"})
+    # Another worker holding the write lock: a hit's LRU update has to wait
+    other = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    other.execute("BEGIN IMMEDIATE")
+    threading.Timer(0.3, other.execute, ("COMMIT",)).start()
+
+    async def calls():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        result = await main.call_store(cache, "get", "key")
+        ticker.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(calls())
+    assert result == {"generated_plan": "# Plan"}
+    assert ticks >= 10
+    assert SqlitePlanCache.blocking and not MemoryPlanCache.blocking
@@ -0,0 +1,43 @@
+import pytest
+
+from plan_model import parse_plan, render_plan
+from plan_templates import DEFAULT_PLAN, SAMPLE_VALUES, TEMPLATES, slot_values
+
+ALL_TEMPLATES = {"default": DEFAULT_PLAN, **TEMPLATES}
+
+
+@pytest.mark.parametrize("name", sorted(ALL_TEMPLATES))
+@pytest.mark.parametrize("drills", [[], ["Rondo", "Shooting Ladder"]])
+def test_rendered_templates_parse_into_their_sections(name, drills):
+    template = ALL_TEMPLATES[name]
+    # Slot text in a heading must not change the section's name
+    values = slot_values(dict(SAMPLE_VALUES, sport_title="Warm Weather Games"))
+    sections = list(template.render_sections(values, drills))
+
+    plan = parse_plan(template.render(values, drills))
+    assert plan.section_names == [section for section, _ in sections]
+    assert [section.text for section in plan.sections] == [text for _, text in sections]
+    assert plan.title == "HeadCoachAI Practice Plan - Warm Weather Games"
+    assert render_plan(plan, "markdown", ["warmup", "closing"]) == dict(sections)["warmup"] + dict(sections)["closing"]
+
+
+def test_section_minutes_add_up_to_the_schedule():
+    plan = parse_plan(DEFAULT_PLAN.render(slot_values(SAMPLE_VALUES), []))
+    timed = [(section.name, section.start, section.minutes) for section in plan.sections if section.minutes]
+
+    assert timed == [("warmup", 0, 8), ("skills", 8, 26), ("games", 34, 20), ("cooldown", 54, 6)]
+
+
+def test_free_text_sections_are_named_from_their_headings():
+    plan = parse_plan(
+        "# U10 Soccer\n\nShort session.\n\n"
+        "## Warm-up (10 minutes)\n- Jog\n\n"
+        "## Passing Skills (20 minutes)\n- Pairs\n\n"
+        "## Passing Skills (5 minutes)\n- Again\n\n"
+        "## Cool Down (5 minutes)\n- Stretch\n\n"
+        "---\nWell done.\n")
+
+    # A heading with a template section's keywords but not its name keeps its own name
+    assert plan.section_names == ["warmup", "passing_skills", "passing_skills_2", "cooldown", "closing"]
+    assert [section.minutes for section in plan.sections] == [10, 20, 5, 5, None]
+    assert plan.title == "U10 Soccer"
@@ -0,0 +1,33 @@
+import pytest
+
+from plan_templates import DEFAULT_PLAN, SAMPLE_VALUES, Template, sample_output, slot_values
+
+
+def test_slot_values_are_rendered_as_text():
+    values = slot_values(SAMPLE_VALUES)
+
+    assert values["duration"] == "60" and values["sport_title"] == "Soccer"
+    assert "**Duration**: 60 minutes" in DEFAULT_PLAN.render(values, [])
+
+
+@pytest.mark.parametrize("slot, value", [
+    ("duration", "60"),
+    ("warmup_time", 8.5),
+    ("game_time", True),
+    ("focus", None),
+    ("sport_title", 3),
+])
+def test_slot_values_of_the_wrong_type_are_rejected(slot, value):
+    with pytest.raises(TypeError, match=slot):
+        slot_values(dict(SAMPLE_VALUES, **{slot: value}))
+
+
+def test_unknown_slots_are_rejected():
+    with pytest.raises(ValueError, match="coach"):
+        slot_values({"coach": "Sam"})
+    with pytest.raises(ValueError, match="coach"):
+        Template("test", "Hello {coach}")
+
+
+def test_sample_output_renders_every_plan():
+    assert sample_output().count("**1. Selected Drill**") == 2
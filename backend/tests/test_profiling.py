@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+from profiling import SETTINGS_FILE, Profiler
+
+
+def sync_now(profiler: Profiler) -> None:
+    profiler._next_sync = 0.0
+    profiler.sync()
+
+
+def test_published_settings_reach_other_workers(tmp_path):
+    first, second = Profiler(str(tmp_path)), Profiler(str(tmp_path))
+
+    first.publish(0.5, 0.01)
+    sync_now(second)
+    assert (second.enabled, second.sample_rate, second.interval) == (True, 0.5, 0.01)
+
+    second.publish(0)
+    sync_now(first)
+    assert not first.enabled
+
+
+def test_settings_are_checked_at_most_every_sync_interval(tmp_path):
+    first, second = Profiler(str(tmp_path)), Profiler(str(tmp_path))
+    second.sync()
+
+    first.publish(1)
+    second.sync()
+    assert not second.enabled
+
+
+def test_settings_from_before_startup_are_ignored(tmp_path):
+    (tmp_path / SETTINGS_FILE).write_text(json.dumps({"sample_rate": 1, "interval": 0.001}))
+    profiler = Profiler(str(tmp_path))
+
+    sync_now(profiler)
+    assert not profiler.enabled
+
+
+@pytest.mark.parametrize("content", ["{not json", '{"sample_rate": 5}', "[]"])
+def test_unusable_settings_keep_the_current_ones(tmp_path, content):
+    profiler = Profiler(str(tmp_path), sample_rate=0.25)
+    (tmp_path / SETTINGS_FILE).write_text(content)
+
+    sync_now(profiler)
+    assert profiler.sample_rate == 0.25
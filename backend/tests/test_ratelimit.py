@@ -0,0 +1,147 @@
+import asyncio
+import threading
+
+import pytest
+
+import ratelimit
+from ratelimit import Limit, MemoryRateLimiter, SqliteRateLimiter, parse_limit
+
+# 3 units, refilled at one unit per second
+LIMIT = Limit("generate", 3, 3)
+
+
+class Clock:
+    """Stands in for the time module: monotonic() and time() read the same clock"""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(ratelimit, "time", clock)
+    return clock
+
+
+def limiters(tmp_path):
+    return [MemoryRateLimiter(), SqliteRateLimiter(str(tmp_path / "rate_limits.sqlite3"))]
+
+
+def test_parse_limit():
+    assert parse_limit("batch", "500/3600") == Limit("batch", 500, 3600)
+    assert parse_limit("batch", "off") is None
+    assert parse_limit("batch", "") is None
+
+
+@pytest.mark.parametrize("backend", [0, 1], ids=["memory", "sqlite"])
+def test_buckets_refill_at_the_limit_rate(backend, tmp_path, clock):
+    limiter = limiters(tmp_path)[backend]
+
+    assert [limiter.acquire(LIMIT, "coach") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire(LIMIT, "coach") == pytest.approx(1.0)
+    clock.now += 0.5
+    assert limiter.acquire(LIMIT, "coach") == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.acquire(LIMIT, "coach") == 0
+    # Another user has a bucket of their own
+    assert limiter.acquire(LIMIT, "other") == 0
+
+    # Refills stop at capacity
+    clock.now += 3600
+    assert [limiter.acquire(LIMIT, "coach") for _ in range(4)][-1] == pytest.approx(1.0)
+    # A cost over capacity can never be paid; waiting a full period is the best answer
+    assert limiter.acquire(LIMIT, "other", cost=5) == LIMIT.period
+    assert limiter.stats()["allowed"] == {"generate": 8}
+    assert limiter.stats()["limited"] == {"generate": 4}
+
+
+def test_memory_buckets_evict_the_least_recently_used(clock):
+    limiter = MemoryRateLimiter(max_buckets=2)
+    for user in ("a", "b"):
+        for _ in range(3):
+            limiter.acquire(LIMIT, user)
+    # A refused request still counts as use
+    assert limiter.acquire(LIMIT, "a") > 0
+
+    limiter.acquire(LIMIT, "c")
+    assert limiter.stats()["buckets"] == 2
+    # a was kept; b was forgotten, so it starts over with a full bucket
+    assert limiter.acquire(LIMIT, "a") > 0
+    assert limiter.acquire(LIMIT, "b") == 0
+
+
+def test_sqlite_buckets_are_shared_between_connections(tmp_path, clock):
+    path = str(tmp_path / "rate_limits.sqlite3")
+    first, second = SqliteRateLimiter(path), SqliteRateLimiter(path)
+
+    assert first.acquire(LIMIT, "coach", cost=2) == 0
+    assert second.acquire(LIMIT, "coach") == 0
+    assert first.acquire(LIMIT, "coach") == pytest.approx(1.0)
+    assert second.acquire(LIMIT, "coach") == pytest.approx(1.0)
+    assert second.stats()["buckets"] == 1
+
+
+def test_sqlite_buckets_allow_exactly_capacity_under_concurrency(tmp_path):
+    path = str(tmp_path / "rate_limits.sqlite3")
+    limit = Limit("batch", 50, 3600)
+    workers = [SqliteRateLimiter(path) for _ in range(4)]
+    start = threading.Barrier(len(workers) * 2)
+
+    def spend(limiter):
+        start.wait()
+        for _ in range(20):
+            limiter.acquire(limit, "coach")
+
+    # Two threads per limiter, each with its own connection
+    threads = [threading.Thread(target=spend, args=(limiter,)) for limiter in workers for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(limiter.allowed.get("batch", 0) for limiter in workers) == 50
+    assert sum(limiter.limited.get("batch", 0) for limiter in workers) == 8 * 20 - 50
+
+
+def test_sqlite_prunes_full_buckets(tmp_path, clock):
+    limiter = SqliteRateLimiter(str(tmp_path / "rate_limits.sqlite3"), prune_every=3)
+    limiter.acquire(LIMIT, "a")
+    limiter.acquire(LIMIT, "b")
+    clock.now += 10
+
+    # The third acquire prunes both refilled buckets before adding its own
+    limiter.acquire(LIMIT, "c")
+    assert limiter.stats()["buckets"] == 1
+
+
+class LoopRecording(SqliteRateLimiter):
+    def stats(self) -> dict:
+        try:
+            asyncio.get_running_loop()
+            self.on_event_loop = True
+        except RuntimeError:
+            self.on_event_loop = False
+        return super().stats()
+
+
+def test_health_reads_a_shared_limiter_off_the_event_loop(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    limiter = LoopRecording(str(tmp_path / "rate_limits.sqlite3"))
+    limiter.acquire(LIMIT, "coach")
+    monkeypatch.setattr(main, "rate_limiter", limiter)
+    client = TestClient(main.app)
+
+    response = client.get("/health")
+    assert response.json()["rate_limit"]["allowed"] == {"generate": 1}
+    assert limiter.on_event_loop is False
+    assert 'headcoach_rate_limit_decisions_total{limit="generate",result="allowed"} 1' in client.get("/metrics").text
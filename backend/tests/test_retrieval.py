@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+
+import retrieval
+from catalog import Drill
+from retrieval import DrillEmbeddings
+
+DRILLS = [
+    Drill("soccer", "Rondo", "Keep possession with quick passing in a circle", "uefa"),
+    Drill("soccer", "Finishing", "Shooting on goal from the edge of the box", "uefa"),
+    Drill("basketball", "Layups", "Layup lines off the dribble", "fiba"),
+]
+
+
+def test_saved_embeddings_are_reused(tmp_path):
+    path = str(tmp_path / "drills.bin.emb-aaaa-d512.npy")
+    computed = DrillEmbeddings(DRILLS, path=path)
+
+    loaded = DrillEmbeddings(DRILLS, path=path)
+    assert isinstance(loaded.matrix, np.memmap)
+    assert np.array_equal(loaded.matrix, computed.matrix)
+    assert [drill.title for drill, _ in loaded.top("passing", "soccer", 1)] == ["Rondo"]
+
+
+def test_saving_removes_embeddings_of_older_catalogs(tmp_path):
+    stale = tmp_path / "drills.bin.emb-old-d512.npy"
+    stale.write_bytes(b"stale")
+    unrelated = tmp_path / "drills.bin"
+    unrelated.write_bytes(b"catalog")
+
+    DrillEmbeddings(DRILLS, path=str(tmp_path / "drills.bin.emb-new-d512.npy"))
+    assert sorted(os.listdir(tmp_path)) == ["drills.bin", "drills.bin.emb-new-d512.npy"]
+
+
+def test_a_concurrent_save_does_not_remove_another_workers_temp_file(tmp_path, monkeypatch):
+    first, second = str(tmp_path / "drills.bin.emb-aaaa-d512.npy"), str(tmp_path / "drills.bin.emb-bbbb-d512.npy")
+    save = np.save
+    interleaved = []
+
+    def save_then_let_another_worker_save(file, array):
+        save(file, array)
+        if not interleaved:
+            # Another worker, on a newer catalog, saves and sweeps in between
+            interleaved.append(file)
+            DrillEmbeddings(DRILLS[:2], path=second)
+
+    monkeypatch.setattr(retrieval.np, "save", save_then_let_another_worker_save)
+    DrillEmbeddings(DRILLS, path=first)
+
+    assert os.path.exists(first)
+    assert not [name for name in os.listdir(tmp_path) if ".tmp" in name]
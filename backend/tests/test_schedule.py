@@ -0,0 +1,84 @@
+import pytest
+
+from schedule import (
+    BLOCKS, MIN_DURATION, MIN_STATION_MINUTES, SKILLS, STATIONS, allocate, focus_weights, rotations,
+    schedule_session, session_blocks,
+)
+
+FOCUSES = ["", "passing", "conditioning and fitness", "scrimmage", "technique fundamentals", "tactics"]
+DURATIONS = range(MIN_DURATION, 481)
+
+
+@pytest.mark.parametrize("focus", FOCUSES)
+def test_allocate_fills_the_session_and_respects_minimums(focus):
+    blocks = session_blocks()
+    for duration in DURATIONS:
+        minutes = allocate(duration, blocks, focus_weights(focus))
+        assert sum(minutes) == duration
+        for block, length in zip(blocks, minutes):
+            assert length % block.step == 0
+            assert length >= block.minimum - block.minimum % block.step
+
+
+def test_allocate_scales_minimums_down_for_short_sessions():
+    minutes = allocate(20, BLOCKS, (1.0,) * len(BLOCKS))
+
+    assert sum(minutes) == 20 and all(length > 0 for length in minutes)
+
+
+def test_focus_shifts_time_to_its_blocks():
+    plain = schedule_session(90)
+    games = schedule_session(90, "scrimmage")
+
+    assert games.segment("games").minutes > plain.segment("games").minutes
+
+
+@pytest.mark.parametrize("focus", FOCUSES)
+@pytest.mark.parametrize("players", [None, "4", "12", "10-14 players"])
+def test_schedules_have_no_empty_blocks(focus, players):
+    for duration in DURATIONS:
+        schedule = schedule_session(duration, focus, players)
+        clock = 0
+        for segment in schedule.segments:
+            assert segment.start == clock and segment.minutes > 0
+            if segment.parts:
+                assert sum(part.minutes for part in segment.parts) == segment.minutes
+                assert all(part.minutes > 0 for part in segment.parts)
+            clock += segment.minutes
+        assert clock == duration
+
+        skills = schedule.segment(SKILLS)
+        assert len(schedule.rotations) == STATIONS
+        assert sum(rotation.minutes for rotation in schedule.rotations) == skills.minutes
+        assert schedule.rotations[0].start == skills.start
+        assert all(rotation.minutes >= MIN_STATION_MINUTES for rotation in schedule.rotations)
+
+
+def test_every_group_visits_every_station():
+    schedule = schedule_session(60, player_count="13")
+
+    assert schedule.group_sizes == (7, 6)
+    for station in range(STATIONS):
+        assert sorted(rotation.groups[station] for rotation in schedule.rotations) == list(range(STATIONS))
+
+
+def test_small_squads_work_through_the_stations_as_one_group():
+    schedule = schedule_session(60, player_count="4")
+
+    assert schedule.group_sizes == (4,)
+    assert [rotation.groups for rotation in schedule.rotations] == [(0, None), (None, 0)]
+
+
+def test_rotations_split_the_skills_block_evenly():
+    assert [(r.start, r.minutes) for r in rotations(10, 30, 3, 3)] == [(10, 10), (20, 10), (30, 10)]
+
+
+def test_requests_shorter_than_the_minimum_are_rejected():
+    from pydantic import ValidationError
+
+    from main import PracticeRequest
+
+    assert PracticeRequest(sport="soccer", duration=str(MIN_DURATION), focus="passing")
+    for duration in ("1", "5", str(MIN_DURATION - 1), "0", "-30", "481", "sixty"):
+        with pytest.raises(ValidationError):
+            PracticeRequest(sport="soccer", duration=duration, focus="passing")
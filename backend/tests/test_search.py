@@ -0,0 +1,85 @@
+import json
+import os
+
+from catalog import CatalogStore, Drill
+from search import DrillIndex
+
+DRILLS = [
+    Drill("soccer", "Passing Triangles", "Pass and move in triangles", "uefa"),
+    Drill("soccer", "Shooting Ladder", "Shooting from the edge of the box, then passing back", "uefa"),
+    Drill("soccer", "Dribbling Gates", "Dribble through cone gates with close control", "fa"),
+    Drill("basketball", "Dribbling Gauntlet", "Crossovers through a cone course", "fiba"),
+    Drill("basketball", "Passing Lanes", "Chest and bounce passes on the move", "fiba"),
+]
+
+
+def titles(results):
+    return [drill.title for drill, _ in results]
+
+
+def test_bm25_ranks_title_matches_and_rare_terms_first():
+    index = DrillIndex(DRILLS)
+
+    # "passing" is in two titles and one description; title words count double
+    assert titles(index.search("passing")) == ["Passing Triangles", "Passing Lanes", "Shooting Ladder"]
+    # "close" is rarer than "dribbling", so the drill with both ranks first
+    assert titles(index.search("dribbling close control"))[0] == "Dribbling Gates"
+    scores = dict((drill.title, score) for drill, score in index.search("dribbling"))
+    assert scores["Dribbling Gates"] < scores["Dribbling Gauntlet"]
+    assert index.search("volleyball") == []
+    assert index.search("") == []
+    assert titles(index.search("passing", limit=1)) == ["Passing Triangles"]
+
+
+def test_sport_and_source_filters():
+    index = DrillIndex(DRILLS)
+
+    assert titles(index.search("passing", sport="basketball")) == ["Passing Lanes"]
+    assert titles(index.search("dribbling", source="fa")) == ["Dribbling Gates"]
+    assert index.search("dribbling", sport="soccer", source="fiba") == []
+    assert index.search("passing", sport="cricket") == []
+    # Every drill of the sport, matches first, the rest in catalog order
+    assert [drill.title for drill in index.rank("shooting", sport="soccer")] == [
+        "Shooting Ladder", "Passing Triangles", "Dribbling Gates"]
+
+
+def test_prefix_typeahead_expands_only_the_last_word():
+    index = DrillIndex(DRILLS)
+
+    assert index.suggest("dri") == ["Dribbling Gates", "Dribbling Gauntlet"]
+    assert index.suggest("dri", sport="basketball") == ["Dribbling Gauntlet"]
+    assert index.suggest("cone ga") == ["Dribbling Gates", "Dribbling Gauntlet"]
+    assert index.suggest("pas", limit=1) == ["Passing Triangles"]
+    # Without prefix expansion a partial word matches nothing
+    assert index.search("dri") == []
+
+
+def write_source(path, drills):
+    with open(path, "w") as f:
+        json.dump([{"sport": d.sport, "title": d.title, "description": d.description, "source": d.source}
+                   for d in drills], f)
+    # Newer than the compiled file, even within one mtime tick
+    stamp = os.path.getmtime(path) + 10
+    os.utime(path, (stamp, stamp))
+
+
+def test_index_follows_catalog_reloads(tmp_path):
+    source, compiled = str(tmp_path / "drills.json"), str(tmp_path / "drills.bin")
+    write_source(source, DRILLS[:3])
+    store = CatalogStore(compiled, source)
+    index = DrillIndex(store.catalog.drills)
+    store.on_reload(lambda catalog: index.sync(catalog.drills))
+    postings = index._postings
+
+    # Appended drills are indexed in place
+    write_source(source, DRILLS)
+    assert store.refresh()
+    assert index._postings is postings
+    assert sorted(titles(index.search("dribbling"))) == ["Dribbling Gates", "Dribbling Gauntlet"]
+
+    # Any other change rebuilds the index
+    write_source(source, DRILLS[3:])
+    assert store.refresh()
+    assert len(index) == 2
+    assert titles(index.search("dribbling")) == ["Dribbling Gauntlet"]
+    assert index.search("shooting") == []
@@ -0,0 +1,212 @@
+import base64
+import json
+import sqlite3
+import zlib
+
+import pytest
+
+from plan_templates import DEFAULT_PLAN, SAMPLE_VALUES, sample_output, slot_values
+from storage import (
+    BodyCodec, InvalidCursor, InvalidPlan, SqlitePracticePlanRepository, decode_cursor, encode_cursor, plan_row,
+    utc_now,
+)
+
+# The dictionary plan bodies are compressed with (see test_dictionary_is_pinned)
+DICTIONARY_ID = "6c621fd9afb975c9"
+
+
+def plan(i=0, **fields):
+    return {"title": f"Plan {i}", "sport": "soccer", "duration": 60, "focus_areas": "passing",
+            "selected_drills": ["Rondo"], "generated_plan": f"# Plan {i}\n", **fields}
+
+
+@pytest.fixture
+def repository(tmp_path):
+    repository = SqlitePracticePlanRepository(str(tmp_path / "plans.sqlite3"))
+    yield repository
+    repository.close()
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip():
+    now = utc_now()
+
+    assert decode_cursor(encode_cursor(now, "plan-id")) == (now, "plan-id")
+    # URL-safe and unpadded, so it can go in a query string as is
+    assert "=" not in encode_cursor(now, "plan-id") and "/" not in encode_cursor(now, "???")
+
+
+@pytest.mark.parametrize("cursor", [
+    "",
+    "not a cursor",
+    "%%%%",
+    raw_cursor("2024-01-01T00:00:00.000000Z"),
+    raw_cursor(["2024-01-01T00:00:00.000000Z"]),
+    raw_cursor(["2024-01-01T00:00:00.000000Z", "a", "b"]),
+    raw_cursor({"created_at": "2024-01-01T00:00:00.000000Z", "id": "a"}),
+    raw_cursor([None, None]),
+    raw_cursor(["2024-01-01T00:00:00.000000Z", 5]),
+    raw_cursor(["2024-01-01", "a"]),
+    raw_cursor(["' OR 1=1 --", "a"]),
+])
+def test_malformed_and_tampered_cursors_are_rejected(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_pages_are_stable_when_plans_share_a_timestamp(repository):
+    now = utc_now()
+    rows = [plan_row("coach", plan(i), plan_id=f"id-{i:02d}", now=now) for i in range(7)]
+    rows.append(plan_row("coach", plan(7), plan_id="id-later", now="9999-01-01T00:00:00.000000Z"))
+    rows.append(plan_row("someone-else", plan(8), now=now))
+    repository.save_many([(row, f"# Plan {i}\n") for i, row in enumerate(rows)])
+
+    pages, cursor = [], None
+    while True:
+        page, cursor = repository.list_for_user("coach", limit=3, cursor=cursor)
+        pages.append([summary["id"] for summary in page])
+        if cursor is None:
+            break
+
+    assert pages == [["id-later", "id-06", "id-05"], ["id-04", "id-03", "id-02"], ["id-01", "id-00"]]
+
+
+def test_listings_filter_by_sport(repository):
+    repository.save("coach", plan(0))
+    repository.save("coach", plan(1, sport="basketball"))
+
+    page, cursor = repository.list_for_user("coach", sport="basketball")
+    assert [summary["title"] for summary in page] == ["Plan 1"] and cursor is None
+    assert "generated_plan" not in page[0] and page[0]["selected_drills"] == ["Rondo"]
+
+
+def test_plans_are_private_to_their_owner(repository):
+    saved = repository.save("coach", plan())
+
+    assert repository.get("coach", saved["id"])["generated_plan"] == "# Plan 0\n"
+    assert repository.get("someone-else", saved["id"]) is None
+
+
+def test_saving_a_row_twice_stores_it_once(repository):
+    row = plan_row("coach", plan())
+    repository.save_many([(row, "# Plan 0\n")])
+    repository.save_many([(row, "# Plan 0\n")])
+
+    assert repository.storage_stats()["plans"] == 1
+
+
+@pytest.mark.parametrize("fields", [
+    {"duration": 2 ** 63},
+    {"duration": -2 ** 63 - 1},
+    {"duration": "60"},
+    {"duration": 60.5},
+    {"title": "broken \ud800 surrogate"},
+    {"generated_plan": "\udfff"},
+    {"focus_areas": 7},
+    {"selected_drills": ["ok", "\ud83d"]},
+])
+def test_plans_the_database_would_refuse_are_invalid(fields):
+    with pytest.raises(InvalidPlan):
+        plan_row("coach", plan(**fields))
+
+
+def test_valid_edge_values_are_accepted(repository):
+    saved = repository.save("coach", plan(duration=2 ** 63 - 1, title="Ünïcödé 🏆", age_group=None))
+
+    assert repository.get("coach", saved["id"])["title"] == "Ünïcödé 🏆"
+
+
+def test_listing_endpoint_answers_bad_cursors_with_a_400():
+    from fastapi.testclient import TestClient
+
+    import main
+
+    response = TestClient(main.app).get("/api/practice-plans", params={"cursor": raw_cursor([None, None])},
+                                        headers={"Authorization": "Bearer test"})
+    assert response.status_code == 400
+
+
+def rendered_plan(**values) -> str:
+    return DEFAULT_PLAN.render(slot_values(dict(SAMPLE_VALUES, **values)), ["Rondo", "Pressing triangles"])
+
+
+def test_bodies_round_trip_through_the_template_dictionary():
+    codec = BodyCodec(sample_output().encode())
+    body = rendered_plan(sport_title="Basketball", focus="Rebounding 🏀", duration=75)
+    compressed = codec.compress(body)
+
+    assert BodyCodec.decompress(compressed, codec.dictionary) == body
+    assert len(compressed) < len(zlib.compress(body.encode(), 9)) / 2
+
+
+def test_dictionary_is_pinned():
+    # Changing the templates changes the dictionary new bodies are written
+    # with. Stored bodies stay readable (each names its dictionary, which is
+    # kept in compression_dictionaries), so update DICTIONARY_ID knowingly.
+    assert BodyCodec(sample_output().encode()).dictionary_id == DICTIONARY_ID
+
+
+def test_bodies_written_with_an_earlier_dictionary_stay_readable(tmp_path):
+    path = str(tmp_path / "plans.sqlite3")
+    old = SqlitePracticePlanRepository(path, dictionary=b"## An older template " * 50)
+    saved = old.save("coach", plan(generated_plan=rendered_plan()))
+    old.close()
+
+    current = SqlitePracticePlanRepository(path, dictionary=sample_output().encode())
+    assert current.get("coach", saved["id"])["generated_plan"] == rendered_plan()
+    # And by a process that has never seen the old dictionary
+    current.close()
+    assert SqlitePracticePlanRepository(path).get_body(saved["body_hash"]) == rendered_plan()
+
+
+def test_identical_bodies_are_stored_once(repository):
+    body = rendered_plan()
+    first = repository.save("coach", plan(generated_plan=body))
+    second = repository.save("someone-else", plan(generated_plan=body))
+    repository.save("coach", plan(generated_plan=rendered_plan(focus="Shooting")))
+
+    assert first["body_hash"] == second["body_hash"]
+    stats = repository.storage_stats()
+    assert (stats["plans"], stats["bodies"]) == (3, 2)
+    assert repository.get("someone-else", second["id"])["generated_plan"] == body
+
+
+# practice_plans as it was before bodies moved to plan_bodies
+INLINE_BODY_SCHEMA = """CREATE TABLE practice_plans (
+    id TEXT PRIMARY KEY, user_id TEXT NOT NULL, title TEXT NOT NULL, sport TEXT NOT NULL,
+    duration INTEGER NOT NULL, age_group TEXT, skill_level TEXT, focus_areas TEXT,
+    selected_drills TEXT NOT NULL DEFAULT '[]', generated_plan TEXT NOT NULL,
+    created_at TEXT NOT NULL, updated_at TEXT NOT NULL
+)"""
+
+
+def test_plans_saved_with_inline_bodies_are_migrated(tmp_path):
+    path = str(tmp_path / "plans.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute(INLINE_BODY_SCHEMA)
+        conn.execute("CREATE INDEX practice_plans_user_created ON practice_plans (user_id, created_at, id)")
+        for i, plan_id in enumerate(["a", "b", "c"]):
+            conn.execute(
+                "INSERT INTO practice_plans VALUES (?, 'coach', ?, 'soccer', 60, NULL, NULL, 'passing', '[]', ?, ?, ?)",
+                (plan_id, f"Plan {i}", rendered_plan() if i < 2 else "# Short", f"2024-01-0{i + 1}T00:00:00.000000Z",
+                 f"2024-01-0{i + 1}T00:00:00.000000Z"))
+    conn.close()
+
+    repository = SqlitePracticePlanRepository(path, dictionary=sample_output().encode())
+    assert repository.get("coach", "a")["generated_plan"] == rendered_plan()
+    assert repository.get("coach", "c")["generated_plan"] == "# Short"
+    assert [summary["id"] for summary in repository.list_for_user("coach")[0]] == ["c", "b", "a"]
+    assert (repository.storage_stats()["plans"], repository.storage_stats()["bodies"]) == (3, 2)
+    saved = repository.save("coach", plan())
+    repository.close()
+
+    # Opening it again finds nothing left to migrate
+    repository = SqlitePracticePlanRepository(path, dictionary=sample_output().encode())
+    assert repository.get("coach", saved["id"])["generated_plan"] == "# Plan 0\n"
+    with repository.pool.connection() as conn:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    assert "practice_plans_inline" not in tables and "practice_plans_user_created" in tables
+    repository.close()
@@ -0,0 +1,142 @@
+import asyncio
+import zlib
+
+import pytest
+
+import transport
+from transport import CODING_PREFERENCE, TransportMiddleware, body_etag, etag_matches, negotiate_encoding
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip; q=0.5, identity;q=0", "gzip"),
+    ("identity;q=0", None),
+    ("gzip;level=1;q=0", None),
+    ("gzip;q=oops", None),
+    ("compress, deflate, x-unknown", None),
+    ("*;q=0", None),
+])
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding) == expected
+
+
+def test_negotiate_encoding_prefers_the_best_quality_then_the_server_order(monkeypatch):
+    monkeypatch.setattr(transport, "CODING_PREFERENCE", ("zstd", "br", "gzip"))
+
+    assert negotiate_encoding("gzip, br, zstd") == "zstd"
+    assert negotiate_encoding("gzip;q=1, br;q=0.9, zstd;q=0.1") == "gzip"
+    assert negotiate_encoding("*") == "zstd"
+    assert negotiate_encoding("*, zstd;q=0") == "br"
+    assert negotiate_encoding("br;q=0.5, *;q=0.8") == "zstd"
+
+
+def test_etag_matches():
+    etag = body_etag(b"plan")
+    opaque = etag[2:]
+
+    assert etag_matches(etag, etag)
+    # Weak comparison: either side may be marked weak
+    assert etag_matches(opaque, etag)
+    assert etag_matches(f'"other", {etag}', etag)
+    assert etag_matches(f' "other" ,W/{opaque} ', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(body_etag(b"plan v2"), etag)
+    assert not etag_matches("", etag)
+
+
+def app_sending(*chunks, content_type="application/json", status=200):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", content_type.encode())]})
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+
+def request(app, method="GET", minimum_size=0, **headers):
+    """(status, headers, body chunks) of one request through the middleware"""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "path": "/",
+             "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]}
+    asyncio.run(TransportMiddleware(app, minimum_size)(scope, receive, send))
+    start = messages[0]
+    return (start["status"], {name.decode(): value.decode() for name, value in start["headers"]},
+            [message["body"] for message in messages[1:]])
+
+
+def test_unchanged_responses_are_revalidated_with_304():
+    body = b'{"plans":[]}'
+    status, headers, _ = request(app_sending(body))
+    assert status == 200
+
+    status, headers, chunks = request(app_sending(body), if_none_match=headers["etag"], accept_encoding="gzip")
+    assert status == 304
+    assert chunks == [b""]
+    assert "content-type" not in headers and "content-length" not in headers
+    assert headers["etag"] == body_etag(body)
+
+    status, _, chunks = request(app_sending(b'{"plans":[1]}'), if_none_match=headers["etag"])
+    assert (status, chunks) == (200, [b'{"plans":[1]}'])
+    # Only GET responses are revalidated
+    assert request(app_sending(body), "POST", if_none_match=headers["etag"])[0] == 200
+
+
+def test_small_and_binary_bodies_are_not_compressed():
+    _, headers, chunks = request(app_sending(b"{}"), minimum_size=512, accept_encoding="gzip")
+    assert "content-encoding" not in headers and chunks == [b"{}"]
+
+    _, headers, _ = request(app_sending(b"x" * 1000, content_type="image/png"), accept_encoding="gzip")
+    assert "content-encoding" not in headers
+
+
+def decompressor(coding):
+    if coding == "gzip":
+        return zlib.decompressobj(31).decompress
+    if coding == "br":
+        return transport.brotli.Decompressor().process
+    return transport.zstandard.ZstdDecompressor().decompressobj().decompress
+
+
+@pytest.mark.parametrize("coding", ["gzip", "br", "zstd"])
+def test_streamed_bodies_decompress_chunk_by_chunk(coding):
+    if coding not in CODING_PREFERENCE:
+        pytest.skip(f"{coding} package not installed")
+    events = [f'data: {{"section": {i}, "text": "{"warm up " * i}"}}\n\n'.encode() for i in range(20)]
+
+    status, headers, chunks = request(app_sending(*events, content_type="text/event-stream"),
+                                      accept_encoding=coding)
+    assert status == 200
+    assert headers["content-encoding"] == coding
+    assert "etag" not in headers and "content-length" not in headers
+    decompress = decompressor(coding)
+    received = b""
+    for i, chunk in enumerate(chunks):
+        received += decompress(chunk)
+        # Every event can be read as soon as it is sent
+        assert received == b"".join(events[:i + 1])
+    assert received == b"".join(events)
+
+
+@pytest.mark.parametrize("coding", ["gzip", "br", "zstd"])
+def test_complete_bodies_decompress_to_the_original(coding):
+    if coding not in CODING_PREFERENCE:
+        pytest.skip(f"{coding} package not installed")
+    body = b'{"generated_plan":"' + b"## Warm-Up\\n- Jog\\n" * 200 + b'"}'
+
+    _, headers, chunks = request(app_sending(body), accept_encoding=coding)
+    assert headers["content-encoding"] == coding
+    assert headers["vary"] == "Accept-Encoding"
+    assert int(headers["content-length"]) == len(chunks[0]) < len(body)
+    assert headers["etag"] == body_etag(body)
+    assert decompressor(coding)(chunks[0]) == body
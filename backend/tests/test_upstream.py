@@ -0,0 +1,169 @@
+import asyncio
+
+import httpx
+import pytest
+
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamClient, UpstreamError
+
+
+class Upstream:
+    """Mock transport that answers with the next queued outcome"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        outcome = self.outcomes.pop(0) if len(self.outcomes) > 1 else self.outcomes[0]
+        if isinstance(outcome, asyncio.Event):
+            await outcome.wait()
+            return httpx.Response(200, json={"ok": True})
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def timeout():
+    return httpx.ReadTimeout("timed out")
+
+
+def ok():
+    return httpx.Response(200, json={"ok": True})
+
+
+def client(upstream: Upstream, breaker: CircuitBreaker, retries: int = 2) -> UpstreamClient:
+    return UpstreamClient("http://upstream.test", retries=retries, backoff=0, breaker=breaker,
+                          transport=httpx.MockTransport(upstream))
+
+
+def expire(breaker: CircuitBreaker) -> None:
+    """Move the breaker past its reset timeout"""
+    breaker.opened_at -= breaker.reset_timeout
+
+
+def test_timeouts_are_retried():
+    upstream = Upstream(timeout(), timeout(), ok())
+    breaker = CircuitBreaker(failure_threshold=2)
+
+    assert asyncio.run(client(upstream, breaker).get_json("/search")) == {"ok": True}
+    assert upstream.calls == 3
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_breaker_opens_after_consecutive_failures():
+    upstream = Upstream(timeout())
+    breaker = CircuitBreaker(failure_threshold=2)
+    http = client(upstream, breaker, retries=1)
+
+    async def calls():
+        for _ in range(2):
+            with pytest.raises(UpstreamError, match="timed out"):
+                await http.get_json("/search")
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            await http.get_json("/search")
+
+    asyncio.run(calls())
+    # Two attempts for each of the first two calls, none once open
+    assert upstream.calls == 4
+
+
+def test_half_open_probe_closes_the_breaker():
+    upstream = Upstream(timeout(), ok())
+    breaker = CircuitBreaker(failure_threshold=1)
+    http = client(upstream, breaker, retries=0)
+
+    async def calls():
+        with pytest.raises(UpstreamError):
+            await http.get_json("/search")
+        expire(breaker)
+        assert breaker.state == "half-open"
+        assert await http.get_json("/search") == {"ok": True}
+
+    asyncio.run(calls())
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_the_breaker():
+    upstream = Upstream(timeout())
+    breaker = CircuitBreaker(failure_threshold=1)
+    http = client(upstream, breaker, retries=0)
+
+    async def calls():
+        with pytest.raises(UpstreamError):
+            await http.get_json("/search")
+        expire(breaker)
+        with pytest.raises(UpstreamError, match="timed out"):
+            await http.get_json("/search")
+        with pytest.raises(CircuitOpenError):
+            await http.get_json("/search")
+
+    asyncio.run(calls())
+    assert breaker.state == "open"
+    assert upstream.calls == 2
+
+
+def test_half_open_lets_one_probe_through():
+    release = asyncio.Event()
+    upstream = Upstream(timeout(), release)
+    breaker = CircuitBreaker(failure_threshold=1)
+    http = client(upstream, breaker, retries=0)
+
+    async def calls():
+        with pytest.raises(UpstreamError):
+            await http.get_json("/search")
+        expire(breaker)
+        probe = asyncio.create_task(http.get_json("/search"))
+        await asyncio.sleep(0)
+        with pytest.raises(CircuitOpenError):
+            await http.get_json("/search")
+        release.set()
+        assert await probe == {"ok": True}
+
+    asyncio.run(calls())
+    assert breaker.state == "closed"
+
+
+def test_cancelled_probe_is_released():
+    upstream = Upstream(timeout(), asyncio.Event(), ok())
+    breaker = CircuitBreaker(failure_threshold=1)
+    http = client(upstream, breaker, retries=0)
+
+    async def calls():
+        with pytest.raises(UpstreamError):
+            await http.get_json("/search")
+        expire(breaker)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(http.get_json("/search"), 0.01)
+        assert await http.get_json("/search") == {"ok": True}
+
+    asyncio.run(calls())
+    assert breaker.state == "closed"
+
+
+def test_invalid_json_is_an_upstream_error():
+    upstream = Upstream(httpx.Response(200, text="<html>"))
+    breaker = CircuitBreaker(failure_threshold=1)
+    http = client(upstream, breaker)
+
+    async def calls():
+        with pytest.raises(UpstreamError, match="Invalid JSON"):
+            await http.get_json("/search")
+        expire(breaker)
+        # The probe that failed to decode did not leave the breaker stuck
+        with pytest.raises(UpstreamError, match="Invalid JSON"):
+            await http.get_json("/search")
+
+    asyncio.run(calls())
+    assert upstream.calls == 2
+
+
+def test_client_errors_are_not_retried():
+    upstream = Upstream(httpx.Response(404, text="not found"))
+    breaker = CircuitBreaker(failure_threshold=1)
+
+    with pytest.raises(UpstreamError, match="404"):
+        asyncio.run(client(upstream, breaker).get_json("/missing"))
+    assert upstream.calls == 1
+    assert breaker.state == "closed"
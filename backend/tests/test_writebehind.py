@@ -0,0 +1,228 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from storage import SqlitePracticePlanRepository
+from writebehind import DEAD_LETTER_FILE, SaveLog, SaveQueueFull, WriteBehindRepository, read_records
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def plan(i, **fields):
+    return {"title": f"Plan {i}", "sport": "soccer", "duration": 60, "focus_areas": "passing",
+            "selected_drills": [], "generated_plan": f"# Plan {i}\n", **fields}
+
+
+def stored_ids(db):
+    with sqlite3.connect(db) as conn:
+        return [row[0] for row in conn.execute("SELECT id FROM practice_plans")]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "plans.sqlite3"), str(tmp_path / "save-log")
+
+
+def write_behind(paths, repository=None, **options) -> WriteBehindRepository:
+    db, directory = paths
+    options.setdefault("flush_interval", 0.01)
+    return WriteBehindRepository(repository or SqlitePracticePlanRepository(db), directory, **options)
+
+
+# Saves queued by a worker that is then killed before writing them
+CRASHING_WORKER = """
+import json, os, sys
+sys.path.insert(0, {backend!r})
+from storage import SqlitePracticePlanRepository
+from writebehind import WriteBehindRepository
+
+repository = WriteBehindRepository(SqlitePracticePlanRepository({db!r}), {directory!r},
+                                   batch_size=1000, flush_interval=3600)
+ids = [repository.save("coach", {{"title": f"Plan {{i}}", "sport": "soccer", "duration": 60,
+                                  "generated_plan": f"# Plan {{i}}"}})["id"] for i in range({count})]
+print(json.dumps({{"pid": os.getpid(), "ids": ids}}), flush=True)
+os._exit(0)
+"""
+
+
+def crash_worker(paths, count):
+    db, directory = paths
+    script = CRASHING_WORKER.format(backend=BACKEND, db=db, directory=directory, count=count)
+    result = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+
+def test_saves_of_a_killed_worker_are_adopted_and_written_once(paths):
+    db, directory = paths
+    worker = crash_worker(paths, 20)
+    orphan = os.path.join(directory, f"saves-{worker['pid']}.log")
+    assert stored_ids(db) == []
+    with open(orphan, "rb") as f:
+        log = f.read()
+
+    repository = write_behind(paths)
+    repository.start()
+    assert repository.replayed == 20
+    assert not os.path.exists(orphan)
+    assert repository.flush(5)
+    assert sorted(stored_ids(db)) == sorted(worker["ids"])
+    repository.close()
+
+    # The same log again, as if the crash came after the batch was written,
+    # with a torn last line from a write that was never acknowledged
+    with open(os.path.join(directory, "saves-1.log"), "wb") as f:
+        f.write(log + b'{"row": {"id": "torn')
+    repository = write_behind(paths)
+    repository.start()
+    assert repository.replayed == 20
+    assert repository.flush(5)
+    assert sorted(stored_ids(db)) == sorted(worker["ids"])
+    repository.close()
+
+
+def test_logs_held_by_a_live_worker_are_left_alone(paths):
+    db, directory = paths
+    os.makedirs(directory)
+    live = SaveLog(os.path.join(directory, "saves-424242.log"))
+    live.append([{"row": {"id": "x"}, "body": "x"}])
+
+    repository = write_behind(paths)
+    repository.start()
+    assert repository.replayed == 0
+    assert read_records(live.path) == [{"row": {"id": "x"}, "body": "x"}]
+    repository.close()
+    live.close()
+
+
+def test_concurrent_saves_share_an_fsync(tmp_path):
+    log = SaveLog(str(tmp_path / "saves-1.log"))
+    sequences = [log.enqueue({"n": n}) for n in range(3)]
+
+    log.sync(sequences[-1])
+    log.sync(sequences[0])
+    assert log.syncs == 1
+    assert read_records(log.path) == [{"n": 0}, {"n": 1}, {"n": 2}]
+    log.close()
+
+
+class Refusing(SqlitePracticePlanRepository):
+    """Refuses plans titled "poison"; fails transiently the first `flaky` times"""
+
+    def __init__(self, path, flaky=0):
+        super().__init__(path)
+        self.flaky = flaky
+
+    def save_many(self, rows):
+        if self.flaky:
+            self.flaky -= 1
+            raise sqlite3.OperationalError("database is locked")
+        if any(row["title"] == "poison" for row, _ in rows):
+            raise sqlite3.IntegrityError("CHECK constraint failed")
+        super().save_many(rows)
+
+
+def test_rows_that_keep_failing_are_dead_lettered(paths):
+    db, directory = paths
+    repository = write_behind(paths, Refusing(db), batch_size=10)
+    saved = [repository.save("coach", plan(i)) for i in range(2)]
+    poison = repository.save("coach", plan(2, title="poison"))
+    saved.append(repository.save("coach", plan(3)))
+
+    assert repository.flush(5)
+    assert sorted(stored_ids(db)) == sorted(plan["id"] for plan in saved)
+    with open(os.path.join(directory, DEAD_LETTER_FILE)) as f:
+        dead = [json.loads(line) for line in f]
+    assert [record["row"]["id"] for record in dead] == [poison["id"]]
+    assert "CHECK constraint failed" in dead[0]["error"]
+    stats = repository.stats()
+    assert (stats["dead_lettered"], stats["depth"], stats["log_bytes"]) == (1, 0, 0)
+    repository.close()
+
+
+def test_transient_errors_are_retried(paths):
+    db, _ = paths
+    repository = write_behind(paths, Refusing(db, flaky=2))
+    saved = repository.save("coach", plan(0))
+
+    assert repository.flush(5)
+    assert stored_ids(db) == [saved["id"]]
+    assert repository.stats()["errors"] == 2
+    assert repository.stats()["dead_lettered"] == 0
+    repository.close()
+
+
+class Gated(SqlitePracticePlanRepository):
+    """Writes wait until the gate opens"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.gate = threading.Event()
+
+    def save_many(self, rows):
+        self.gate.wait(5)
+        super().save_many(rows)
+
+
+def test_saves_wait_for_room_then_fail(paths):
+    db, _ = paths
+    gated = Gated(db)
+    repository = write_behind(paths, gated, batch_size=1, max_pending=2, block_timeout=0.05)
+    repository.save("coach", plan(0))
+    repository.save("coach", plan(1))
+
+    with pytest.raises(SaveQueueFull):
+        repository.save("coach", plan(2))
+    assert repository.stats()["rejected"] == 1
+
+    gated.gate.set()
+    repository.save("coach", plan(3))
+    assert repository.flush(5)
+    assert len(stored_ids(db)) == 3
+    repository.close()
+
+
+def test_listing_pages_through_pending_and_written_plans(paths, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import main
+
+    db, _ = paths
+    repository = write_behind(paths, batch_size=1000, flush_interval=3600)
+    # Alternately written straight to the database and left queued, so
+    # every page has to merge the two
+    written, pending = [], []
+    for i in range(12):
+        if i % 2:
+            written.append(repository.repository.save("mock-user-id", plan(i)))
+        else:
+            pending.append(repository.save("mock-user-id", plan(i)))
+    repository.save("someone-else", plan(12))
+    assert repository.stats()["depth"] == 7
+    monkeypatch.setattr(main, "plan_repository", repository)
+
+    client = TestClient(main.app)
+    headers = {"Authorization": "Bearer test"}
+    pages, cursor = [], None
+    while True:
+        response = client.get("/api/practice-plans", params={"limit": 3, **({"cursor": cursor} if cursor else {})},
+                              headers=headers)
+        assert response.status_code == 200
+        pages.append([plan["id"] for plan in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    listed = [plan_id for page in pages for plan_id in page]
+    assert [len(page) for page in pages] == [3, 3, 3, 3]
+    assert sorted(listed) == sorted(plan["id"] for plan in written + pending)
+    expected = sorted(written + pending, key=lambda plan: (plan["created_at"], plan["id"]), reverse=True)
+    assert listed == [plan["id"] for plan in expected]
+
+    response = client.get(f"/api/practice-plans/{pending[0]['id']}", headers=headers)
+    assert response.json()["generated_plan"] == "# Plan 0\n"
+    repository.close()
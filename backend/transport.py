@@ -0,0 +1,222 @@
+from typing import Callable, Dict, Optional
+import hashlib
+import json
+import zlib
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Response transport
+#
+# Responses are compressed with the best content coding the client accepts
+# (zstd, then br, then gzip; zstd and br when their packages are
+# installed). Whole bodies are compressed in one call; streamed bodies
+# (SSE, NDJSON, markdown) are compressed chunk by chunk with a flush after
+# each, so clients still see every chunk as soon as it is produced.
+#
+# Complete GET responses carry a weak ETag of their uncompressed body, and
+# a request whose If-None-Match lists it gets an empty 304 instead.
+#
+# JSON is encoded with orjson when it is installed.
+
+COMPRESSIBLE_TYPES = (
+    "application/json", "application/x-ndjson", "application/vnd.headcoach.plan+json", "text/",
+)
+# Server preference between codings the client accepts equally
+CODING_PREFERENCE = tuple(
+    coding for coding, available in (("zstd", zstandard), ("br", brotli), ("gzip", True)) if available)
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as JSON_RESPONSE_CLASS
+
+    def json_dumps(value) -> str:
+        return orjson.dumps(value).decode()
+else:
+    JSON_RESPONSE_CLASS = JSONResponse
+
+    def json_dumps(value) -> str:
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """The preferred available coding in an Accept-Encoding header, or None for identity"""
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().lower().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.strip()] = quality
+    wildcard = qualities.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for coding in CODING_PREFERENCE:
+        quality = qualities.get(coding, wildcard)
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+class StreamCompressor:
+    """Incremental compressor whose output can be flushed after every chunk"""
+
+    def __init__(self, coding: str, level: Optional[int] = None):
+        if coding == "gzip":
+            compressor = zlib.compressobj(6 if level is None else level, zlib.DEFLATED, 31)
+            self._compress = compressor.compress
+            self._flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = compressor.flush
+        elif coding == "br":
+            compressor = brotli.Compressor(quality=5 if level is None else level)
+            self._compress = compressor.process
+            self._flush = compressor.flush
+            self._finish = compressor.finish
+        elif coding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+            self._compress = compressor.compress
+            self._flush = lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            self._finish = compressor.flush
+        else:
+            raise ValueError(f"Unsupported content coding: {coding}")
+
+    def chunk(self, data: bytes) -> bytes:
+        return self._compress(data) + self._flush()
+
+    def finish(self, data: bytes = b"") -> bytes:
+        return self._compress(data) + self._finish()
+
+
+def compress(coding: str, body: bytes) -> bytes:
+    return StreamCompressor(coding).finish(body)
+
+
+def body_etag(body: bytes) -> str:
+    # Weak: the same representation may be sent with different codings
+    return 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:]
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+class TransportMiddleware:
+    """Negotiated compression and ETag revalidation for HTTP responses"""
+
+    def __init__(self, app, minimum_size: int = 512):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        coding = negotiate_encoding(headers.get("accept-encoding", ""))
+        conditional = scope["method"] == "GET"
+        if coding is None and not conditional:
+            await self.app(scope, receive, send)
+            return
+        responder = _Responder(send, coding, conditional, headers.get("if-none-match"), self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class _Responder:
+    def __init__(self, send: Callable, coding: Optional[str], conditional: bool,
+                 if_none_match: Optional[str], minimum_size: int):
+        self._send = send
+        self.coding = coding
+        self.conditional = conditional
+        self.if_none_match = if_none_match
+        self.minimum_size = minimum_size
+        self.start: Optional[dict] = None
+        self.compressor: Optional[StreamCompressor] = None
+        self.passthrough = False
+
+    def _eligible(self, headers: MutableHeaders) -> bool:
+        status = self.start["status"]
+        content_type = headers.get("content-type", "")
+        return (200 <= status < 300 and status != 204 and "content-encoding" not in headers
+                and content_type.startswith(COMPRESSIBLE_TYPES))
+
+    async def send(self, message: dict) -> None:
+        if self.passthrough:
+            await self._send(message)
+            return
+        if message["type"] == "http.response.start":
+            # Held until the first body chunk shows whether the body is complete
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        if self.compressor is not None:
+            if message.get("more_body", False):
+                await self._send({"type": "http.response.body", "body": self.compressor.chunk(body), "more_body": True})
+            else:
+                await self._send({"type": "http.response.body", "body": self.compressor.finish(body)})
+            return
+
+        headers = MutableHeaders(raw=self.start["headers"])
+
+        if not message.get("more_body", False):
+            await self._send_complete(headers, body)
+            return
+
+        # Streamed body: compress chunk by chunk, no ETag
+        if self.coding is not None and self._eligible(headers):
+            self.compressor = StreamCompressor(self.coding)
+            headers["Content-Encoding"] = self.coding
+            headers.add_vary_header("Accept-Encoding")
+            del headers["Content-Length"]
+            await self._send(self.start)
+            await self._send({"type": "http.response.body", "body": self.compressor.chunk(body), "more_body": True})
+        else:
+            self.passthrough = True
+            await self._send(self.start)
+            await self._send(message)
+
+    async def _send_complete(self, headers: MutableHeaders, body: bytes) -> None:
+        start = self.start
+        compressible = self._eligible(headers)
+        if compressible and self.coding is not None:
+            headers.add_vary_header("Accept-Encoding")
+        if self.conditional and start["status"] == 200 and "etag" not in headers:
+            etag = body_etag(body)
+            headers["ETag"] = etag
+            if self.if_none_match and etag_matches(self.if_none_match, etag):
+                for name in ("content-length", "content-type"):
+                    if name in headers:
+                        del headers[name]
+                start["status"] = 304
+                await self._send(start)
+                await self._send({"type": "http.response.body", "body": b""})
+                return
+        if compressible and self.coding is not None and len(body) >= self.minimum_size:
+            body = compress(self.coding, body)
+            headers["Content-Encoding"] = self.coding
+            headers["Content-Length"] = str(len(body))
+        await self._send(start)
+        await self._send({"type": "http.response.body", "body": body})
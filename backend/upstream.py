@@ -0,0 +1,292 @@
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import urlsplit
+import asyncio
+import json
+import random
+import time
+
+import httpx
+
+from metrics import UPSTREAM_SECONDS
+
+# Outbound API clients
+#
+# One pooled httpx.AsyncClient per upstream service, so handlers never
+# block the event loop and connections are kept alive between requests.
+# Every call is bounded by a per-host concurrency limit and a timeout, is
+# retried with jittered exponential backoff, and goes through a circuit
+# breaker so a failing upstream is skipped quickly and callers can fall
+# back to the local drill catalog. Streamed responses are retried only
+# until their body starts.
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """An upstream call failed after all retries"""
+
+
+class CircuitOpenError(UpstreamError):
+    """The upstream is failing and calls are being short-circuited"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets one probe call through
+    once reset_timeout has passed"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def end_probe(self) -> None:
+        """Let another call probe, e.g. after the probe was cancelled"""
+        self._probing = False
+
+
+class UpstreamClient:
+    """Pooled async HTTP client for a single upstream service"""
+
+    def __init__(
+        self,
+        base_url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 10.0,
+        max_connections: int = 20,
+        max_per_host: int = 8,
+        retries: int = 2,
+        backoff: float = 0.25,
+        breaker: Optional[CircuitBreaker] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.base_url = base_url
+        self.retries = retries
+        self.backoff = backoff
+        self.max_per_host = max_per_host
+        self.breaker = breaker or CircuitBreaker()
+        self._host_limits: Dict[str, asyncio.Semaphore] = {}
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 3.0)),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60.0,
+            ),
+            transport=transport,
+        )
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc or urlsplit(self.base_url).netloc
+        limit = self._host_limits.get(host)
+        if limit is None:
+            limit = self._host_limits[host] = asyncio.Semaphore(self.max_per_host)
+        return limit
+
+    def _delay(self, attempt: int) -> float:
+        # Full jitter keeps retries from many workers from synchronizing
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    async def post_json(self, url: str, payload: dict, headers: Optional[Dict[str, str]] = None) -> dict:
+        return await self._request_json("POST", url, payload, headers)
+
+    async def get_json(self, url: str, headers: Optional[Dict[str, str]] = None) -> dict:
+        return await self._request_json("GET", url, None, headers)
+
+    async def _request_json(self, method: str, url: str, payload: Optional[dict],
+                            headers: Optional[Dict[str, str]]) -> dict:
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {self.base_url}")
+        probe = self.breaker.state == "half-open"
+        try:
+            return await self._attempts(method, url, payload, headers)
+        finally:
+            # A probe that ended without a verdict (cancelled, timed out by
+            # the caller) must not keep every later call short-circuited
+            if probe:
+                self.breaker.end_probe()
+
+    async def _attempts(self, method: str, url: str, payload: Optional[dict],
+                        headers: Optional[Dict[str, str]]) -> dict:
+        host = urlsplit(url).netloc or urlsplit(self.base_url).netloc
+        last_error: Optional[Exception] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                await asyncio.sleep(self._delay(attempt - 1))
+            try:
+                async with self._host_limit(url):
+                    start = time.perf_counter()
+                    response = await self._client.request(method, url, json=payload, headers=headers)
+            except httpx.TransportError as e:
+                UPSTREAM_SECONDS.observe(time.perf_counter() - start, host, "error")
+                last_error = e
+                continue
+            except httpx.HTTPError as e:
+                # Not a connection problem, so retrying will not help
+                UPSTREAM_SECONDS.observe(time.perf_counter() - start, host, "error")
+                self.breaker.record_failure()
+                raise UpstreamError(f"Upstream call to {self.base_url} failed: {e}") from e
+            UPSTREAM_SECONDS.observe(time.perf_counter() - start, host, f"{response.status_code // 100}xx")
+            if response.status_code in RETRY_STATUSES:
+                last_error = UpstreamError(f"{response.status_code} from {response.request.url}")
+                continue
+            if response.is_error:
+                # Client errors will not succeed on retry, but the upstream is healthy
+                self.breaker.record_success()
+                raise UpstreamError(f"{response.status_code} from {response.request.url}: {response.text[:200]}")
+            try:
+                data = response.json()
+            except ValueError as e:
+                self.breaker.record_failure()
+                raise UpstreamError(f"Invalid JSON from {response.request.url}: {e}") from e
+            self.breaker.record_success()
+            return data
+
+        self.breaker.record_failure()
+        raise UpstreamError(f"Upstream call to {self.base_url} failed: {last_error}") from last_error
+
+    async def stream_lines(self, url: str, payload: dict,
+                           headers: Optional[Dict[str, str]] = None) -> AsyncIterator[str]:
+        """POST payload and yield the response body line by line"""
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {self.base_url}")
+        probe = self.breaker.state == "half-open"
+        host = urlsplit(url).netloc or urlsplit(self.base_url).netloc
+        last_error: Optional[Exception] = None
+        started = False
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    await asyncio.sleep(self._delay(attempt - 1))
+                start = time.perf_counter()
+                try:
+                    async with self._host_limit(url), \
+                            self._client.stream("POST", url, json=payload, headers=headers) as response:
+                        UPSTREAM_SECONDS.observe(time.perf_counter() - start, host,
+                                                 f"{response.status_code // 100}xx")
+                        if response.status_code in RETRY_STATUSES:
+                            last_error = UpstreamError(f"{response.status_code} from {response.request.url}")
+                            continue
+                        if response.is_error:
+                            await response.aread()
+                            self.breaker.record_success()
+                            raise UpstreamError(
+                                f"{response.status_code} from {response.request.url}: {response.text[:200]}")
+                        async for line in response.aiter_lines():
+                            started = True
+                            yield line
+                        self.breaker.record_success()
+                        return
+                except httpx.TransportError as e:
+                    if not started:
+                        UPSTREAM_SECONDS.observe(time.perf_counter() - start, host, "error")
+                        last_error = e
+                        continue
+                    # Lines already yielded cannot be taken back, so no retry
+                    self.breaker.record_failure()
+                    raise UpstreamError(f"Upstream stream from {self.base_url} broke off: {e}") from e
+                except httpx.HTTPError as e:
+                    self.breaker.record_failure()
+                    raise UpstreamError(f"Upstream call to {self.base_url} failed: {e}") from e
+            self.breaker.record_failure()
+            raise UpstreamError(f"Upstream call to {self.base_url} failed: {last_error}") from last_error
+        finally:
+            if probe:
+                self.breaker.end_probe()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+class TavilyClient:
+    """Drill search through the Tavily search API"""
+
+    def __init__(self, api_key: str, base_url: str = "https://api.tavily.com", **options):
+        self.api_key = api_key
+        self.http = UpstreamClient(base_url, **options)
+
+    async def search_drills(self, sport: str, focus: str, age_group: str = "", skill_level: str = "",
+                            max_results: int = 6) -> List[dict]:
+        query = f"{sport} drills {focus} {age_group} {skill_level} youth coaching practice exercises"
+        data = await self.http.post_json("/search", {
+            "api_key": self.api_key,
+            "query": " ".join(query.split()),
+            "search_depth": "basic",
+            "include_answer": False,
+            "include_images": False,
+            "max_results": max_results,
+        })
+        drills = []
+        for result in data.get("results") or []:
+            url = result.get("url")
+            drills.append({
+                "title": result.get("title") or "Untitled drill",
+                "description": (result.get("content") or "")[:300],
+                "source": urlsplit(url).netloc if url else "tavily",
+                "url": url,
+            })
+        return drills[:max_results]
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
+
+
+class OpenAIClient:
+    """Chat completions through the OpenAI API"""
+
+    def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1", **options):
+        options.setdefault("timeout", 60.0)
+        self.http = UpstreamClient(base_url, headers={"Authorization": f"Bearer {api_key}"}, **options)
+
+    async def chat(self, messages: List[dict], model: str = "gpt-4o", **params) -> dict:
+        return await self.http.post_json("/chat/completions", {"model": model, "messages": messages, **params})
+
+    async def chat_stream(self, messages: List[dict], model: str = "gpt-4o", **params) -> AsyncIterator[dict]:
+        """Completion chunks as the model writes them; the last one carries the usage"""
+        payload = {"model": model, "messages": messages, "stream": True,
+                   "stream_options": {"include_usage": True}, **params}
+        async for line in self.http.stream_lines("/chat/completions", payload):
+            # Server-Sent Events: "data: <chunk>" lines, ended by "data: [DONE]"
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                return
+            try:
+                yield json.loads(data)
+            except ValueError as e:
+                raise UpstreamError(f"Invalid stream chunk from {model}: {e}") from e
+
+    async def aclose(self) -> None:
+        await self.http.aclose()
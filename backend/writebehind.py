@@ -0,0 +1,451 @@
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+import fcntl
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import SAVE_BATCH_SIZE, SAVE_FLUSH_SECONDS
+from storage import (
+    SUMMARY_COLUMNS, PracticePlanRepository, decode_cursor, decode_row, encode_cursor, plan_row, utc_now,
+)
+
+# Write-behind saves
+#
+# With SAVE_MODE=write-behind, a save is acknowledged once it is appended to a
+# local log and fsynced, and a background thread writes queued saves to
+# the repository in batches: one transaction per batch_size saves, or
+# whatever is queued after flush_interval seconds. Concurrent saves share
+# one fsync (group commit). Once everything queued has been written, the
+# log is truncated.
+#
+# Plan ids and timestamps are assigned when a save is queued and the
+# repository skips ids it already has, so replaying a log is idempotent.
+# Each process appends to its own log, opened on first use, and holds an
+# exclusive lock on it; when it opens its log, a process adopts the saves
+# in any log nobody holds (left by a process that died) and deletes it,
+# holding the orphan's lock throughout so only one process adopts it.
+#
+# A batch the repository refuses is written one save at a time, and saves
+# it still refuses are moved to dead-letter.log with the error instead of
+# blocking the queue. Saves are validated before they are acknowledged,
+# so this should only happen for errors validation cannot foresee.
+#
+# Reads see queued saves: get and list_for_user merge them with the
+# repository's rows. When more than max_pending saves are queued, a save
+# waits up to block_timeout for room and then fails with SaveQueueFull.
+
+
+# Saves the repository refuses (as opposed to failing to reach it)
+DEAD_LETTER_FILE = "dead-letter.log"
+# Errors worth retrying the same write for
+TRANSIENT_ERRORS = (sqlite3.OperationalError, OSError)
+
+
+class SaveQueueFull(Exception):
+    pass
+
+
+class SaveLog:
+    """Append-only log file; append returns once the record is on disk"""
+
+    def __init__(self, path: str):
+        self.path = path
+        while True:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+            # Only a process adopting a log left under our pid holds this lock
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                if os.stat(path).st_ino == os.fstat(self._fd).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            # It adopted and deleted the file we opened; start a new one
+            os.close(self._fd)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._buffer: List[bytes] = []
+        self._appended = 0
+        self._synced = 0
+        self.syncs = 0
+
+    def records(self) -> List[dict]:
+        """Records already in the file, e.g. from a previous run"""
+        return read_records(self.path)
+
+    def enqueue(self, record: dict) -> int:
+        """Buffer a record; pass the returned sequence number to sync"""
+        line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+        with self._lock:
+            self._buffer.append(line)
+            self._appended += 1
+            return self._appended
+
+    def sync(self, sequence: int) -> None:
+        # Whoever holds the sync lock writes everything buffered so far, so
+        # saves arriving during an fsync are covered by the next one
+        with self._sync_lock:
+            if self._synced >= sequence:
+                return
+            with self._lock:
+                data = b"".join(self._buffer)
+                self._buffer.clear()
+                upto = self._appended
+            os.write(self._fd, data)
+            os.fsync(self._fd)
+            self.syncs += 1
+            self._synced = upto
+
+    def append(self, records: Sequence[dict]) -> None:
+        sequence = 0
+        for record in records:
+            sequence = self.enqueue(record)
+        self.sync(sequence)
+
+    def truncate(self) -> bool:
+        """Empty the file, unless records are still waiting to be written"""
+        with self._sync_lock, self._lock:
+            if self._buffer:
+                return False
+            os.ftruncate(self._fd, 0)
+            return True
+
+    def size(self) -> int:
+        return os.fstat(self._fd).st_size
+
+    def close(self) -> None:
+        with self._sync_lock:
+            os.close(self._fd)
+
+
+def read_records(path: str) -> List[dict]:
+    with open(path, "rb") as f:
+        return parse_records(f)
+
+
+def parse_records(f) -> List[dict]:
+    records = []
+    for line in f:
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            # A torn last line from a crash mid-write; it was never acknowledged
+            continue
+    return records
+
+
+def adopt_orphans(directory: str, log: SaveLog) -> List[dict]:
+    """Move the records of logs no live process holds into log
+
+    Each orphan stays locked until its records are on disk in log and it
+    is deleted, so processes starting together never adopt the same one.
+    """
+    adopted = []
+    for path in sorted(glob.glob(os.path.join(directory, "saves-*.log"))):
+        if os.path.abspath(path) == os.path.abspath(log.path):
+            continue
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            # Already adopted
+            continue
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # In use, or being adopted
+                continue
+            if os.fstat(fd).st_nlink == 0:
+                # Adopted and deleted between our glob and our lock
+                continue
+            with os.fdopen(os.dup(fd), "rb") as f:
+                records = parse_records(f)
+            log.append(records)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            adopted += records
+        finally:
+            os.close(fd)
+    return adopted
+
+
+class WriteBehindRepository(PracticePlanRepository):
+    """Repository whose saves are logged locally and written in batches"""
+
+    def __init__(self, repository: PracticePlanRepository, directory: str, batch_size: int = 100,
+                 flush_interval: float = 0.1, max_pending: int = 10000, block_timeout: float = 2.0):
+        self.repository = repository
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.block_timeout = block_timeout
+        self.directory = directory
+        self.log: Optional[SaveLog] = None
+        # id -> (row, body, monotonic time queued), oldest first
+        self._pending: "OrderedDict[str, Tuple[dict, str, float]]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.saved = 0
+        self.flushed = 0
+        self.batches = 0
+        self.rejected = 0
+        self.errors = 0
+        self.dead_lettered = 0
+        self.replayed = 0
+
+    def start(self) -> None:
+        """Open this process's log, adopt unwritten saves and start writing
+
+        Runs on first use; the log is named after the process, so a
+        forked worker opens its own.
+        """
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self.log = SaveLog(os.path.join(self.directory, f"saves-{os.getpid()}.log"))
+            self._stopping = False
+            self.replayed += self._replay()
+            self._thread = threading.Thread(target=self._run, name="save-flusher", daemon=True)
+            self._thread.start()
+
+    def _replay(self) -> int:
+        records = self.log.records()
+        adopted = adopt_orphans(self.directory, self.log)
+        now = time.monotonic()
+        with self._cond:
+            for record in records + adopted:
+                self._pending.setdefault(record["row"]["id"], (record["row"], record["body"], now))
+            count = len(self._pending)
+        if count:
+            print(f"Replaying {count} queued practice plan saves")
+        return count
+
+    def save(self, user_id: str, plan: dict) -> dict:
+        if self._thread is None:
+            self.start()
+        row = plan_row(user_id, plan)
+        body = plan["generated_plan"]
+        with self._cond:
+            if len(self._pending) >= self.max_pending:
+                if not self._cond.wait_for(lambda: len(self._pending) < self.max_pending, self.block_timeout):
+                    self.rejected += 1
+                    raise SaveQueueFull(f"{len(self._pending)} saves are waiting to be written")
+            # Queued and buffered together, so the log is never truncated
+            # under a save that is not yet written
+            self._pending[row["id"]] = (row, body, time.monotonic())
+            sequence = self.log.enqueue({"row": row, "body": body})
+            self.saved += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+        self.log.sync(sequence)
+        return decode_row(row)
+
+    def save_many(self, rows: Sequence[Tuple[dict, str]]) -> None:
+        self.repository.save_many(rows)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    if len(self._pending) >= self.batch_size:
+                        break
+                    if self._pending:
+                        oldest = next(iter(self._pending.values()))[2]
+                        wait = oldest + self.flush_interval - time.monotonic()
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = None
+                    self._cond.wait(wait)
+                if not self._pending:
+                    return
+                batch = [(row, body) for row, body, _ in list(self._pending.values())[:self.batch_size]]
+            if not self._flush(batch) and self._stopping:
+                # Left in the log for the next start to replay
+                return
+
+    def _flush(self, batch: List[Tuple[dict, str]]) -> bool:
+        """Write a batch; False if it has to be retried"""
+        start = time.perf_counter()
+        try:
+            self.repository.save_many(batch)
+        except TRANSIENT_ERRORS as e:
+            print(f"Error writing queued practice plans, will retry: {e}")
+            SAVE_FLUSH_SECONDS.observe(time.perf_counter() - start, "error")
+            self._back_off()
+            return False
+        except Exception as e:
+            # Retrying the batch would fail forever; find the rows that cause it
+            print(f"Error writing queued practice plans, writing them one by one: {e}")
+            SAVE_FLUSH_SECONDS.observe(time.perf_counter() - start, "error")
+            return self._flush_each(batch)
+        SAVE_FLUSH_SECONDS.observe(time.perf_counter() - start, "ok")
+        SAVE_BATCH_SIZE.observe(len(batch))
+        self._written(batch)
+        return True
+
+    def _flush_each(self, batch: List[Tuple[dict, str]]) -> bool:
+        written: List[Tuple[dict, str]] = []
+        failed: List[Tuple[dict, str, str]] = []
+        complete = True
+        for row, body in batch:
+            try:
+                self.repository.save_many([(row, body)])
+            except TRANSIENT_ERRORS as e:
+                print(f"Error writing queued practice plans, will retry: {e}")
+                complete = False
+                break
+            except Exception as e:
+                failed.append((row, body, f"{type(e).__name__}: {e}"))
+            else:
+                written.append((row, body))
+        if failed:
+            self._dead_letter(failed)
+        self._written(written + [(row, body) for row, body, _ in failed])
+        if not complete:
+            self._back_off()
+        return complete
+
+    def _dead_letter(self, failed: List[Tuple[dict, str, str]]) -> None:
+        """Move saves the repository refuses to a file, out of the queue and the log"""
+        lines = b"".join(
+            json.dumps({"row": row, "body": body, "error": error, "failed_at": utc_now()},
+                       separators=(",", ":")).encode() + b"\n"
+            for row, body, error in failed)
+        fd = os.open(os.path.join(self.directory, DEAD_LETTER_FILE), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            os.write(fd, lines)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        with self._cond:
+            self.dead_lettered += len(failed)
+        for row, _, error in failed:
+            print(f"Practice plan {row['id']} could not be written and was moved to {DEAD_LETTER_FILE}: {error}")
+
+    def _written(self, batch: List[Tuple[dict, str]]) -> None:
+        with self._cond:
+            for row, _ in batch:
+                self._pending.pop(row["id"], None)
+            self.flushed += len(batch)
+            self.batches += 1
+            if not self._pending:
+                self.log.truncate()
+            self._cond.notify_all()
+
+    def _back_off(self) -> None:
+        with self._cond:
+            self.errors += 1
+            self._cond.wait(min(5.0, self.flush_interval * 2 ** min(self.errors, 6)))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every save queued so far is written"""
+        with self._cond:
+            waiting = set(self._pending)
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: not waiting.intersection(self._pending), timeout)
+
+    def _queued(self, user_id: str, plan_id: str) -> Optional[Tuple[dict, str]]:
+        if self._thread is None:
+            self.start()
+        with self._cond:
+            entry = self._pending.get(plan_id)
+        if entry is None or entry[0]["user_id"] != user_id:
+            return None
+        return entry[0], entry[1]
+
+    def get(self, user_id: str, plan_id: str, include_body: bool = True) -> Optional[dict]:
+        queued = self._queued(user_id, plan_id)
+        if queued is None:
+            return self.repository.get(user_id, plan_id, include_body)
+        plan = decode_row(queued[0])
+        if include_body:
+            plan["generated_plan"] = queued[1]
+        return plan
+
+    def get_body(self, hash: str) -> Optional[str]:
+        if self._thread is None:
+            self.start()
+        with self._cond:
+            for row, body, _ in self._pending.values():
+                if row["body_hash"] == hash:
+                    return body
+        return self.repository.get_body(hash)
+
+    def list_for_user(self, user_id: str, limit: int = 10, cursor: Optional[str] = None,
+                      sport: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+        if self._thread is None:
+            self.start()
+        after = decode_cursor(cursor) if cursor else None
+        with self._cond:
+            queued = [row for row, _, _ in self._pending.values()
+                      if row["user_id"] == user_id and (not sport or row["sport"] == sport)
+                      and (after is None or (row["created_at"], row["id"]) < after)]
+        plans, next_cursor = self.repository.list_for_user(user_id, limit, cursor, sport)
+        if not queued:
+            return plans, next_cursor
+        # A save can be in both while its batch is being written
+        stored = {plan["id"] for plan in plans}
+        merged = plans + [decode_row({column: row[column] for column in SUMMARY_COLUMNS})
+                          for row in queued if row["id"] not in stored]
+        merged.sort(key=lambda plan: (plan["created_at"], plan["id"]), reverse=True)
+        page = merged[:limit]
+        if next_cursor or len(merged) > limit:
+            next_cursor = encode_cursor(page[-1]["created_at"], page[-1]["id"])
+        return page, next_cursor
+
+    def stats(self) -> dict:
+        with self._cond:
+            depth = len(self._pending)
+            oldest = next(iter(self._pending.values()))[2] if self._pending else None
+        return {
+            "depth": depth,
+            "oldest_seconds": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+            "saved": self.saved,
+            "flushed": self.flushed,
+            "batches": self.batches,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "dead_lettered": self.dead_lettered,
+            "replayed": self.replayed,
+            "log_syncs": self.log.syncs if self.log is not None else 0,
+            "log_bytes": self.log.size() if self.log is not None else 0,
+        }
+
+    def close(self) -> None:
+        """Write what is queued, close the log and the repository; both reopen on next use"""
+        with self._start_lock:
+            if self._thread is not None:
+                with self._cond:
+                    self._stopping = True
+                    self._cond.notify_all()
+                self._thread.join()
+                self._thread = None
+                self.log.close()
+                if not self._pending:
+                    os.remove(self.log.path)
+                self.log = None
+        self.repository.close()
+
+
+def create_write_behind(repository: PracticePlanRepository) -> PracticePlanRepository:
+    """Wrap repository when SAVE_MODE is "write-behind", configured by SAVE_LOG_DIR,
+    SAVE_BATCH_SIZE, SAVE_FLUSH_INTERVAL, SAVE_MAX_PENDING and SAVE_BLOCK_TIMEOUT"""
+    if os.getenv("SAVE_MODE", "direct") != "write-behind":
+        return repository
+    return WriteBehindRepository(
+        repository,
+        os.getenv("SAVE_LOG_DIR", "save-log"),
+        batch_size=int(os.getenv("SAVE_BATCH_SIZE", "100")),
+        flush_interval=float(os.getenv("SAVE_FLUSH_INTERVAL", "0.1")),
+        max_pending=int(os.getenv("SAVE_MAX_PENDING", "10000")),
+        block_timeout=float(os.getenv("SAVE_BLOCK_TIMEOUT", "2")),
+    )